@@ -1,6 +1,7 @@
 from flask import Blueprint
 from .health import health_bp
 from .prompts import prompt_blueprint
+from .executions import execution_blueprint
 from .cache_example import cache_bp
 from .pubsub_example import pubsub_bp
 from .rate_limit_example import rate_limit_bp
@@ -20,6 +21,9 @@ def register_blueprints(app):
     
     # Register the prompts blueprint
     app.register_blueprint(prompt_blueprint)
+
+    # Register the executions blueprint
+    app.register_blueprint(execution_blueprint)
     
     # Register Redis example blueprints
     app.register_blueprint(cache_bp)
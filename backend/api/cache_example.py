@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 import time
-from ..utils.redis_client import cache, invalidate_cache, RedisPubSub
+from ..utils.redis_client import cache_response, invalidate_tags
+from .pubsub_example import event_bus
 from ..utils.logging import get_contextual_logger
 
 # Create blueprint
@@ -8,7 +9,7 @@ cache_bp = Blueprint('cache', __name__)
 logger = get_contextual_logger()
 
 @cache_bp.route('/api/cached-data', methods=['GET'])
-@cache(ttl=60)  # Cache results for 60 seconds
+@cache_response(ttl=60, query_args=['user_id'], per_user=False, tags=['cached_data', 'cached_data:{user_id}'])  # Cache each user_id's response for 60 seconds
 def get_cached_data():
     """
     Example endpoint demonstrating Redis caching
@@ -50,18 +51,17 @@ def invalidate_example_cache():
     
     if user_id:
         # Invalidate cache for specific user
-        pattern = f"cache:get_cached_data:*{user_id}*"
-        invalidate_cache(pattern)
+        invalidate_tags(f"cached_data:{user_id}")
         logger.info(f"Invalidated cache for user_id={user_id}")
         message = f"Cache invalidated for user {user_id}"
     else:
         # Invalidate all cached data
-        invalidate_cache("cache:get_cached_data:*")
+        invalidate_tags("cached_data")
         logger.info("Invalidated all cached data")
         message = "All cache entries invalidated"
     
     # Publish event to Redis
-    RedisPubSub.publish('cache_events', {
+    event_bus.publish('cache_events', {
         'action': 'invalidate',
         'user_id': user_id,
         'timestamp': time.time()
@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 from backend.models import Execution, Prompt, User
 from backend.models.base import get_db
 from sqlalchemy.exc import SQLAlchemyError
+import json
 import traceback
 from datetime import datetime
-from backend.api.auth import get_current_user_id
+from backend.api.prompts import current_user_id
+from backend.services.execution_events import EXECUTION_SAVED, execution_event, execution_events
+from backend.services.tokenizer import tokenizer
+from backend.utils.auth import authenticate
 
 execution_blueprint = Blueprint('executions', __name__, url_prefix='/api/executions')
 
@@ -15,11 +19,11 @@ def create_execution():
     """
     try:
         data = request.get_json()
-        db = get_db()
+        db = next(get_db())
 
         # Try to get current user or use the provided user_id
         try:
-            user_id = get_current_user_id() or data.get('user_id')
+            user_id = current_user_id() or data.get('user_id')
         except:
             user_id = data.get('user_id')
         
@@ -35,15 +39,27 @@ def create_execution():
         if not prompt:
             return jsonify({'error': f'Prompt with ID {prompt_id} not found'}), 404
 
+        # Fill in token counts and cost the client didn't report
+        model_id = f"{data.get('provider')}:{data.get('model')}"
+        input_tokens = data.get('input_tokens')
+        if input_tokens is None:
+            input_tokens = tokenizer.count_messages(model_id, prompt.prompt_text)
+        output_tokens = data.get('output_tokens')
+        if output_tokens is None and data.get('response_text') is not None:
+            output_tokens = tokenizer.count(model_id, data['response_text'])
+        cost = data.get('cost')
+        if cost is None and output_tokens is not None:
+            cost = tokenizer.cost(model_id, input_tokens, output_tokens)
+
         # Create new execution
         execution = Execution(
             prompt_id=prompt_id,
             user_id=user_id,
             model=data.get('model'),
             provider=data.get('provider'),
-            input_tokens=data.get('input_tokens'),
-            output_tokens=data.get('output_tokens'),
-            cost=data.get('cost'),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=cost,
             response_text=data.get('response_text'),
             is_successful=data.get('is_successful', True),
             error_message=data.get('error_message'),
@@ -55,7 +71,7 @@ def create_execution():
         db.commit()
         db.refresh(execution)
         
-        return jsonify({
+        result = {
             'id': execution.id,
             'prompt_id': execution.prompt_id,
             'user_id': execution.user_id,
@@ -69,7 +85,9 @@ def create_execution():
             'error_message': execution.error_message,
             'execution_time_ms': execution.execution_time_ms,
             'created_at': execution.created_at.isoformat()
-        }), 201
+        }
+        execution_events.publish(execution_event(EXECUTION_SAVED, execution.user_id, execution.prompt_id, execution=result))
+        return jsonify(result), 201
     except SQLAlchemyError as e:
         db.rollback()
         traceback.print_exc()
@@ -84,7 +102,7 @@ def get_execution(execution_id):
     Get a specific execution by ID
     """
     try:
-        db = get_db()
+        db = next(get_db())
         execution = db.query(Execution).filter(Execution.id == execution_id).first()
         
         if not execution:
@@ -115,7 +133,7 @@ def retry_execution(execution_id):
     Retry a failed execution
     """
     try:
-        db = get_db()
+        db = next(get_db())
         execution = db.query(Execution).filter(Execution.id == execution_id).first()
         
         if not execution:
@@ -137,7 +155,7 @@ def retry_execution(execution_id):
         
         # In a real implementation, this would call the LLM service
         # For now, we'll just return the new execution record
-        return jsonify({
+        result = {
             'id': new_execution.id,
             'prompt_id': new_execution.prompt_id,
             'user_id': new_execution.user_id,
@@ -151,7 +169,11 @@ def retry_execution(execution_id):
             'error_message': new_execution.error_message,
             'execution_time_ms': new_execution.execution_time_ms,
             'created_at': new_execution.created_at.isoformat()
-        })
+        }
+        execution_events.publish(
+            execution_event(EXECUTION_SAVED, new_execution.user_id, new_execution.prompt_id, execution=result)
+        )
+        return jsonify(result)
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -162,7 +184,7 @@ def get_executions_by_prompt(prompt_id):
     Get all executions for a specific prompt
     """
     try:
-        db = get_db()
+        db = next(get_db())
         
         # Check that prompt exists
         prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
@@ -192,4 +214,53 @@ def get_executions_by_prompt(prompt_id):
         return jsonify({'executions': result})
     except Exception as e:
         traceback.print_exc()
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@execution_blueprint.route('/stream', methods=['GET'])
+@authenticate
+def stream_executions():
+    """
+    Stream live execution events over SSE
+
+    Pass prompt_id to follow the executions of a prompt you own; otherwise
+    the authenticated user's own executions (runs made with their API key
+    and execution records saved for them) are followed. Events are
+    execution.started, execution.progress (output tokens so far),
+    execution.finished and execution.saved. A lagged event reports events
+    dropped because the client read too slowly; reload the execution list
+    when it arrives.
+    """
+    prompt_id = request.args.get('prompt_id', type=int)
+    user_id = current_user_id()
+    if prompt_id is not None:
+        db = next(get_db())
+        prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+        if not prompt:
+            return jsonify({'error': f'Prompt with ID {prompt_id} not found'}), 404
+        # Prompt streams carry every user's executions of it, responses included
+        if prompt.user_id != user_id:
+            return jsonify({'error': 'Only the prompt owner can follow its executions'}), 403
+
+    subscription = execution_events.subscribe(user_id=user_id, prompt_id=prompt_id)
+    response = Response(
+        _execution_sse_events(subscription, current_app.config.get('SSE_HEARTBEAT_INTERVAL')),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Also covers responses closed before the stream was ever read
+    response.call_on_close(lambda: execution_events.unsubscribe(subscription))
+    return response
+
+def _execution_sse_events(subscription, heartbeat_interval):
+    try:
+        while True:
+            events, dropped = subscription.get(timeout=heartbeat_interval)
+            if dropped:
+                yield f"event: lagged\ndata: {json.dumps({'dropped': dropped})}\n\n"
+            elif not events:
+                # Also lets the server notice clients that went away
+                yield ": heartbeat\n\n"
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        execution_events.unsubscribe(subscription)
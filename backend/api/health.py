@@ -4,10 +4,11 @@ import platform
 import psutil
 import os
 import datetime
-import sqlalchemy
 from sqlalchemy import text
+from ..models.base import get_engine, get_pool_stats
 from ..utils.logging import get_contextual_logger
-from ..utils.redis_client import get_redis_client
+from ..utils.metrics import metrics
+from ..utils.redis_client import get_redis_client, get_redis_pool_stats
 
 # Create Blueprint for health check routes
 health_bp = Blueprint('health', __name__)
@@ -35,7 +36,14 @@ def detailed_health():
             'python_version': platform.python_version(),
             'process_uptime_seconds': time.time() - psutil.Process(os.getpid()).create_time(),
             'memory_usage_percent': psutil.Process(os.getpid()).memory_percent(),
-        }
+        },
+        'database': {
+            'pools': get_pool_stats(),
+        },
+        'redis': {
+            'pools': get_redis_pool_stats(),
+        },
+        'metrics': metrics.snapshot(),
     }
     
     return jsonify(health_data)
@@ -68,8 +76,8 @@ def check_database_connection():
         if not db_url:
             return {'healthy': False, 'error': 'No database URL configured'}
         
-        # Create engine and try a simple query
-        engine = sqlalchemy.create_engine(db_url)
+        # Reuse the shared engine and try a simple query
+        engine = get_engine(db_url)
         with engine.connect() as conn:
             conn.execute(text('SELECT 1'))
         
@@ -1,35 +1,52 @@
-from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask import Blueprint, request, jsonify, Response, current_app, g
 from pydantic import ValidationError, BaseModel, Field
-from backend.models import Prompt, PromptState, User
+from backend.models import Execution, Prompt, PromptState, User
 from backend.models.base import get_db
 from backend.services.llm_service import llm_service, PromptRequest
+from backend.services.resilience import CircuitOpenError
+from backend.services.tokenizer import ContextWindowExceededError
+from backend.utils.auth import authenticate, authenticate_optional
+from backend.utils.event_loop import get_background_loop, run_in_request_loop
+from backend.utils.logging import get_contextual_logger
+from backend.utils.metrics import metrics
+from backend.utils.redis_client import cache, cache_response, invalidate_tags, invalidates
+from backend.utils.rate_limiter import TokenBudgetExceededError
 from sqlalchemy.exc import SQLAlchemyError
-import json
 import asyncio
+import json
+import re
+import time
 from functools import wraps
 import traceback
 from typing import List, Optional
 
 prompt_blueprint = Blueprint('prompts', __name__, url_prefix='/api/prompts')
+logger = get_contextual_logger()
 
 # Helper function to run async functions in Flask routes
 def async_route(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        try:
-            return loop.run_until_complete(f(*args, **kwargs))
+            if current_app.config.get('ASYNC_MODE') == 'per_request':
+                return run_in_request_loop(f(*args, **kwargs))
+            # Run on the shared background loop so LLM calls from concurrent
+            # requests overlap instead of each thread driving its own loop
+            return get_background_loop().run(
+                f(*args, **kwargs),
+                timeout=current_app.config.get('ASYNC_REQUEST_TIMEOUT')
+            )
         except Exception as e:
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
     return wrapper
 
+def current_user_id():
+    """ID of the authenticated user, if the request has one"""
+    user = g.get('user')
+    return user.id if user is not None else None
+
 # Pydantic models for validation
 class PromptCreateModel(BaseModel):
     title: str = Field(..., min_length=3)
@@ -50,6 +67,7 @@ class PromptUpdateModel(BaseModel):
     state: Optional[str] = None
 
 @prompt_blueprint.route('', methods=['GET'])
+@cache_response(namespace='prompt', ttl=300, tags=['prompts'])
 def get_prompts():
     """Get all prompts with optional filtering"""
     db = next(get_db())
@@ -106,16 +124,15 @@ def get_prompts():
         'total': query.count()
     })
 
-@prompt_blueprint.route('/<int:prompt_id>', methods=['GET'])
-def get_prompt(prompt_id):
-    """Get a single prompt by ID"""
+@cache(namespace='prompt', tags=['prompt:{prompt_id}'])
+def load_prompt(prompt_id):
+    """Prompt metadata by ID (None if it doesn't exist), cached in-process and in Redis"""
     db = next(get_db())
     prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    
     if not prompt:
-        return jsonify({'error': f'Prompt with ID {prompt_id} not found'}), 404
+        return None
     
-    result = {
+    return {
         'id': prompt.id,
         'title': prompt.title,
         'description': prompt.description,
@@ -127,10 +144,19 @@ def get_prompt(prompt_id):
         'created_at': prompt.created_at.isoformat() if prompt.created_at else None,
         'updated_at': prompt.updated_at.isoformat() if prompt.updated_at else None
     }
+
+@prompt_blueprint.route('/<int:prompt_id>', methods=['GET'])
+def get_prompt(prompt_id):
+    """Get a single prompt by ID"""
+    result = load_prompt(prompt_id)
+    
+    if result is None:
+        return jsonify({'error': f'Prompt with ID {prompt_id} not found'}), 404
     
     return jsonify(result)
 
 @prompt_blueprint.route('', methods=['POST'])
+@invalidates('prompts')
 def create_prompt():
     """Create a new prompt"""
     data = request.get_json()
@@ -163,6 +189,8 @@ def create_prompt():
         db.add(prompt)
         db.commit()
         db.refresh(prompt)
+        # A lookup of this ID before it existed may have cached a miss
+        invalidate_tags(f"prompt:{prompt.id}")
         result = {
             'id': prompt.id,
             'title': prompt.title,
@@ -181,6 +209,7 @@ def create_prompt():
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @prompt_blueprint.route('/<int:prompt_id>', methods=['PUT'])
+@invalidates('prompt:{prompt_id}', 'prompts')
 def update_prompt(prompt_id):
     """Update an existing prompt"""
     data = request.get_json()
@@ -234,6 +263,7 @@ def update_prompt(prompt_id):
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @prompt_blueprint.route('/<int:prompt_id>', methods=['DELETE'])
+@invalidates('prompt:{prompt_id}', 'prompts')
 def delete_prompt(prompt_id):
     """Delete a prompt"""
     db = next(get_db())
@@ -254,6 +284,7 @@ def delete_prompt(prompt_id):
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @prompt_blueprint.route('/<int:prompt_id>/state', methods=['PATCH'])
+@invalidates('prompt:{prompt_id}', 'prompts')
 def update_prompt_state(prompt_id):
     """Update prompt state only"""
     data = request.get_json()
@@ -292,6 +323,7 @@ def update_prompt_state(prompt_id):
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @prompt_blueprint.route('/<int:prompt_id>/execute', methods=['POST'])
+@authenticate_optional
 @async_route
 async def execute_prompt(prompt_id):
     """Execute a prompt with an LLM and return the result"""
@@ -313,30 +345,45 @@ async def execute_prompt(prompt_id):
             max_tokens=data.get('max_tokens', 1000),
             stream=data.get('stream', False),
             system_prompt=data.get('system_prompt'),
-            tools=data.get('tools')
+            tools=data.get('tools'),
+            cache=data.get('cache'),
+            user_id=current_user_id(),
+            prompt_id=prompt_id,
+            fallback_models=data.get('fallback_models'),
+            allowed_models=prompt.model_whitelist,
+            hedge=data.get('hedge', False),
+            truncate=data.get('truncate', False)
         )
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
-    if prompt_request.stream:
-        return Response(
-            stream_with_context(stream_llm_response(prompt_request)),
-            content_type='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
-            }
-        )
     try:
-        response = await llm_service.execute_prompt(prompt_request)
-        return jsonify({
-            'prompt_id': prompt_id,
-            'model': model,
-            'response': response
-        })
+        llm_service.validate_model_whitelist(prompt_request.fallback_models, 'fallback_models')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        result = await llm_service.execute(prompt_request)
+    except ContextWindowExceededError as e:
+        return jsonify({'error': str(e)}), 400
+    except TokenBudgetExceededError as e:
+        return token_budget_response(e)
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    if prompt_request.stream:
+        response = stream_response(prompt_request, result)
+    else:
+        response = jsonify({
+            'prompt_id': prompt_id,
+            'model': result.model,
+            'response': result.output,
+            'usage': result.usage.to_dict()
+        })
+    response.headers['X-Cache'] = result.cache_status
+    return response
 
 @prompt_blueprint.route('/execute', methods=['POST'])
+@authenticate_optional
 @async_route
 async def execute_arbitrary_prompt():
     """Execute an arbitrary prompt with an LLM and return the result"""
@@ -353,36 +400,302 @@ async def execute_arbitrary_prompt():
             max_tokens=data.get('max_tokens', 1000),
             stream=data.get('stream', False),
             system_prompt=data.get('system_prompt'),
-            tools=data.get('tools')
+            tools=data.get('tools'),
+            cache=data.get('cache'),
+            user_id=current_user_id(),
+            fallback_models=data.get('fallback_models'),
+            hedge=data.get('hedge', False),
+            truncate=data.get('truncate', False)
         )
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
+    try:
+        llm_service.validate_model_whitelist(prompt_request.fallback_models, 'fallback_models')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        result = await llm_service.execute(prompt_request)
+    except ContextWindowExceededError as e:
+        return jsonify({'error': str(e)}), 400
+    except TokenBudgetExceededError as e:
+        return token_budget_response(e)
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     if prompt_request.stream:
+        response = stream_response(prompt_request, result)
+    else:
+        response = jsonify({
+            'model': result.model,
+            'response': result.output,
+            'usage': result.usage.to_dict()
+        })
+    response.headers['X-Cache'] = result.cache_status
+    return response
+
+def circuit_open_response(error):
+    """503 telling the client when the failing model may be tried again"""
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(int(error.retry_after), 1))
+    return response
+
+def token_budget_response(error):
+    """429 telling the client when the exhausted token budget window resets"""
+    response = jsonify({
+        'error': str(error),
+        'scope': error.scope,
+        'window': error.window,
+        'limit': error.limit
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(int(error.retry_after), 1))
+    return response
+
+# {{name}} placeholders substituted from a batch variable set
+VARIABLE_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+def render_prompt(text, variables):
+    """Fill {{name}} placeholders, leaving unknown ones untouched"""
+    if not variables:
+        return text
+    return VARIABLE_PATTERN.sub(
+        lambda match: str(variables.get(match.group(1), match.group(0))),
+        text
+    )
+
+@prompt_blueprint.route('/<int:prompt_id>/execute/batch', methods=['POST'])
+@authenticate
+def execute_prompt_batch(prompt_id):
+    """
+    Execute a prompt against several models and/or variable sets at once
+
+    Every (model, variables) combination runs concurrently, with at most
+    BATCH_PROVIDER_CONCURRENCY calls per provider in flight. Results are
+    streamed as NDJSON lines (or SSE events with format=sse) in completion
+    order, and one Execution row per item is saved in bulk at the end.
+    Requires an API key; the runs belong to its user.
+    """
+    data = request.get_json() or {}
+    db = next(get_db())
+    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+    if not prompt:
+        return jsonify({'error': f'Prompt with ID {prompt_id} not found'}), 404
+
+    models = data.get('models') or ([data['model']] if data.get('model') else [])
+    if not models:
+        return jsonify({'error': 'At least one model must be specified'}), 400
+    try:
+        llm_service.validate_model_whitelist(models, 'request')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if prompt.model_whitelist:
+        rejected = [model for model in models if model not in prompt.model_whitelist]
+        if rejected:
+            return jsonify({'error': f'Models not in the prompt whitelist: {", ".join(rejected)}'}), 400
+
+    variable_sets = data.get('variables') or [{}]
+    if not isinstance(variable_sets, list) or not all(isinstance(v, dict) for v in variable_sets):
+        return jsonify({'error': 'Variables must be a list of objects'}), 400
+
+    output_format = data.get('format', 'ndjson')
+    if output_format not in ('ndjson', 'sse'):
+        return jsonify({'error': f'Invalid format: {output_format}'}), 400
+
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 50)
+    if len(models) * len(variable_sets) > max_items:
+        return jsonify({'error': f'Batch exceeds the maximum of {max_items} executions'}), 400
+
+    # Batches are charged to and recorded for the authenticated caller
+    user_id = current_user_id()
+    items = []
+    try:
+        for variables in variable_sets:
+            for model in models:
+                items.append((variables, PromptRequest(
+                    prompt=render_prompt(prompt.prompt_text, variables),
+                    model=model,
+                    temperature=data.get('temperature', 0.7),
+                    max_tokens=data.get('max_tokens', 1000),
+                    system_prompt=data.get('system_prompt'),
+                    tools=data.get('tools'),
+                    cache=data.get('cache'),
+                    user_id=user_id,
+                    prompt_id=prompt_id,
+                    fallback_models=data.get('fallback_models'),
+                    allowed_models=prompt.model_whitelist,
+                    truncate=data.get('truncate', False)
+                )))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        # Every item shares the request's fallback models
+        llm_service.validate_model_whitelist(items[0][1].fallback_models, 'fallback_models')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = llm_service.execute_batch(
+        [prompt_request for _, prompt_request in items],
+        provider_concurrency=current_app.config.get('BATCH_PROVIDER_CONCURRENCY', 4)
+    )
+    lines = _batch_lines(prompt_id, user_id, items, results)
+    if output_format == 'sse':
+        events = get_background_loop().iterate(
+            lines,
+            heartbeat_interval=current_app.config.get('SSE_HEARTBEAT_INTERVAL'),
+            heartbeat=SSE_HEARTBEAT
+        )
         return Response(
-            stream_with_context(stream_llm_response(prompt_request)),
+            _batch_sse_events(events),
             content_type='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
-            }
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
         )
+    return Response(
+        (json.dumps(line) + '\n' for line in get_background_loop().iterate(lines)),
+        content_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def _batch_lines(prompt_id, user_id, items, results):
+    """Turn batch results into output records and persist them once finished"""
+    executions = []
+    succeeded = 0
     try:
-        response = await llm_service.execute_prompt(prompt_request)
-        return jsonify({
-            'model': data['model'],
-            'response': response
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        async for item in results:
+            variables, prompt_request = items[item.index]
+            # Record the model that answered, which differs after a fallback
+            served_model = item.result.model if item.result is not None else prompt_request.model
+            provider, model_name = served_model.split(':', 1)
+            output = item.result.output if item.result is not None else None
+            usage = item.result.usage if item.result is not None else None
+            if item.error is None:
+                succeeded += 1
+            executions.append(Execution(
+                prompt_id=prompt_id,
+                user_id=user_id,
+                model=model_name,
+                provider=provider,
+                input_tokens=usage.input_tokens if usage else None,
+                output_tokens=usage.output_tokens if usage else None,
+                cost=usage.cost if usage else None,
+                response_text=output,
+                is_successful=item.error is None,
+                error_message=item.error,
+                execution_time_ms=item.execution_time_ms
+            ))
+            yield {
+                'index': item.index,
+                'model': prompt_request.model,
+                'served_model': served_model,
+                'variables': variables,
+                'response': output,
+                'error': item.error,
+                'cache': item.result.cache_status if item.result is not None else None,
+                'usage': usage.to_dict() if usage else None,
+                'execution_time_ms': item.execution_time_ms
+            }
+    except asyncio.CancelledError:
+        # Client went away: keep whatever already finished
+        asyncio.get_running_loop().run_in_executor(None, _save_executions, executions)
+        raise
+
+    persisted = await asyncio.get_running_loop().run_in_executor(None, _save_executions, executions)
+    yield {
+        'done': True,
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': len(executions) - succeeded,
+        'persisted': persisted
+    }
+
+def _save_executions(executions):
+    """Insert execution rows in a single transaction, returning how many were saved"""
+    if not executions:
+        return 0
+    db_session = get_db()
+    db = next(db_session)
+    try:
+        db.add_all(executions)
+        db.commit()
+        return len(executions)
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Failed to save {} batch executions: {}", len(executions), e)
+        return 0
+    finally:
+        db_session.close()
+
+def _batch_sse_events(lines):
+    for line in lines:
+        if line is SSE_HEARTBEAT:
+            yield ": heartbeat\n\n"
+        elif line.get('done'):
+            yield f"event: done\ndata: {json.dumps(line)}\n\n"
+        else:
+            yield f"event: result\ndata: {json.dumps(line)}\n\n"
+
+# Sentinel yielded by the streaming bridge when the provider has gone quiet
+SSE_HEARTBEAT = object()
+
+def stream_response(prompt_request, result):
+    """Build the SSE response for a streaming execution result"""
+    return Response(
+        stream_llm_response(prompt_request, result.output),
+        content_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def stream_llm_response(prompt_request, chunks):
+    """
+    Stream the LLM response as SSE events using LangChain
+
+    Chunks are pulled from the provider on the background event loop and
+    written out as they arrive. Comment heartbeats keep idle connections open
+    and let the server notice disconnected clients, which cancels the
+    upstream provider call.
+    """
+    started_at = g.get('start_time', time.time())
+    heartbeat_interval = current_app.config.get('SSE_HEARTBEAT_INTERVAL')
 
-async def stream_llm_response(prompt_request):
-    """Stream the LLM response as SSE events using LangChain"""
+    chunks = get_background_loop().iterate(
+        chunks,
+        heartbeat_interval=heartbeat_interval,
+        heartbeat=SSE_HEARTBEAT
+    )
+    return _sse_events(chunks, prompt_request.model, started_at)
+
+def _sse_events(chunks, model, started_at):
+    """Format chunks as SSE events and record time-to-first-byte"""
+    first_chunk_at = None
+    finished = False
+    # Send an initial comment so headers go out before the provider responds
+    yield ": stream-open\n\n"
     try:
-        async for chunk in await llm_service.execute_prompt(prompt_request):
+        for chunk in chunks:
+            if chunk is SSE_HEARTBEAT:
+                yield ": heartbeat\n\n"
+                continue
             if chunk:
+                if first_chunk_at is None:
+                    first_chunk_at = time.time()
+                    ttfb_ms = (first_chunk_at - started_at) * 1000
+                    metrics.observe('llm.stream.ttfb_ms', ttfb_ms, model=model)
+                    logger.info("First streamed chunk for {} after {:.0f}ms", model, ttfb_ms)
                 yield f"data: {json.dumps({'text': chunk})}\n\n"
+        finished = True
         yield "event: done\ndata: null\n\n"
     except Exception as e:
+        finished = True
         error_data = json.dumps({'error': str(e)})
         yield f"event: error\ndata: {error_data}\n\n"
-        yield "event: done\ndata: null\n\n" 
\ No newline at end of file
+        yield "event: done\ndata: null\n\n"
+    finally:
+        metrics.observe('llm.stream.duration_ms', (time.time() - started_at) * 1000, model=model)
+        if not finished:
+            # Generator closed early: the client went away mid-stream
+            metrics.increment('llm.stream.disconnects', model=model)
+            logger.info("Client disconnected from {} stream; upstream call cancelled", model)
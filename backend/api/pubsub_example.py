@@ -1,55 +1,36 @@
 from flask import Blueprint, jsonify, request
+import re
 import time
-import threading
-from ..utils.redis_client import RedisPubSub, get_redis_client
+from ..utils.event_bus import EventBus
 from ..utils.logging import get_contextual_logger
 
 # Create blueprint
 pubsub_bp = Blueprint('pubsub', __name__)
 logger = get_contextual_logger()
 
-# Global storage for received messages (for demo purposes)
-RECEIVED_MESSAGES = []
-MAX_STORED_MESSAGES = 100
+# Channels the example publishes to and keeps recent events for
+EVENT_CHANNELS = ['events', 'notifications', 'cache_events']
 
-# Initialize subscriber in a background thread
-def start_subscriber():
-    """Start the Redis subscriber in a background thread"""
-    def message_handler(channel, message):
-        """Handle incoming Redis messages"""
-        logger.info(f"Received message on channel {channel}: {message}")
-        
-        # Store message for retrieval via API
-        timestamp = time.time()
-        RECEIVED_MESSAGES.append({
-            'channel': channel,
-            'message': message,
-            'received_at': timestamp,
-            'received_at_formatted': time.ctime(timestamp)
-        })
-        
-        # Keep message list at manageable size
-        while len(RECEIVED_MESSAGES) > MAX_STORED_MESSAGES:
-            RECEIVED_MESSAGES.pop(0)
-    
-    def subscriber_thread():
-        """Background thread function for Redis subscription"""
-        logger.info("Starting Redis subscriber thread")
-        # Subscribe to multiple channels
-        RedisPubSub.subscribe(['events', 'notifications', 'cache_events'], message_handler)
-    
-    # Start the thread
-    thread = threading.Thread(target=subscriber_thread, daemon=True)
-    thread.start()
-    logger.info("Redis subscriber thread started")
+# Cursors are stream IDs ("<ms>-<seq>")
+CURSOR_PATTERN = re.compile(r'^\d+(-\d+)?$')
+
+event_bus = EventBus(EVENT_CHANNELS)
+
+def log_event(channel, message):
+    """Log each event once across all workers"""
+    logger.info(f"Received message on channel {channel}: {message}")
+
+event_bus.consume('event-log', log_event)
 
-# Start the subscriber when this module is imported
-start_subscriber()
+@pubsub_bp.before_app_request
+def start_event_bus():
+    """Start this worker's stream readers on its first request (after any fork)"""
+    event_bus.start()
 
 @pubsub_bp.route('/api/publish-event', methods=['POST'])
 def publish_event():
     """
-    Publish an event to a Redis channel
+    Publish an event to a Redis stream
     
     POST parameters:
         channel: The channel to publish to
@@ -66,39 +47,41 @@ def publish_event():
         return jsonify({'error': 'No channel specified'}), 400
     if not message:
         return jsonify({'error': 'No message specified'}), 400
+    if channel not in EVENT_CHANNELS:
+        return jsonify({'error': f'Unknown channel: {channel}', 'channels': EVENT_CHANNELS}), 400
     
     # Publish the message
-    recipients = RedisPubSub.publish(channel, message)
+    event_id = event_bus.publish(channel, message)
     
     return jsonify({
-        'success': True,
+        'success': event_id is not None,
         'channel': channel,
-        'recipients': recipients,
+        'id': event_id,
         'timestamp': time.time()
     })
 
 @pubsub_bp.route('/api/recent-events', methods=['GET'])
 def get_recent_events():
-    """Get recently received events from Redis Pub/Sub"""
-    limit = request.args.get('limit', default=10, type=int)
-    channel = request.args.get('channel')
+    """
+    Get recent events, newest first
     
-    # Filter by channel if requested
-    if channel:
-        filtered_messages = [msg for msg in RECEIVED_MESSAGES if msg['channel'] == channel]
-    else:
-        filtered_messages = RECEIVED_MESSAGES
+    Query parameters:
+        limit: Maximum events to return (default 10, at most 100)
+        channel: Only events from this channel
+        before: Cursor from a previous response; returns older events
+    """
+    limit = min(request.args.get('limit', default=10, type=int), 100)
+    channel = request.args.get('channel')
+    before = request.args.get('before')
+    if before is not None and not CURSOR_PATTERN.match(before):
+        return jsonify({'error': f'Invalid cursor: {before}'}), 400
     
-    # Return most recent messages first, limited to requested count
-    recent_messages = sorted(
-        filtered_messages,
-        key=lambda x: x['received_at'],
-        reverse=True
-    )[:limit]
+    events = event_bus.recent(channel, limit, before)
     
     return jsonify({
         'channel_filter': channel,
         'limit': limit,
-        'count': len(recent_messages),
-        'events': recent_messages
-    }) 
\ No newline at end of file
+        'count': len(events),
+        'events': events,
+        'next_cursor': events[-1]['id'] if len(events) == limit else None
+    })
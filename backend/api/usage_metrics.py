@@ -7,11 +7,13 @@ from ..models.execution import Execution
 from ..models.user import User
 from ..utils.auth import authenticate
 from ..utils.db import get_db
+from ..utils.redis_client import cache_response
 
 bp = Blueprint('usage_metrics', __name__, url_prefix='/api/metrics')
 
 @bp.route('/summary', methods=['GET'])
 @authenticate
+@cache_response(ttl=60, namespace='user')
 def get_usage_summary():
     """Get a summary of usage metrics for the current user."""
     user_id = g.user.id
@@ -64,6 +66,7 @@ def get_usage_summary():
 
 @bp.route('/daily', methods=['GET'])
 @authenticate
+@cache_response(ttl=60, namespace='user')
 def get_daily_metrics():
     """Get daily usage metrics for the last 30 days."""
     user_id = g.user.id
@@ -107,6 +110,7 @@ def get_daily_metrics():
 
 @bp.route('/cost_breakdown', methods=['GET'])
 @authenticate
+@cache_response(ttl=60, namespace='user')
 def get_cost_breakdown():
     """Get cost breakdown by provider and model."""
     user_id = g.user.id
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent /api/prompts/execute throughput for one worker process.
+
+The LLM call is replaced with an asyncio.sleep of fixed latency so the numbers
+reflect how the app schedules coroutines, not provider speed. Requests are
+issued from a thread pool to mimic a threaded WSGI worker.
+
+Usage:
+    python scripts/bench_async_execution.py --requests 200 --threads 32 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app import create_app
+from backend.services.llm_service import llm_service
+
+
+def run_benchmark(mode, total_requests, threads, latency):
+    app = create_app({
+        'TESTING': True,
+        'REDIS_URL': None,
+        'ASYNC_MODE': mode,
+        'ASYNC_REQUEST_TIMEOUT': 60,
+    })
+
+    loops_seen = set()
+    in_flight = 0
+    peak_in_flight = 0
+    lock = threading.Lock()
+
+    async def fake_call_provider(provider, model, prompt_request):
+        nonlocal in_flight, peak_in_flight
+        loops_seen.add(id(asyncio.get_running_loop()))
+        with lock:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(latency)
+        with lock:
+            in_flight -= 1
+        return "ok"
+
+    llm_service._call_provider = fake_call_provider
+
+    def one_request(_):
+        with app.test_client() as client:
+            response = client.post('/api/prompts/execute', json={
+                'prompt': 'benchmark prompt',
+                'model': 'openai:gpt-3.5-turbo',
+            })
+            return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'mode': mode,
+        'requests': total_requests,
+        'errors': sum(1 for status in statuses if status != 200),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total_requests / elapsed, 1),
+        'peak_in_flight': peak_in_flight,
+        'event_loops_used': len(loops_seen),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated provider latency in seconds')
+    args = parser.parse_args()
+
+    for mode in ('per_request', 'background_loop'):
+        result = run_benchmark(mode, args.requests, args.threads, args.latency)
+        print(
+            f"{result['mode']:>16}: {result['throughput_rps']:>7} req/s "
+            f"({result['requests']} requests in {result['elapsed_s']}s, "
+            f"{result['errors']} errors, peak in-flight {result['peak_in_flight']}, "
+            f"{result['event_loops_used']} event loops)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Redis value codecs on representative cache payloads.
+
+Encodes a prompt metadata entry, a prompt list page, an execution with a
+long response_text and an LLM response cache entry with every available
+serializer/compression pair. Reports encoded size against the legacy JSON
+text, and encode/decode CPU time per value. With --redis-url the values are
+also written to Redis and MEMORY USAGE reports what each one really costs.
+
+Usage:
+    python scripts/bench_codec.py --iterations 2000
+    python scripts/bench_codec.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.utils.codec import COMPRESSORS, SERIALIZERS, CACHE_COMPRESSION_THRESHOLD, Codec
+
+WORDS = (
+    "the model returns a summary of each section with citations and a short list of follow up "
+    "questions so that reviewers can check the answer against the source documents before publishing"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def prompt_entry(rng, prompt_id):
+    return {
+        'id': prompt_id,
+        'title': sentence(rng, 5),
+        'description': sentence(rng, 20),
+        'prompt_text': " ".join(sentence(rng, 15) for _ in range(8)),
+        'tags': ['summarization', 'research'],
+        'model_whitelist': ['openai:gpt-4', 'anthropic:claude-3-opus'],
+        'user_id': 7,
+        'state': 'published',
+        'created_at': '2024-05-01T12:00:00',
+        'updated_at': '2024-05-02T08:30:00',
+    }
+
+
+def payloads():
+    """Representative values, keyed by name"""
+    rng = random.Random(42)
+    response_text = "\n\n".join(" ".join(sentence(rng, 18) for _ in range(6)) for _ in range(12))
+    return {
+        'prompt': prompt_entry(rng, 1),
+        'prompt list (10)': {
+            'prompts': [prompt_entry(rng, i) for i in range(10)], 'page': 1, 'per_page': 10, 'total': 240
+        },
+        'execution': {
+            'id': 9001,
+            'prompt_id': 1,
+            'model': 'openai:gpt-4',
+            'response_text': response_text,
+            'input_tokens': 412,
+            'output_tokens': 1630,
+            'cost': 0.11016,
+            'latency_ms': 8412,
+        },
+        'llm response': response_text,
+    }
+
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--threshold', type=int, default=CACHE_COMPRESSION_THRESHOLD, help='Compression threshold in bytes')
+    parser.add_argument('--redis-url', default=None, help='Also measure MEMORY USAGE in this Redis')
+    args = parser.parse_args()
+
+    client = None
+    if args.redis_url:
+        import redis
+        client = redis.from_url(args.redis_url)
+    prefix = f"bench_codec:{os.getpid()}"
+
+    try:
+        for name, value in payloads().items():
+            legacy = json.dumps(value).encode('utf-8')
+            print(f"\n{name}: legacy JSON {len(legacy)} bytes")
+            for serializer in SERIALIZERS:
+                for compression in COMPRESSORS:
+                    codec = Codec(serializer, compression, threshold=args.threshold)
+                    encoded = codec.encode(value)
+                    encode_us = time_per_call(lambda: codec.encode(value), args.iterations)
+                    decode_us = time_per_call(lambda: codec.decode(encoded), args.iterations)
+                    line = (
+                        f"  {serializer:>8} + {compression:<5}: {len(encoded):>6} bytes "
+                        f"({len(encoded) / len(legacy):>5.1%}), encode {encode_us:>7.1f} us, decode {decode_us:>7.1f} us"
+                    )
+                    if client is not None:
+                        key = f"{prefix}:{serializer}:{compression}"
+                        client.set(key, encoded)
+                        line += f", Redis {client.memory_usage(key)} bytes"
+                    print(line)
+    finally:
+        if client is not None:
+            for key in client.scan_iter(f"{prefix}:*"):
+                client.delete(key)
+
+
+if __name__ == '__main__':
+    main()
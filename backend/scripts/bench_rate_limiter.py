@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request Redis cost of the rate limiter algorithms.
+
+Compares the previous implementation (INCR+EXPIRE pipeline followed by a TTL
+call for the headers) with the single-EVALSHA Lua scripts behind
+RateLimiter.check, and with leased permits via RateLimiter.admit. Each
+request is one limiter decision for a single client key, so the numbers are
+the Redis latency added to every limited request.
+
+Usage:
+    python scripts/bench_rate_limiter.py --redis-url redis://localhost:6379/0 --requests 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.utils.rate_limiter import RateLimiter, FIXED_WINDOW, SLIDING_WINDOW, SLIDING_LOG, TOKEN_BUCKET
+
+
+def legacy_check(client, key, requests_limit, time_window):
+    """The pre-Lua limiter: pipeline INCR+EXPIRE, then TTL for the reset header"""
+    pipe = client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, time_window)
+    current_count = pipe.execute()[0]
+    client.ttl(key)
+    return current_count <= requests_limit
+
+
+def run_benchmark(name, check, total_requests):
+    latencies = []
+    allowed = 0
+    for _ in range(total_requests):
+        start = time.perf_counter()
+        allowed += bool(check())
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'name': name,
+        'requests': total_requests,
+        'allowed': allowed,
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis-url', default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=1000, help='Requests allowed per window')
+    parser.add_argument('--window', type=int, default=60, help='Window in seconds')
+    parser.add_argument('--lease', type=int, default=20, help='Permits leased per Redis round-trip')
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    prefix = f"bench_rate_limit:{os.getpid()}"
+    cases = [('legacy (3 round-trips)', lambda: legacy_check(client, f"{prefix}:legacy", args.limit, args.window))]
+    for algorithm in (FIXED_WINDOW, SLIDING_WINDOW, SLIDING_LOG, TOKEN_BUCKET):
+        key = f"{prefix}:{algorithm}"
+        cases.append((algorithm, lambda key=key, algorithm=algorithm: RateLimiter.check(
+            client, key, args.limit, args.window, algorithm
+        ).allowed))
+    cases.append((f'token_bucket lease={args.lease}', lambda: RateLimiter.admit(
+        client, f"{prefix}:leased", args.limit, args.window, TOKEN_BUCKET, lease=args.lease
+    ).allowed))
+
+    try:
+        for name, check in cases:
+            # Warm up the connection and load the script
+            check()
+            result = run_benchmark(name, check, args.requests)
+            print(
+                f"{result['name']:>22}: p50 {result['p50_ms']:>6} ms, p99 {result['p99_ms']:>6} ms, "
+                f"mean {result['mean_ms']:>6} ms ({result['allowed']}/{result['requests']} allowed)"
+            )
+    finally:
+        for key in client.scan_iter(f"{prefix}:*"):
+            client.delete(key)
+
+
+if __name__ == '__main__':
+    main()
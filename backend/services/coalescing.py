@@ -0,0 +1,301 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+
+import redis
+
+from backend.utils.event_loop import get_background_loop
+from backend.utils.metrics import metrics
+from backend.utils.redis_client import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Request coalescing settings
+LLM_COALESCE_ENABLED = os.environ.get("LLM_COALESCE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_COALESCE_LOCK_TTL = float(os.environ.get("LLM_COALESCE_LOCK_TTL", 120))
+LLM_COALESCE_POLL_INTERVAL = float(os.environ.get("LLM_COALESCE_POLL_INTERVAL", 0.05))
+
+# What a flight's leader runs: returns the output (text or chunk stream) and
+# a route dict whose "model" names the model that answered
+FlightStart = Callable[[], Awaitable[Tuple[Union[str, AsyncIterator[str]], Dict[str, str]]]]
+
+# Delete a lock only if it still holds our token
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _LeaderLost(Exception):
+    """The worker leading a flight went away without finishing it"""
+
+
+class Flight:
+    """
+    One in-flight upstream call and everyone waiting on it.
+
+    Chunks are buffered so late subscribers replay from the start. Waiters
+    may sit on different event loops, so they are woken thread-safely.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.model: Optional[str] = None
+        self.subscribers = 0
+        self.future = None
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def publish(self, chunk: str):
+        with self._lock:
+            self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, model: Optional[str]):
+        with self._lock:
+            self.model = model
+            self.done = True
+        self._notify()
+
+    def fail(self, error: BaseException):
+        with self._lock:
+            self.error = error
+            self.done = True
+        self._notify()
+
+    def _notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        Stream the flight's chunks from the beginning
+
+        The subscriber count must already include this subscription (see
+        SingleFlight.join); when the last subscriber leaves before the
+        flight is done, the upstream call is cancelled.
+        """
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._waiters.add(waiter)
+        index = 0
+        try:
+            while True:
+                # Clear before reading so a publish in between isn't missed
+                event.clear()
+                with self._lock:
+                    new_chunks = self.chunks[index:]
+                    done, error = self.done, self.error
+                index += len(new_chunks)
+                for chunk in new_chunks:
+                    yield chunk
+                if done and index == len(self.chunks):
+                    if error is not None:
+                        raise error
+                    return
+                if not new_chunks:
+                    await event.wait()
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+                self.subscribers -= 1
+                abandoned = self.subscribers == 0 and not self.done
+            if abandoned and self.future is not None:
+                logger.info(f"All subscribers left flight {self.key}; cancelling upstream call")
+                self.future.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent LLM calls into one upstream call.
+
+    The first request for a key leads: its upstream call runs as a task on
+    the background event loop and every request that arrives before it
+    finishes subscribes to the same chunk buffer. Across workers, the leader
+    takes a Redis lock and mirrors its chunks to a Redis list named after its
+    lock token, so a new flight never replays an earlier one's events; other
+    workers read the token from the lock and poll that list instead of
+    calling the provider themselves, and take over the call if the leader's
+    lock disappears before the flight completes.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LLM_COALESCE_ENABLED,
+        lock_ttl: float = LLM_COALESCE_LOCK_TTL,
+        poll_interval: float = LLM_COALESCE_POLL_INTERVAL,
+        key_prefix: str = "llm_flight",
+    ):
+        self.enabled = enabled
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def in_progress(self, key: str) -> bool:
+        """Whether this worker has an unfinished flight for key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight is not None and not flight.done
+
+    def join(self, key: str, start: FlightStart) -> Flight:
+        """
+        Join the flight for key, starting it with start if none is in progress
+
+        Returns:
+            Flight: Call subscribe() on it to receive the chunks
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.done:
+                flight.subscribers += 1
+                metrics.increment("llm.coalesce.coalesced", scope="local")
+                return flight
+            flight = self._flights[key] = Flight(key)
+            flight.subscribers = 1
+        metrics.increment("llm.coalesce.flights")
+        flight.future = get_background_loop().submit(self._pump(flight, start))
+        return flight
+
+    async def _pump(self, flight: Flight, start: FlightStart):
+        """Run (or follow) the upstream call, feeding its chunks into the flight"""
+        client = self._redis()
+        token = uuid.uuid4().hex
+        leading = True
+        try:
+            if client is not None:
+                try:
+                    leading, leader_token = await self._acquire(client, flight.key, token)
+                except redis.RedisError as e:
+                    logger.warning(f"Coalescing lock unavailable, calling provider directly: {e}")
+                    client = None
+
+            if not leading:
+                metrics.increment("llm.coalesce.coalesced", scope="redis")
+                try:
+                    await self._follow_remote(flight, client, leader_token)
+                    return
+                except (_LeaderLost, redis.RedisError) as e:
+                    if flight.chunks:
+                        raise RuntimeError(f"Coalesced call lost its leader mid-stream: {e}")
+                    logger.warning(f"Taking over coalesced call {flight.key}: {e}")
+                    client = None
+
+            output, route = await start()
+            if isinstance(output, str):
+                await self._publish(flight, client, token, output)
+            else:
+                async for chunk in output:
+                    await self._publish(flight, client, token, chunk)
+            flight.finish(route.get("model"))
+            await self._mirror(client, {"done": True, "model": route.get("model")}, flight.key, token)
+        except asyncio.CancelledError:
+            flight.fail(RuntimeError("Coalesced call was cancelled"))
+            await self._mirror(client, {"error": "cancelled"}, flight.key, token)
+            raise
+        except BaseException as e:
+            flight.fail(e)
+            await self._mirror(client, {"error": str(e)}, flight.key, token)
+        finally:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            if leading and client is not None:
+                await self._release_lock(client, flight.key, token)
+
+    async def _acquire(self, client, key: str, token: str) -> Tuple[bool, Optional[str]]:
+        """
+        Take the flight's lock, or find out which flight holds it
+
+        Returns:
+            tuple: (whether we lead, the leading flight's token)
+        """
+        lock_key = self._lock_key(key)
+        for _ in range(3):
+            if await client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                return True, token
+            holder = await client.get(lock_key)
+            if holder is not None:
+                return False, holder
+            # Released between the two calls: try again
+        return True, token
+
+    async def _follow_remote(self, flight: Flight, client, leader_token: str):
+        """Replay another worker's flight from its Redis event list"""
+        events_key = self._events_key(flight.key, leader_token)
+        cursor = 0
+        while True:
+            events = await client.lrange(events_key, cursor, -1)
+            if not events and await client.get(self._lock_key(flight.key)) != leader_token:
+                # The leader may have written its last events just before releasing the lock
+                events = await client.lrange(events_key, cursor, -1)
+                if not events:
+                    raise _LeaderLost(f"lock for {flight.key} released without a result")
+            cursor += len(events)
+            for raw in events:
+                event = json.loads(raw)
+                if "c" in event:
+                    flight.publish(event["c"])
+                elif event.get("done"):
+                    flight.finish(event.get("model"))
+                    return
+                else:
+                    flight.fail(RuntimeError(event.get("error", "Coalesced call failed")))
+                    return
+            await asyncio.sleep(self.poll_interval)
+
+    async def _publish(self, flight: Flight, client, token: str, chunk: str):
+        flight.publish(chunk)
+        await self._mirror(client, {"c": chunk}, flight.key, token, refresh_lock=True)
+
+    async def _mirror(self, client, event: dict, key: str, token: str, refresh_lock: bool = False):
+        """Append an event to the flight's Redis list for followers in other workers"""
+        if client is None:
+            return
+        events_key = self._events_key(key, token)
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.rpush(events_key, json.dumps(event))
+            pipe.pexpire(events_key, int(self.lock_ttl * 1000))
+            if refresh_lock:
+                pipe.pexpire(self._lock_key(key), int(self.lock_ttl * 1000))
+            await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to mirror coalesced chunk for {key}: {e}")
+
+    async def _release_lock(self, client, key: str, token: str):
+        try:
+            # Only delete the lock if it is still ours (it may have expired and been retaken)
+            await client.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), token)
+            # Followers still draining have a few seconds to read the tail
+            await client.expire(self._events_key(key, token), 10)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release coalescing lock for {key}: {e}")
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.key_prefix}:{key}:lock"
+
+    def _events_key(self, key: str, token: str) -> str:
+        return f"{self.key_prefix}:{key}:events:{token}"
+
+    @staticmethod
+    def _redis():
+        # _pump runs on the event loop, so it uses that loop's asyncio client
+        try:
+            return get_async_redis_client()
+        except RuntimeError:
+            # Outside an app context there is no Redis configuration
+            return None
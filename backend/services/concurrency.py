@@ -0,0 +1,234 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Optional
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from backend.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Adaptive per-provider concurrency settings
+LLM_LIMIT_INITIAL = int(os.environ.get("LLM_LIMIT_INITIAL", 8))
+LLM_LIMIT_MIN = int(os.environ.get("LLM_LIMIT_MIN", 1))
+LLM_LIMIT_MAX = int(os.environ.get("LLM_LIMIT_MAX", 64))
+LLM_LIMIT_PER_USER = int(os.environ.get("LLM_LIMIT_PER_USER", 4))
+LLM_LIMIT_LATENCY_TARGET_MS = float(os.environ.get("LLM_LIMIT_LATENCY_TARGET_MS", 30000))
+LLM_LIMIT_BACKOFF = float(os.environ.get("LLM_LIMIT_BACKOFF", 0.5))
+LLM_LIMIT_DECREASE_COOLDOWN = float(os.environ.get("LLM_LIMIT_DECREASE_COOLDOWN", 1.0))
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    Whether an exception is a provider rate-limit response
+
+    OpenAI and Anthropic raise RateLimitError with status_code 429; Google
+    raises ResourceExhausted with code 429.
+    """
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    name = type(error).__name__
+    return name == "RateLimitError" or name == "ResourceExhausted"
+
+
+class _Waiter:
+    """A queued acquire() call, woken on its own event loop when granted"""
+
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        def resolve():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(resolve)
+
+
+class AdaptiveLimiter:
+    """
+    In-flight limit for one provider with a fair queue and AIMD adaptation.
+
+    Callers over the limit wait in per-user queues that are served round
+    robin, so one user's burst can't starve everyone else, and no user holds
+    more than per_user_limit slots at once (anonymous callers share a queue
+    but are not capped). The limit grows by roughly one slot per limit's
+    worth of fast, successful calls while it is fully used, and is cut
+    multiplicatively when the provider answers 429 or latency exceeds the
+    target. State is guarded by a thread lock so waiters on different event
+    loops can share one limiter.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = LLM_LIMIT_INITIAL,
+        min_limit: int = LLM_LIMIT_MIN,
+        max_limit: int = LLM_LIMIT_MAX,
+        per_user_limit: int = LLM_LIMIT_PER_USER,
+        latency_target_ms: float = LLM_LIMIT_LATENCY_TARGET_MS,
+        backoff: float = LLM_LIMIT_BACKOFF,
+        decrease_cooldown: float = LLM_LIMIT_DECREASE_COOLDOWN,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.per_user_limit = per_user_limit
+        self.latency_target_ms = latency_target_ms
+        self.backoff = backoff
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._user_in_flight: Dict[Hashable, int] = {}
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def acquire(self, user: Optional[Hashable] = None):
+        """Wait for a slot for user (None for anonymous callers)"""
+        with self._lock:
+            if not self._queues and self._has_capacity(user):
+                self._start(user)
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._dispatch()
+            self._publish()
+
+        queued_at = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Granted just as we were cancelled: hand the slot on
+                    self._finish(user)
+                    self._dispatch()
+                else:
+                    queue = self._queues.get(user)
+                    if queue is not None:
+                        queue.remove(waiter)
+                        if not queue:
+                            del self._queues[user]
+                self._publish()
+            raise
+        metrics.observe("llm.limiter.wait_ms", (time.perf_counter() - queued_at) * 1000, provider=self.name)
+
+    def release(self, user: Optional[Hashable] = None, latency_ms: Optional[float] = None, rate_limited: bool = False):
+        """
+        Return a slot and feed the call's outcome into the limit
+
+        Args:
+            user: User the slot was acquired for
+            latency_ms: Duration of a successful call, if it succeeded
+            rate_limited: Whether the provider rejected the call with 429
+        """
+        with self._lock:
+            saturated = self._in_flight >= self.limit or bool(self._queues)
+            self._finish(user)
+            if rate_limited:
+                metrics.increment("llm.limiter.rate_limited", provider=self.name)
+                self._decrease("rate limited")
+            elif latency_ms is not None:
+                if latency_ms > self.latency_target_ms:
+                    self._decrease(f"latency {latency_ms:.0f}ms over target")
+                elif saturated:
+                    self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+            self._dispatch()
+            self._publish()
+
+    def _has_capacity(self, user: Optional[Hashable]) -> bool:
+        if self._in_flight >= self.limit:
+            return False
+        return user is None or self._user_in_flight.get(user, 0) < self.per_user_limit
+
+    def _start(self, user: Optional[Hashable]):
+        self._in_flight += 1
+        self._user_in_flight[user] = self._user_in_flight.get(user, 0) + 1
+
+    def _finish(self, user: Optional[Hashable]):
+        self._in_flight -= 1
+        remaining = self._user_in_flight.get(user, 1) - 1
+        if remaining:
+            self._user_in_flight[user] = remaining
+        else:
+            self._user_in_flight.pop(user, None)
+
+    def _dispatch(self):
+        """Grant free slots to queued users in round-robin order"""
+        while self._queues and self._in_flight < self.limit:
+            for user in list(self._queues):
+                if self._has_capacity(user):
+                    break
+            else:
+                # Everyone queued is at their per-user cap
+                return
+            queue = self._queues.pop(user)
+            waiter = queue.popleft()
+            if queue:
+                # Re-append so the next grant goes to a different user
+                self._queues[user] = queue
+            waiter.granted = True
+            self._start(user)
+            waiter.wake()
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        # Failures from one burst arrive together; count them as one signal
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(self._limit * self.backoff, float(self.min_limit))
+        logger.warning(f"Lowering {self.name} concurrency limit {previous} -> {self.limit}: {reason}")
+
+    def _publish(self):
+        metrics.set_gauge("llm.limiter.limit", self.limit, provider=self.name)
+        metrics.set_gauge("llm.limiter.in_flight", self._in_flight, provider=self.name)
+        metrics.set_gauge("llm.limiter.queue_depth", self.queue_depth, provider=self.name)
+
+
+class ProviderLimiters:
+    """Lazily created AdaptiveLimiter per provider"""
+
+    def __init__(self, **limiter_options):
+        self.limiter_options = limiter_options
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> AdaptiveLimiter:
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None:
+                limiter = self._limiters[provider] = AdaptiveLimiter(provider, **self.limiter_options)
+            return limiter
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {
+            limiter.name: {
+                "limit": limiter.limit,
+                "in_flight": limiter.in_flight,
+                "queue_depth": limiter.queue_depth,
+            }
+            for limiter in limiters
+        }
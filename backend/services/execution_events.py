@@ -0,0 +1,190 @@
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+import redis
+from flask import current_app, has_app_context
+
+from backend.utils.metrics import metrics
+from backend.utils.redis_client import RedisPubSub
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub channel carrying execution events between workers
+EXECUTION_EVENTS_CHANNEL = os.environ.get("EXECUTION_EVENTS_CHANNEL", "executions")
+
+# Minimum seconds between token-progress events of one streaming execution
+EXECUTION_PROGRESS_INTERVAL = float(os.environ.get("EXECUTION_PROGRESS_INTERVAL", 0.5))
+
+# Events queued per stream subscriber before a slow client starts losing them
+EXECUTION_STREAM_QUEUE_SIZE = int(os.environ.get("EXECUTION_STREAM_QUEUE_SIZE", 256))
+
+# Seconds before the subscription listener retries after a Redis error
+EXECUTION_EVENTS_RETRY_INTERVAL = float(os.environ.get("EXECUTION_EVENTS_RETRY_INTERVAL", 5))
+
+# Event types
+EXECUTION_STARTED = "execution.started"
+EXECUTION_PROGRESS = "execution.progress"
+EXECUTION_FINISHED = "execution.finished"
+EXECUTION_SAVED = "execution.saved"
+
+
+def execution_event(event_type: str, user_id: Optional[int], prompt_id: Optional[int], **fields) -> Dict[str, Any]:
+    """Build an event; user_id and prompt_id decide which streams receive it"""
+    return {"type": event_type, "user_id": user_id, "prompt_id": prompt_id, "at": time.time(), **fields}
+
+
+class Subscription:
+    """
+    One stream client's bounded queue of events
+
+    The listener never waits for a client. When the queue is full, a
+    progress event is dropped first (a later one supersedes it); otherwise
+    the new event is dropped. Dropped events are counted so the client can
+    be told to reload what it missed.
+    """
+
+    def __init__(self, key: Tuple[str, int], max_events: int = EXECUTION_STREAM_QUEUE_SIZE):
+        self.key = key
+        self.max_events = max_events
+        self.dropped = 0
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def offer(self, event: Dict[str, Any]):
+        with self._ready:
+            if len(self._events) >= self.max_events and not self._make_room(event):
+                self.dropped += 1
+                metrics.increment("executions.stream.dropped")
+                return
+            self._events.append(event)
+            self._ready.notify()
+
+    def _make_room(self, event: Dict[str, Any]) -> bool:
+        if event["type"] == EXECUTION_PROGRESS:
+            return False
+        for queued in self._events:
+            if queued["type"] == EXECUTION_PROGRESS:
+                self._events.remove(queued)
+                self.dropped += 1
+                metrics.increment("executions.stream.dropped")
+                return True
+        return False
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Wait for events
+
+        Returns:
+            tuple: (queued events, events dropped since the last call); both
+            empty if nothing arrived within timeout
+        """
+        with self._ready:
+            if not self._events and not self.dropped:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+            return events, dropped
+
+
+class ExecutionEventHub:
+    """
+    Fans execution events out to the SSE streams of this worker
+
+    Events are published on one pub/sub channel. Each worker holds a single
+    subscription to it, started with the first stream, and routes every
+    event to the subscribers of its user and its prompt; streams never open
+    Redis connections of their own. Without Redis, events are delivered
+    within the publishing worker only.
+    """
+
+    def __init__(self, channel: str = EXECUTION_EVENTS_CHANNEL):
+        self.channel = channel
+        self._subscribers: Dict[Hashable, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._listener_pid: Optional[int] = None
+
+    def subscribe(self, user_id: Optional[int] = None, prompt_id: Optional[int] = None) -> Subscription:
+        """Stream a prompt's executions, or a user's if no prompt_id is given"""
+        key = ("prompt", prompt_id) if prompt_id is not None else ("user", user_id)
+        subscription = Subscription(key)
+        self._start_listener()
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+            metrics.set_gauge("executions.stream.subscribers", self.subscriber_count())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+            metrics.set_gauge("executions.stream.subscribers", self.subscriber_count())
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, event: Dict[str, Any]):
+        """Publish an event to every worker; failures are logged, never raised"""
+        if not self._redis_configured():
+            self.dispatch(event)
+            return
+        try:
+            RedisPubSub.publish(self.channel, event)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish {event['type']} event: {e}")
+
+    async def apublish(self, event: Dict[str, Any]):
+        """publish() for coroutines"""
+        if not self._redis_configured():
+            self.dispatch(event)
+            return
+        try:
+            await RedisPubSub.apublish(self.channel, event)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish {event['type']} event: {e}")
+
+    def dispatch(self, event: Dict[str, Any]):
+        """Hand an event to the matching subscribers of this worker"""
+        with self._lock:
+            targets = []
+            for key in (("user", event.get("user_id")), ("prompt", event.get("prompt_id"))):
+                if key[1] is not None:
+                    targets.extend(self._subscribers.get(key, ()))
+        for subscription in targets:
+            subscription.offer(event)
+
+    @staticmethod
+    def _redis_configured() -> bool:
+        return has_app_context() and bool(current_app.config.get("REDIS_URL"))
+
+    def _start_listener(self):
+        """Subscribe this worker to the channel once per process"""
+        if self._listener_pid == os.getpid() or not self._redis_configured():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            # Threads don't survive a fork: each worker starts its own
+            self._listener_pid = os.getpid()
+            app = current_app._get_current_object()
+            threading.Thread(target=self._listen, args=(app,), name="execution-events", daemon=True).start()
+
+    def _listen(self, app):
+        with app.app_context():
+            while True:
+                try:
+                    RedisPubSub.subscribe([self.channel], lambda channel, event: self.dispatch(event))
+                    return
+                except redis.RedisError as e:
+                    logger.warning(f"Execution event subscription failed, retrying: {e}")
+                    time.sleep(EXECUTION_EVENTS_RETRY_INTERVAL)
+
+
+execution_events = ExecutionEventHub()
@@ -0,0 +1,96 @@
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from backend.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Hedged request settings
+LLM_HEDGE_QUANTILE = float(os.environ.get("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_HEDGE_MIN_DELAY_MS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_MS", 250))
+
+# Summary of recent time-to-first-token per model, which hedge deadlines are learned from
+FIRST_TOKEN_METRIC = "llm.first_token_ms"
+
+
+def hedge_deadline(model: str) -> Optional[float]:
+    """
+    Seconds to wait for the first token before hedging a call to model
+
+    The deadline is the LLM_HEDGE_QUANTILE of recent first-token latencies,
+    floored at LLM_HEDGE_MIN_DELAY_MS. Returns None until there are enough
+    samples to trust the quantile, in which case the call isn't hedged.
+    """
+    if metrics.sample_count(FIRST_TOKEN_METRIC, model=model) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    quantile_ms = metrics.quantile(FIRST_TOKEN_METRIC, LLM_HEDGE_QUANTILE, model=model)
+    return max(quantile_ms, LLM_HEDGE_MIN_DELAY_MS) / 1000
+
+
+async def race(
+    model: str,
+    start_primary: Callable[[], Awaitable[Any]],
+    start_hedge: Callable[[], Awaitable[Any]],
+    deadline: float,
+    discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+) -> Tuple[Any, bool]:
+    """
+    Run start_primary, starting start_hedge too if it misses the deadline
+
+    The first call to succeed wins and the other is cancelled (or, if it
+    already finished, its result is passed to discard). If one call fails the
+    other is still awaited; if both fail the primary's error is raised.
+
+    Returns:
+        (result, whether the hedge won)
+    """
+    metrics.increment("llm.hedge.eligible", model=model)
+    primary = asyncio.ensure_future(start_primary())
+    hedge = None
+    winner = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if done:
+            winner = primary
+            return primary.result(), False
+
+        metrics.increment("llm.hedge.fired", model=model)
+        _publish_rate(model)
+        hedge = asyncio.ensure_future(start_hedge())
+        pending = {primary, hedge}
+        errors = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer the primary when both finish in the same iteration
+            for task in sorted(done, key=lambda t: t is hedge):
+                if task.exception() is None:
+                    winner = task
+                    break
+                errors[task] = task.exception()
+            if winner is not None:
+                break
+        if winner is None:
+            raise errors.get(primary) or errors[hedge]
+        hedge_won = winner is hedge
+        metrics.increment("llm.hedge.won" if hedge_won else "llm.hedge.lost", model=model)
+        return winner.result(), hedge_won
+    finally:
+        tasks = [task for task in (primary, hedge) if task is not None]
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        # Wait for the cancellations so the loser's limiter slot is back before we return
+        await asyncio.gather(*losers, return_exceptions=True)
+        for task in tasks:
+            if task is not winner and task not in losers and discard is not None \
+                    and not task.cancelled() and task.exception() is None:
+                await discard(task.result())
+
+
+def _publish_rate(model: str):
+    eligible = metrics.counter("llm.hedge.eligible", model=model)
+    if eligible:
+        metrics.set_gauge("llm.hedge.rate", round(metrics.counter("llm.hedge.fired", model=model) / eligible, 4), model=model)
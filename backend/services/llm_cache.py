@@ -0,0 +1,178 @@
+from typing import Optional
+import hashlib
+import json
+import logging
+import os
+
+import redis
+
+from backend.utils.lru import LRUCache
+from backend.utils.metrics import metrics
+from backend.utils.codec import CodecError, codec
+from backend.utils.redis_client import get_auto_pipeline, get_binary_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Exact-match response cache settings
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1024))
+LLM_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("LLM_CACHE_MAX_ENTRY_BYTES", 256 * 1024))
+
+# Cache status values reported to callers (and in the X-Cache header)
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_BYPASS = "BYPASS"
+CACHE_SEMANTIC_HIT = "SEMANTIC_HIT"
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache for LLM responses.
+
+    Responses are keyed by a hash of the request fields that determine the
+    output. Lookups check a bounded in-process LRU first and then Redis, so
+    repeats are served locally when hot and shared across workers otherwise.
+    Redis being unavailable only disables the shared tier.
+    """
+
+    def __init__(
+        self,
+        ttl: int = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_entry_bytes: int = LLM_CACHE_MAX_ENTRY_BYTES,
+        key_prefix: str = "llm_cache",
+    ):
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.key_prefix = key_prefix
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    @staticmethod
+    def is_cacheable(request) -> bool:
+        """
+        Whether a request may be served from cache
+
+        Callers opt in or out explicitly with request.cache; otherwise only
+        deterministic requests (temperature 0) are cached.
+        """
+        if request.cache is not None:
+            return request.cache
+        return request.temperature == 0
+
+    def make_key(self, request) -> str:
+        """Build a stable cache key from the output-determining request fields"""
+        normalized = {
+            "model": request.model.strip().lower(),
+            "prompt": request.prompt.replace("\r\n", "\n").strip(),
+            "system_prompt": (request.system_prompt or "").replace("\r\n", "\n").strip(),
+            "temperature": round(float(request.temperature), 4),
+            "max_tokens": request.max_tokens,
+            "tools": request.tools or [],
+        }
+        digest = hashlib.sha256(
+            json.dumps(normalized, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, checking the local tier before Redis"""
+        text = self._get_local(key)
+        if text is not None:
+            return text
+
+        client = self._redis()
+        if client is not None:
+            try:
+                text = self._decode(key, client.get(key))
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache Redis lookup failed: {e}")
+        return self._redis_result(key, text)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for coroutines: the Redis lookup doesn't block the event loop"""
+        text = self._get_local(key)
+        if text is not None:
+            return text
+
+        pipeline = self._auto_pipeline()
+        if pipeline is not None:
+            try:
+                text = self._decode(key, await pipeline.execute_command("GET", key))
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache Redis lookup failed: {e}")
+        return self._redis_result(key, text)
+
+    def set(self, key: str, text: str):
+        """Store a response in both tiers, skipping oversized entries"""
+        if not self._set_local(key, text):
+            return
+        client = self._redis()
+        if client is not None:
+            try:
+                # Long responses are stored compressed
+                client.setex(key, self.ttl, codec.encode(text))
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache Redis write failed: {e}")
+
+    async def aset(self, key: str, text: str):
+        """set() for coroutines"""
+        if not self._set_local(key, text):
+            return
+        pipeline = self._auto_pipeline()
+        if pipeline is not None:
+            try:
+                await pipeline.execute_command("SETEX", key, self.ttl, codec.encode(text))
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache Redis write failed: {e}")
+
+    def _get_local(self, key: str) -> Optional[str]:
+        text = self.local.get(key)
+        if text is not None:
+            metrics.increment("llm.cache.hits", tier="local")
+        return text
+
+    def _redis_result(self, key: str, text: Optional[str]) -> Optional[str]:
+        if text is None:
+            metrics.increment("llm.cache.misses")
+            return None
+        self.local.set(key, text)
+        metrics.increment("llm.cache.hits", tier="redis")
+        return text
+
+    def _set_local(self, key: str, text: str) -> bool:
+        """Store in the local tier; False if the entry shouldn't be cached at all"""
+        if not text:
+            return False
+        if len(text.encode("utf-8")) > self.max_entry_bytes:
+            metrics.increment("llm.cache.skipped_oversize")
+            return False
+        self.local.set(key, text)
+        return True
+
+    @staticmethod
+    def _decode(key: str, data: Optional[bytes]) -> Optional[str]:
+        if data is None:
+            return None
+        if not codec.is_encoded(data):
+            # Written as plain text before entries were encoded
+            return data.decode("utf-8")
+        try:
+            return codec.decode(data)
+        except CodecError as e:
+            logger.warning(f"LLM cache entry {key} could not be decoded: {e}")
+            return None
+
+    @staticmethod
+    def _redis():
+        try:
+            return get_binary_redis_client()
+        except RuntimeError:
+            # Outside an app context there is no Redis configuration
+            return None
+
+    @staticmethod
+    def _auto_pipeline():
+        try:
+            return get_auto_pipeline(binary=True)
+        except RuntimeError:
+            return None
@@ -1,6 +1,12 @@
-from typing import Dict, List, Optional, Set, Union, AsyncGenerator, Any
+from typing import Dict, List, Optional, Set, Union, AsyncGenerator, AsyncIterator, Any, Callable, Hashable
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
 import logging
 import os
+import threading
+import time
+import uuid
 from pydantic import BaseModel
 
 # LangChain imports
@@ -8,9 +14,42 @@ from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.language_models import BaseChatModel
+
+from backend.services.coalescing import SingleFlight
+from backend.services.execution_events import (
+    EXECUTION_FINISHED, EXECUTION_PROGRESS, EXECUTION_PROGRESS_INTERVAL, EXECUTION_STARTED, execution_event, execution_events
+)
+from backend.services.concurrency import ProviderLimiters, is_rate_limit_error
+from backend.services.hedging import FIRST_TOKEN_METRIC, hedge_deadline, race
+from backend.services.llm_cache import LLMResponseCache, CACHE_HIT, CACHE_MISS, CACHE_BYPASS, CACHE_SEMANTIC_HIT
+from backend.services.resilience import (
+    CircuitBreakers, CircuitOpenError, LLM_RETRY_MAX_ATTEMPTS,
+    backoff_delay, fallback_candidates, is_transient_error
+)
+from backend.services.semantic_cache import create_semantic_cache
+from backend.services.tokenizer import TokenUsage, tokenizer
+from backend.utils.metrics import metrics
+from backend.utils.rate_limiter import TokenBudgetLimiter, TokenReservation
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of pooled LangChain clients per process
+LLM_CLIENT_POOL_SIZE = int(os.environ.get("LLM_CLIENT_POOL_SIZE", 32))
+
+# Characters per chunk when replaying a cached response as a stream
+CACHE_REPLAY_CHUNK_SIZE = int(os.environ.get("LLM_CACHE_REPLAY_CHUNK_SIZE", 64))
+
+# Concurrent executions per provider within one batch
+BATCH_PROVIDER_CONCURRENCY = int(os.environ.get("BATCH_PROVIDER_CONCURRENCY", 4))
+
+# Environment variable holding the API key for each provider
+PROVIDER_API_KEY_ENV = {
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "google": "GOOGLE_API_KEY",
+}
+
 # Supported LLM providers and models (as per LangChain wrappers)
 SUPPORTED_PROVIDERS = {
     "openai": {
@@ -46,10 +85,125 @@ class PromptRequest(BaseModel):
     stream: bool = False
     system_prompt: Optional[str] = None
     tools: Optional[List[Dict[str, Any]]] = None
+    # None caches deterministic (temperature 0) requests only; True/False force it
+    cache: Optional[bool] = None
+    # Owner of the request; scopes the semantic cache per user
+    user_id: Optional[int] = None
+    # Saved prompt being executed, if any; routes live execution events
+    prompt_id: Optional[int] = None
+    # Models to try in order if the requested one fails (None uses LLM_FALLBACK_CHAINS)
+    fallback_models: Optional[List[str]] = None
+    # Whitelist fallbacks must belong to (e.g. the prompt's model_whitelist)
+    allowed_models: Optional[List[str]] = None
+    # Race a second call if the first token is slower than usual
+    hedge: bool = False
+    # Cut an oversize prompt to fit the context window instead of rejecting it
+    truncate: bool = False
+
+@dataclass
+class ExecutionResult:
+    """Outcome of an execution: the text (or chunk stream) plus how it was served"""
+    output: Union[str, AsyncIterator[str]]
+    model: str
+    cache_status: str = CACHE_BYPASS
+    # Filled in once the output is complete (at the end of a stream)
+    usage: Optional[TokenUsage] = None
+
+@dataclass
+class _TokenHold:
+    """
+    An execution's claim on the token budgets
+
+    Tokens are only reserved once the execution is about to call a
+    provider, and only charged if its own call ran: cache hits and
+    coalesced followers are free.
+    """
+    user_id: Optional[int]
+    provider: str
+    tokens: int
+    reservation: Optional[TokenReservation] = None
+    # Whether this execution's upstream call (rather than someone else's) produced the output
+    called: bool = False
+
+@dataclass
+class BatchItemResult:
+    """Outcome of one item in a batch execution"""
+    index: int
+    request: PromptRequest
+    result: Optional[ExecutionResult]
+    error: Optional[str]
+    execution_time_ms: int
+
+class LLMClientPool:
+    """
+    Bounded LRU pool of LangChain chat model instances.
+
+    Each pooled client owns its provider SDK and HTTP client, so reusing it
+    reuses keep-alive connections instead of paying connection setup and TLS
+    handshakes on every execution. Async HTTP clients are tied to the event
+    loop they first ran on, so keys include the running loop.
+    """
+
+    def __init__(self, max_size: int = LLM_CLIENT_POOL_SIZE):
+        self.max_size = max_size
+        self._clients: "OrderedDict[Hashable, BaseChatModel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], BaseChatModel]) -> BaseChatModel:
+        """
+        Get a pooled client, creating it with factory on a miss
+
+        Args:
+            key: Pool key for the client
+            factory: Callable building a new client
+
+        Returns:
+            BaseChatModel: The pooled client
+        """
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                metrics.increment('llm.client_pool.hits')
+                return client
+
+        client = factory()
+
+        with self._lock:
+            # Another caller may have created the same client meanwhile
+            existing = self._clients.get(key)
+            if existing is not None:
+                self._clients.move_to_end(key)
+                return existing
+            self._clients[key] = client
+            metrics.increment('llm.client_pool.misses')
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                metrics.increment('llm.client_pool.evictions')
+            metrics.set_gauge('llm.client_pool.size', len(self._clients))
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            metrics.set_gauge('llm.client_pool.size', 0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
 
 class LLMService:
     def __init__(self):
         self.providers = SUPPORTED_PROVIDERS
+        self.client_pool = LLMClientPool()
+        self.response_cache = LLMResponseCache()
+        self.semantic_cache = create_semantic_cache()
+        self.limiters = ProviderLimiters()
+        self.breakers = CircuitBreakers()
+        self.single_flight = SingleFlight()
+        self.tokenizer = tokenizer
+        self.token_budgets = TokenBudgetLimiter()
+        self.events = execution_events
         logger.info(f"LLMService initialized with {len(self.providers)} providers (LangChain)")
     
     def get_supported_providers(self) -> List[str]:
@@ -77,12 +231,13 @@ class LLMService:
             for provider, models in self.providers.items()
         }
     
-    def validate_model_whitelist(self, model_whitelist: List[str]) -> List[str]:
+    def validate_model_whitelist(self, model_whitelist: List[str], label: str = "whitelist") -> List[str]:
         """
         Validate a list of models against supported providers/models
         
         Args:
             model_whitelist: List of model identifiers (e.g., "openai:gpt-4")
+            label: Where the models came from, used in the error message
             
         Returns:
             List of valid model identifiers
@@ -117,7 +272,7 @@ class LLMService:
             valid_models.append(model_id)
             
         if invalid_models:
-            raise ValueError(f"Invalid models in whitelist: {', '.join(invalid_models)}")
+            raise ValueError(f"Invalid models in {label}: {', '.join(invalid_models)}")
             
         return valid_models
     
@@ -126,6 +281,36 @@ class LLMService:
         Execute a prompt with the specified model using LangChain wrappers.
         Supports streaming and non-streaming responses.
         """
+        result = await self.execute(request)
+        return result.output
+
+    async def execute(self, request: PromptRequest) -> ExecutionResult:
+        """
+        Execute a prompt and report how the response was produced.
+
+        Cacheable requests are answered from the exact-match response cache
+        when possible, then (if enabled) from the semantic cache of similar
+        prompts; cached responses are replayed as a chunk stream for
+        streaming requests.
+
+        Prompts are checked against the model's context window first. Before
+        a provider is called, their input tokens plus max_tokens are
+        reserved against the user's and provider's token budgets; cache hits
+        and requests coalesced onto another's call reserve nothing. The
+        result's usage (tokens and cost) is filled in once the output is
+        complete, and the reservation is then settled to the tokens the
+        provider actually processed.
+
+        Started, token-progress (streams only) and finished events are
+        published for the live execution stream.
+
+        Returns:
+            ExecutionResult with the text (or async chunk iterator) and cache status
+
+        Raises:
+            ContextWindowExceededError: If the prompt can't fit the model
+            TokenBudgetExceededError: If a token budget has no room for the request
+        """
         if ":" not in request.model:
             raise ValueError(f"Invalid model format: {request.model}. Expected format: provider:model")
         provider, model = request.model.split(":", 1)
@@ -133,34 +318,464 @@ class LLMService:
             raise ValueError(f"Unsupported provider: {provider}")
         if model not in self.providers[provider]["models"]:
             raise ValueError(f"Unsupported model for {provider}: {model}")
+        if request.fallback_models:
+            # Client-supplied fallbacks get the same checks as the requested model
+            self.validate_model_whitelist(request.fallback_models, "fallback_models")
 
-        # Prepare LangChain LLM instance
-        if provider == "openai":
-            llm = ChatOpenAI(
-                model=model,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                streaming=request.stream,
-                openai_api_key=os.environ.get("OPENAI_API_KEY"),
-            )
-        elif provider == "anthropic":
-            llm = ChatAnthropic(
-                model=model,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                streaming=request.stream,
-                anthropic_api_key=os.environ.get("ANTHROPIC_API_KEY"),
-            )
-        elif provider == "google":
-            llm = ChatGoogleGenerativeAI(
-                model=model,
-                temperature=request.temperature,
-                max_output_tokens=request.max_tokens,
-                streaming=request.stream,
-                google_api_key=os.environ.get("GOOGLE_API_KEY"),
-            )
+        request, input_tokens = self.tokenizer.preflight(request)
+        hold = _TokenHold(request.user_id, provider, input_tokens + request.max_tokens)
+        run_id = uuid.uuid4().hex
+        started = time.perf_counter()
+        await self._publish_event(EXECUTION_STARTED, request, run_id, model=request.model, stream=request.stream)
+        try:
+            result = await self._execute(request, hold)
+        except BaseException as e:
+            await self._settle(hold, 0)
+            await self._publish_finished(request, run_id, started, error=self._error_message(e))
+            raise
+        result.usage = TokenUsage(input_tokens=input_tokens)
+        if request.stream:
+            result.output = self._meter_stream(result, request, result.output, hold, run_id, started)
         else:
-            raise ValueError(f"Unsupported provider: {provider}")
+            await self._meter(result, request, result.output, hold)
+            await self._publish_finished(request, run_id, started, result)
+        return result
+
+    async def _execute(self, request: PromptRequest, hold: _TokenHold) -> ExecutionResult:
+        """Serve a validated request from cache or the provider"""
+        if not self.response_cache.is_cacheable(request):
+            route = {"model": request.model}
+            output = await self._call_coalesced(request, route, hold)
+            return self._routed_result(request, output, route, CACHE_BYPASS)
+
+        cache_key = self.response_cache.make_key(request)
+        cached = await self.response_cache.aget(cache_key)
+        if cached is not None:
+            output = self._replay_stream(cached) if request.stream else cached
+            return ExecutionResult(output=output, model=request.model, cache_status=CACHE_HIT)
+
+        if self.semantic_cache.enabled:
+            match = await self.semantic_cache.alookup(request)
+            if match is not None:
+                cached, similarity = match
+                logger.info(f"Semantic cache hit for {request.model} (similarity {similarity:.3f})")
+                output = self._replay_stream(cached) if request.stream else cached
+                return ExecutionResult(output=output, model=request.model, cache_status=CACHE_SEMANTIC_HIT)
+
+        route = {"model": request.model}
+        output = await self._call_coalesced(request, route, hold)
+        if request.stream:
+            output = self._cache_stream(cache_key, request, output, route)
+        elif route["model"] == request.model:
+            # Fallback answers are not cached under the requested model
+            await self._store_cached(cache_key, request, output)
+        return self._routed_result(request, output, route, CACHE_MISS)
+
+    def _routed_result(self, request: PromptRequest, output, route: Dict[str, str], cache_status: str) -> ExecutionResult:
+        """
+        Build the result of an upstream call
+
+        A stream only knows which model answered once it starts, so its
+        result's model is updated when the stream finishes.
+        """
+        result = ExecutionResult(output=output, model=route["model"], cache_status=cache_status)
+        if request.stream:
+            result.output = self._update_model_after_stream(result, route, output)
+        return result
+
+    @staticmethod
+    async def _update_model_after_stream(result: ExecutionResult, route: Dict[str, str], chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        async for chunk in chunks:
+            yield chunk
+        result.model = route["model"]
+
+    async def _meter(self, result: ExecutionResult, request: PromptRequest, text: str, hold: _TokenHold):
+        """Fill in output tokens and cost and settle the token reservation; cached and coalesced answers cost nothing"""
+        usage = result.usage
+        if result.model != request.model:
+            usage.input_tokens = self.tokenizer.count_messages(result.model, request.prompt, request.system_prompt)
+        usage.output_tokens = self.tokenizer.count(result.model, text)
+        if result.cache_status in (CACHE_HIT, CACHE_SEMANTIC_HIT) or not hold.called:
+            usage.cost = 0.0
+            await self._settle(hold, 0)
+        else:
+            usage.cost = self.tokenizer.cost(result.model, usage.input_tokens, usage.output_tokens)
+            await self._settle(hold, usage.input_tokens + usage.output_tokens)
+
+    async def _reserve(self, hold: _TokenHold):
+        """Reserve an execution's tokens, raising TokenBudgetExceededError if a budget is exhausted"""
+        if hold.reservation is None:
+            hold.reservation = await self.token_budgets.reserve_async(hold.user_id, hold.provider, hold.tokens)
+
+    async def _settle(self, hold: _TokenHold, actual_tokens: int):
+        if hold.reservation is not None:
+            await self.token_budgets.reconcile_async(hold.reservation, actual_tokens)
+
+    async def _meter_stream(
+        self,
+        result: ExecutionResult,
+        request: PromptRequest,
+        chunks: AsyncIterator[str],
+        hold: _TokenHold,
+        run_id: str,
+        started: float
+    ) -> AsyncIterator[str]:
+        collected = []
+        error = None
+        # Progress events count tokens incrementally, at most every EXECUTION_PROGRESS_INTERVAL
+        output_tokens, counted, last_progress = 0, 0, time.monotonic()
+        try:
+            async for chunk in chunks:
+                collected.append(chunk)
+                yield chunk
+                if time.monotonic() - last_progress >= EXECUTION_PROGRESS_INTERVAL:
+                    output_tokens += self.tokenizer.count(result.model, "".join(collected[counted:]))
+                    counted, last_progress = len(collected), time.monotonic()
+                    await self._publish_event(EXECUTION_PROGRESS, request, run_id, output_tokens=output_tokens)
+        except BaseException as e:
+            error = self._error_message(e)
+            raise
+        finally:
+            # An abandoned stream is charged for what it produced
+            await self._meter(result, request, "".join(collected), hold)
+            await self._publish_finished(request, run_id, started, result, error)
+
+    @staticmethod
+    def _error_message(error: BaseException) -> str:
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            return "cancelled"
+        return str(error) or type(error).__name__
+
+    async def _publish_event(self, event_type: str, request: PromptRequest, run_id: str, **fields):
+        await self.events.apublish(execution_event(event_type, request.user_id, request.prompt_id, run_id=run_id, **fields))
+
+    async def _publish_finished(
+        self,
+        request: PromptRequest,
+        run_id: str,
+        started: float,
+        result: Optional[ExecutionResult] = None,
+        error: Optional[str] = None
+    ):
+        await self._publish_event(
+            EXECUTION_FINISHED,
+            request,
+            run_id,
+            model=result.model if result is not None else request.model,
+            cache=result.cache_status if result is not None else None,
+            usage=result.usage.to_dict() if result is not None and result.usage is not None else None,
+            error=error,
+            execution_time_ms=int((time.perf_counter() - started) * 1000)
+        )
+
+    async def execute_batch(
+        self,
+        requests: List[PromptRequest],
+        provider_concurrency: int = BATCH_PROVIDER_CONCURRENCY
+    ) -> AsyncIterator[BatchItemResult]:
+        """
+        Execute many requests concurrently, yielding results as they complete.
+
+        At most provider_concurrency requests per provider are in flight at
+        once. Failures are reported per item rather than aborting the batch,
+        and closing the iterator cancels whatever is still running.
+
+        Args:
+            requests: Requests to execute (non-streaming)
+            provider_concurrency: In-flight limit per provider
+
+        Yields:
+            BatchItemResult for each request, in completion order
+        """
+        semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        async def run(index: int, request: PromptRequest) -> BatchItemResult:
+            provider = request.model.split(":", 1)[0]
+            semaphore = semaphores.setdefault(provider, asyncio.Semaphore(provider_concurrency))
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    result, error = await self.execute(request), None
+                except Exception as e:
+                    logger.warning(f"Batch item {index} ({request.model}) failed: {e}")
+                    result, error = None, str(e)
+                elapsed_ms = int((time.perf_counter() - started) * 1000)
+                return BatchItemResult(index, request, result, error, elapsed_ms)
+
+        tasks = [asyncio.ensure_future(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call_coalesced(self, request: PromptRequest, route: Dict[str, str], hold: _TokenHold) -> Union[str, AsyncIterator[str]]:
+        """
+        Share one upstream call between identical concurrent requests
+
+        Requests with the same output-determining fields (the response cache
+        key) join a single flight; streaming and non-streaming requests can
+        share one. Callers that opt out of caching get their own call.
+
+        Tokens are reserved before starting a flight, so an exhausted budget
+        is rejected up front; joining a flight already running in this
+        worker needs no reservation. Only the caller whose call led the
+        flight has hold.called set.
+        """
+        if not self.single_flight.enabled or request.cache is False:
+            await self._reserve(hold)
+            hold.called = True
+            return await self._call_resilient(request, route)
+
+        async def start():
+            # Normally reserved below; the flight may have ended between the check and the join
+            await self._reserve(hold)
+            hold.called = True
+            output = await self._call_resilient(request, route)
+            return output, route
+
+        key = self.response_cache.make_key(request)
+        if not self.single_flight.in_progress(key):
+            # Likely to lead (a flight in another worker is only found once joined; then it's refunded)
+            await self._reserve(hold)
+        flight = self.single_flight.join(key, start)
+        if request.stream:
+            return self._follow_flight(flight, route)
+        text = "".join([chunk async for chunk in flight.subscribe()])
+        route["model"] = flight.model or route["model"]
+        return text
+
+    @staticmethod
+    async def _follow_flight(flight, route: Dict[str, str]) -> AsyncIterator[str]:
+        async for chunk in flight.subscribe():
+            yield chunk
+        route["model"] = flight.model or route["model"]
+
+    async def _call_resilient(self, request: PromptRequest, route: Dict[str, str]) -> Union[str, AsyncIterator[str]]:
+        """
+        Call the requested model, retrying and falling back on transient failures
+
+        Models behind an open circuit breaker are skipped. Each model gets up
+        to LLM_RETRY_MAX_ATTEMPTS tries with jittered exponential backoff
+        before the next fallback candidate is tried. route["model"] is set to
+        the model that actually answered.
+
+        Raises:
+            CircuitOpenError: If every candidate's breaker is open
+        """
+        candidates = fallback_candidates(request.model, request.fallback_models, request.allowed_models)
+        if request.stream:
+            return self._stream_resilient(request, candidates, route)
+
+        last_error: Optional[BaseException] = None
+        for candidate in candidates:
+            candidate_request = request if candidate == request.model else request.model_copy(update={"model": candidate})
+            provider, model = candidate.split(":", 1)
+            for attempt in range(LLM_RETRY_MAX_ATTEMPTS):
+                allowed, retry_after = await self.breakers.allow(candidate)
+                if not allowed:
+                    metrics.increment("llm.breaker.rejected", model=candidate)
+                    last_error = last_error or CircuitOpenError(candidate, retry_after)
+                    break
+                served = candidate
+                try:
+                    hedge_model = self._hedge_target(request, candidate, attempt)
+                    if hedge_model is not None:
+                        output, served = await self._hedged(provider, model, candidate_request, hedge_model)
+                    else:
+                        output = await self._upstream(provider, model, candidate_request)
+                except Exception as e:
+                    if not is_transient_error(e):
+                        raise
+                    last_error = e
+                    await self.breakers.record_failure(candidate)
+                    await self._before_retry(candidate, attempt, e)
+                    continue
+                await self.breakers.record_success(served)
+                self._record_route(request, candidate, served, route)
+                return output
+        raise last_error
+
+    async def _stream_resilient(self, request: PromptRequest, candidates: List[str], route: Dict[str, str]) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of _call_resilient
+
+        Failures before the first chunk are retried and fall back like
+        non-streaming calls; once a chunk has been sent the stream is
+        committed to that model and later errors propagate.
+        """
+        last_error: Optional[BaseException] = None
+        for candidate in candidates:
+            candidate_request = request if candidate == request.model else request.model_copy(update={"model": candidate})
+            provider, model = candidate.split(":", 1)
+            for attempt in range(LLM_RETRY_MAX_ATTEMPTS):
+                allowed, retry_after = await self.breakers.allow(candidate)
+                if not allowed:
+                    metrics.increment("llm.breaker.rejected", model=candidate)
+                    last_error = last_error or CircuitOpenError(candidate, retry_after)
+                    break
+                emitted = False
+                served = candidate
+                try:
+                    hedge_model = self._hedge_target(request, candidate, attempt)
+                    if hedge_model is not None:
+                        chunks, served = await self._hedged(provider, model, candidate_request, hedge_model)
+                    else:
+                        chunks = await self._upstream(provider, model, candidate_request)
+                    async for chunk in chunks:
+                        if not emitted:
+                            emitted = True
+                            await self.breakers.record_success(served)
+                            self._record_route(request, candidate, served, route)
+                        yield chunk
+                except Exception as e:
+                    if emitted or not is_transient_error(e):
+                        raise
+                    last_error = e
+                    await self.breakers.record_failure(candidate)
+                    await self._before_retry(candidate, attempt, e)
+                    continue
+                if not emitted:
+                    await self.breakers.record_success(served)
+                    self._record_route(request, candidate, served, route)
+                return
+        raise last_error
+
+    async def _before_retry(self, candidate: str, attempt: int, error: BaseException):
+        """Back off before the next attempt at candidate, unless attempts are exhausted"""
+        if attempt + 1 >= LLM_RETRY_MAX_ATTEMPTS:
+            logger.warning(f"Giving up on {candidate} after {attempt + 1} attempts: {error}")
+            return
+        delay = backoff_delay(attempt)
+        metrics.increment("llm.retry.attempts", model=candidate)
+        logger.info(f"Retrying {candidate} in {delay:.2f}s after transient error: {error}")
+        await asyncio.sleep(delay)
+
+    def _hedge_target(self, request: PromptRequest, candidate: str, attempt: int) -> Optional[str]:
+        """
+        Model to hedge the first attempt at the requested model with, if any
+
+        Hedges go to the next model in the fallback chain (so they respect
+        the whitelist), or to the same model when there is no chain. Nothing
+        is hedged until the model has enough latency history for a deadline.
+        """
+        if not request.hedge or attempt > 0 or candidate != request.model:
+            return None
+        if hedge_deadline(candidate) is None:
+            return None
+        candidates = fallback_candidates(request.model, request.fallback_models, request.allowed_models)
+        return candidates[1] if len(candidates) > 1 else candidate
+
+    async def _hedged(self, provider: str, model: str, request: PromptRequest, hedge_model: str):
+        """
+        Call model, racing a call to hedge_model if the first token is late
+
+        Returns:
+            (output, model that answered)
+        """
+        hedge_request = request if hedge_model == request.model else request.model_copy(update={"model": hedge_model})
+        hedge_provider, hedge_name = hedge_model.split(":", 1)
+
+        async def start(provider_name, model_name, model_request):
+            output = await self._upstream(provider_name, model_name, model_request)
+            if model_request.stream:
+                # Race on the first chunk rather than on opening the stream
+                output = await self._prime_stream(output)
+            return output
+
+        async def start_hedge():
+            allowed, retry_after = await self.breakers.allow(hedge_model)
+            if not allowed:
+                # Never hedge onto a tripped model; the race falls back to the primary
+                raise CircuitOpenError(hedge_model, retry_after)
+            return await start(hedge_provider, hedge_name, hedge_request)
+
+        async def discard(output):
+            if request.stream:
+                await output.aclose()
+
+        output, hedge_won = await race(
+            request.model,
+            lambda: start(provider, model, request),
+            start_hedge,
+            hedge_deadline(request.model),
+            discard
+        )
+        return output, hedge_model if hedge_won else request.model
+
+    @staticmethod
+    async def _prime_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Wait for a stream's first chunk, returning a stream that replays it"""
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+
+        async def primed():
+            try:
+                if first is None:
+                    return
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+        return primed()
+
+    @staticmethod
+    def _record_route(request: PromptRequest, candidate: str, served: str, route: Dict[str, str]):
+        route["model"] = served
+        if candidate != request.model:
+            metrics.increment("llm.fallback.used", requested=request.model, served=candidate)
+            logger.warning(f"Served {request.model} request with fallback model {candidate}")
+
+    async def _upstream(self, provider: str, model: str, request: PromptRequest) -> Union[str, AsyncIterator[str]]:
+        """
+        Call the provider within its adaptive concurrency limit
+
+        The slot is held until a non-streaming call returns or a stream is
+        exhausted or closed, and the outcome (latency or 429) adjusts the
+        provider's limit.
+        """
+        limiter = self.limiters.get(provider)
+        await limiter.acquire(request.user_id)
+        started = time.perf_counter()
+        try:
+            output = await self._call_provider(provider, model, request)
+        except BaseException as e:
+            limiter.release(request.user_id, rate_limited=is_rate_limit_error(e))
+            raise
+        if not request.stream:
+            latency_ms = (time.perf_counter() - started) * 1000
+            metrics.observe(FIRST_TOKEN_METRIC, latency_ms, model=request.model)
+            limiter.release(request.user_id, latency_ms=latency_ms)
+            return output
+        return self._release_after_stream(limiter, request, started, output)
+
+    @staticmethod
+    async def _release_after_stream(limiter, request: PromptRequest, started: float, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Hold a limiter slot for the lifetime of a stream"""
+        latency_ms = None
+        rate_limited = False
+        try:
+            async for chunk in chunks:
+                if latency_ms is None:
+                    # Judge streams by time to first chunk, not total length
+                    latency_ms = (time.perf_counter() - started) * 1000
+                    metrics.observe(FIRST_TOKEN_METRIC, latency_ms, model=request.model)
+                yield chunk
+        except Exception as e:
+            latency_ms = None
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            limiter.release(request.user_id, latency_ms=latency_ms, rate_limited=rate_limited)
+
+    async def _call_provider(self, provider: str, model: str, request: PromptRequest) -> Union[str, AsyncIterator[str]]:
+        """Call the provider through a pooled client"""
+        # Get a pooled LangChain LLM instance with per-call parameters bound
+        llm = self._get_llm(provider, model, request)
 
         # Prepare messages
         messages = []
@@ -183,5 +798,73 @@ class LLMService:
             return response.content
         return str(response)
 
+    async def _cache_stream(
+        self,
+        cache_key: str,
+        request: PromptRequest,
+        chunks: AsyncIterator[str],
+        route: Dict[str, str]
+    ) -> AsyncIterator[str]:
+        """Pass chunks through and cache the full text once the stream completes"""
+        collected = []
+        async for chunk in chunks:
+            collected.append(chunk)
+            yield chunk
+        if route["model"] == request.model:
+            await self._store_cached(cache_key, request, "".join(collected))
+
+    async def _store_cached(self, cache_key: str, request: PromptRequest, text: str):
+        await self.response_cache.aset(cache_key, text)
+        if self.semantic_cache.enabled:
+            await self.semantic_cache.astore(request, text)
+
+    @staticmethod
+    async def _replay_stream(text: str) -> AsyncIterator[str]:
+        """Replay a cached response as a stream of chunks"""
+        for start in range(0, len(text), CACHE_REPLAY_CHUNK_SIZE):
+            yield text[start:start + CACHE_REPLAY_CHUNK_SIZE]
+
+    def _get_llm(self, provider: str, model: str, request: PromptRequest):
+        """
+        Get a pooled client for provider/model with the request's temperature
+        and max_tokens bound as per-call overrides
+        """
+        api_key = os.environ.get(PROVIDER_API_KEY_ENV[provider])
+        key = (provider, model, api_key, request.stream, id(asyncio.get_running_loop()))
+        llm = self.client_pool.get(
+            key,
+            lambda: self._create_llm(provider, model, api_key, request.stream)
+        )
+
+        if provider == "google":
+            return llm.bind(generation_config={
+                "temperature": request.temperature,
+                "max_output_tokens": request.max_tokens,
+            })
+        return llm.bind(temperature=request.temperature, max_tokens=request.max_tokens)
+
+    def _create_llm(self, provider: str, model: str, api_key: Optional[str], streaming: bool) -> BaseChatModel:
+        """Construct a new LangChain chat model for a provider"""
+        logger.info(f"Creating pooled {provider} client for {model} (streaming={streaming})")
+        if provider == "openai":
+            return ChatOpenAI(
+                model=model,
+                streaming=streaming,
+                openai_api_key=api_key,
+            )
+        elif provider == "anthropic":
+            return ChatAnthropic(
+                model=model,
+                streaming=streaming,
+                anthropic_api_key=api_key,
+            )
+        elif provider == "google":
+            return ChatGoogleGenerativeAI(
+                model=model,
+                streaming=streaming,
+                google_api_key=api_key,
+            )
+        raise ValueError(f"Unsupported provider: {provider}")
+
 # Create a singleton instance
 llm_service = LLMService() 
\ No newline at end of file
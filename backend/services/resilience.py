@@ -0,0 +1,238 @@
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import redis
+
+from backend.services.concurrency import is_rate_limit_error
+from backend.utils.metrics import metrics
+from backend.utils.redis_client import get_auto_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker settings
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_TIMEOUT = float(os.environ.get("LLM_BREAKER_RESET_TIMEOUT", 30))
+
+# Retry settings for transient provider errors
+LLM_RETRY_MAX_ATTEMPTS = int(os.environ.get("LLM_RETRY_MAX_ATTEMPTS", 3))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", 8))
+
+# Default fallback chains, e.g. {"anthropic:claude-3-haiku": ["openai:gpt-3.5-turbo"]}
+LLM_FALLBACK_CHAINS: Dict[str, List[str]] = json.loads(os.environ.get("LLM_FALLBACK_CHAINS") or "{}")
+
+# Breaker states (also the values of the llm.breaker.state gauge)
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_GAUGE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Exception class names that indicate a temporary provider problem
+_TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "OverloadedError",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "ConnectError",
+    "ReadTimeout",
+    "ConnectTimeout",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised when every candidate model is behind an open circuit breaker"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Circuit breaker open for {model}; retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether an error is worth retrying (rate limits, timeouts, 5xx, connection failures)"""
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and 500 <= status < 600:
+        return True
+    return type(error).__name__ in _TRANSIENT_ERROR_NAMES
+
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers keyed by model identifier, shared across workers via Redis.
+
+    A breaker opens after failure_threshold consecutive transient failures
+    and rejects calls for reset_timeout seconds. It then lets a single probe
+    through (half-open): success closes it, failure re-opens it. State lives
+    in a Redis hash per model so every worker fails fast together; when Redis
+    is unavailable each worker falls back to its own in-process state.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT,
+        key_prefix: str = "llm_breaker",
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.key_prefix = key_prefix
+        # name -> [consecutive failures, opened_at or None, probe_taken_at or None]
+        self._local: Dict[str, list] = {}
+        # Models this worker has seen Redis breaker state for, so successes can skip the DEL
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    async def allow(self, name: str) -> Tuple[bool, float]:
+        """
+        Whether a call to name may proceed
+
+        Returns:
+            (allowed, seconds until the breaker may let a probe through)
+        """
+        pipeline = self._redis()
+        if pipeline is not None:
+            try:
+                return await self._allow_redis(pipeline, name)
+            except redis.RedisError as e:
+                logger.warning(f"Circuit breaker Redis read failed, using local state: {e}")
+        return self._allow_local(name)
+
+    async def record_success(self, name: str):
+        pipeline = self._redis()
+        # Most successes follow a clean allow(); only clear state that was seen
+        if pipeline is not None and name in self._seen:
+            try:
+                await pipeline.execute_command("DEL", self._key(name), self._probe_key(name))
+                self._seen.discard(name)
+            except redis.RedisError as e:
+                logger.warning(f"Circuit breaker Redis write failed: {e}")
+        with self._lock:
+            self._local.pop(name, None)
+        self._publish(name, CLOSED)
+
+    async def record_failure(self, name: str):
+        pipeline = self._redis()
+        if pipeline is not None:
+            try:
+                await self._failure_redis(pipeline, name)
+            except redis.RedisError as e:
+                logger.warning(f"Circuit breaker Redis write failed: {e}")
+        with self._lock:
+            state = self._local.setdefault(name, [0, None, None])
+            state[0] += 1
+            if state[0] >= self.failure_threshold or state[1] is not None:
+                state[1] = time.time()
+                state[2] = None
+                opened = True
+            else:
+                opened = False
+        if opened:
+            self._publish(name, OPEN)
+
+    def _allow_local(self, name: str) -> Tuple[bool, float]:
+        with self._lock:
+            state = self._local.get(name)
+            if state is None or state[1] is None:
+                return True, 0.0
+            now = time.time()
+            remaining = state[1] + self.reset_timeout - now
+            if remaining > 0:
+                return False, remaining
+            # Half-open: one probe at a time, re-offered if a probe goes missing
+            if state[2] is not None and now - state[2] < self.reset_timeout:
+                return False, self.reset_timeout - (now - state[2])
+            state[2] = now
+        self._publish(name, HALF_OPEN)
+        return True, 0.0
+
+    async def _allow_redis(self, pipeline, name: str) -> Tuple[bool, float]:
+        opened_at, failures = await pipeline.execute_command("HMGET", self._key(name), "opened_at", "failures")
+        if opened_at is None and failures is None:
+            return True, 0.0
+        self._seen.add(name)
+        if opened_at is None:
+            # Failing, but not yet tripped
+            return True, 0.0
+        remaining = float(opened_at) + self.reset_timeout - time.time()
+        if remaining > 0:
+            self._publish(name, OPEN)
+            return False, remaining
+        # Exactly one worker wins the half-open probe
+        probe = await pipeline.execute_command("SET", self._probe_key(name), 1, "NX", "EX", max(int(self.reset_timeout), 1))
+        if probe:
+            self._publish(name, HALF_OPEN)
+            return True, 0.0
+        return False, self.reset_timeout
+
+    async def _failure_redis(self, pipeline, name: str):
+        key = self._key(name)
+        self._seen.add(name)
+        # Sent in the same flush, so the pair costs one round-trip
+        failures, was_open = await asyncio.gather(
+            pipeline.execute_command("HINCRBY", key, "failures", 1),
+            pipeline.execute_command("HEXISTS", key, "opened_at"),
+        )
+        # Forget stale failure streaks and breakers nobody probes any more
+        commands = [("EXPIRE", key, int(self.reset_timeout * 10))]
+        if failures >= self.failure_threshold or was_open:
+            commands[:0] = [("HSET", key, "opened_at", time.time()), ("DEL", self._probe_key(name))]
+            logger.warning(f"Circuit breaker opened for {name} after {failures} consecutive failures")
+        await asyncio.gather(*(pipeline.execute_command(*command) for command in commands))
+
+    def _publish(self, name: str, state: str):
+        metrics.set_gauge("llm.breaker.state", _STATE_GAUGE[state], model=name)
+
+    def _key(self, name: str) -> str:
+        return f"{self.key_prefix}:{name}"
+
+    def _probe_key(self, name: str) -> str:
+        return f"{self.key_prefix}:{name}:probe"
+
+    @staticmethod
+    def _redis():
+        # Breakers are checked on the event loop, so use that loop's auto-pipeline
+        try:
+            return get_auto_pipeline()
+        except RuntimeError:
+            # Outside an app context there is no Redis configuration
+            return None
+
+
+def fallback_candidates(
+    model: str,
+    fallback_models: Optional[List[str]] = None,
+    allowed_models: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Models to try for a request, in order
+
+    The requested model comes first, followed by the request's fallback
+    chain (or the configured default chain for the model). Fallbacks outside
+    allowed_models (the prompt whitelist) are dropped.
+    """
+    chain = fallback_models if fallback_models is not None else LLM_FALLBACK_CHAINS.get(model, [])
+    candidates = [model]
+    for candidate in chain:
+        if candidate in candidates:
+            continue
+        if allowed_models and candidate not in allowed_models:
+            continue
+        candidates.append(candidate)
+    return candidates
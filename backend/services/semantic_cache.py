@@ -0,0 +1,287 @@
+from typing import Dict, Hashable, List, Optional, Protocol, Tuple
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from backend.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache settings
+LLM_SEMANTIC_CACHE_ENABLED = os.environ.get("LLM_SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("LLM_SEMANTIC_CACHE_THRESHOLD", 0.95))
+LLM_SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_SEMANTIC_CACHE_MAX_ENTRIES", 512))
+LLM_SEMANTIC_CACHE_MAX_AGE = int(os.environ.get("LLM_SEMANTIC_CACHE_MAX_AGE", 86400))
+LLM_SEMANTIC_CACHE_SNAPSHOT_PATH = os.environ.get("LLM_SEMANTIC_CACHE_SNAPSHOT_PATH")
+
+
+class Embedder(Protocol):
+    """
+    Turns texts into L2-normalized vectors (one row per text)
+
+    Embedders that set cheap = True are run on the event loop; others (e.g.
+    model-backed ones) run in the default executor.
+    """
+
+    dim: int
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder:
+    """
+    Local, dependency-free embedder using hashed word and character n-grams.
+
+    It is not a language model: it recognises rewordings that share most of
+    their words and spelling (whitespace, casing, punctuation, small edits),
+    which is what trivially reworded duplicate prompts look like.
+    """
+
+    _token_pattern = re.compile(r"\w+")
+    cheap = True
+
+    def __init__(self, dim: int = 1024, char_ngram: int = 3):
+        self.dim = dim
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> List[str]:
+        words = self._token_pattern.findall(text.lower())
+        features = [f"w:{word}" for word in words]
+        joined = " ".join(words)
+        n = self.char_ngram
+        features.extend(f"c:{joined[i:i + n]}" for i in range(max(len(joined) - n + 1, 0)))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                # Use the top bit as a sign so collisions tend to cancel out
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dim] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SemanticIndex:
+    """Nearest-neighbour index of prompt vectors and cached responses for one scope"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.created_at = np.zeros(0, dtype=np.float64)
+        self.responses: List[str] = []
+
+    def __len__(self):
+        return len(self.responses)
+
+    def search(self, vector: np.ndarray) -> Tuple[int, float]:
+        """Return (row, cosine similarity) of the closest entry"""
+        scores = self.vectors @ vector
+        row = int(np.argmax(scores))
+        return row, float(scores[row])
+
+    def add(self, vector: np.ndarray, response: str, created_at: float):
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+        self.created_at = np.append(self.created_at, created_at)
+        self.responses.append(response)
+
+    def evict(self, max_entries: int, max_age: float, now: float) -> int:
+        """Drop entries older than max_age, then the oldest beyond max_entries"""
+        keep = self.created_at > now - max_age
+        if keep.sum() > max_entries:
+            newest = np.argsort(self.created_at)[-max_entries:]
+            keep = np.zeros_like(keep)
+            keep[newest] = True
+        dropped = int(len(keep) - keep.sum())
+        if dropped:
+            self.vectors = self.vectors[keep]
+            self.created_at = self.created_at[keep]
+            self.responses = [r for r, k in zip(self.responses, keep) if k]
+        return dropped
+
+
+class SemanticCache:
+    """
+    Similarity-based response cache for near-duplicate prompts.
+
+    Each scope (user, model and the non-prompt request parameters) has its own
+    index, so users never see each other's responses and a response is only
+    reused for requests that differ in prompt wording alone. Anonymous
+    requests have no scope and are never looked up or stored.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        threshold: float = LLM_SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = LLM_SEMANTIC_CACHE_MAX_ENTRIES,
+        max_age: float = LLM_SEMANTIC_CACHE_MAX_AGE,
+        enabled: bool = LLM_SEMANTIC_CACHE_ENABLED,
+    ):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.enabled = enabled
+        self._indexes: Dict[Hashable, SemanticIndex] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    @staticmethod
+    def scope_for(request) -> Optional[str]:
+        """Scope key: user plus every request field except the prompt text; None for anonymous requests"""
+        if request.user_id is None:
+            return None
+        params = json.dumps({
+            "system_prompt": request.system_prompt or "",
+            "temperature": round(float(request.temperature), 4),
+            "max_tokens": request.max_tokens,
+            "tools": request.tools or [],
+        }, sort_keys=True, separators=(",", ":"))
+        params_hash = hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+        return f"{request.user_id}|{request.model}|{params_hash}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        return self.embedder.embed([text])[0].astype(np.float32)
+
+    async def _aembed(self, text: str) -> np.ndarray:
+        if getattr(self.embedder, "cheap", False):
+            return self._embed(text)
+        return await asyncio.get_running_loop().run_in_executor(None, self._embed, text)
+
+    def lookup(self, request) -> Optional[Tuple[str, float]]:
+        """
+        Find a cached response for a similar prompt in the request's scope
+
+        Returns:
+            (response, similarity) above the threshold, or None
+        """
+        scope = self.scope_for(request)
+        if scope is None or scope not in self._indexes:
+            return self._search(scope, None)
+        return self._search(scope, self._embed(request.prompt))
+
+    async def alookup(self, request) -> Optional[Tuple[str, float]]:
+        """lookup() for coroutines: slow embedders run off the event loop"""
+        scope = self.scope_for(request)
+        if scope is None or scope not in self._indexes:
+            return self._search(scope, None)
+        return self._search(scope, await self._aembed(request.prompt))
+
+    def store(self, request, response: str):
+        """Add a prompt/response pair to the request's scope"""
+        scope = self.scope_for(request)
+        if scope is None or not response:
+            return
+        self._add(scope, self._embed(request.prompt), response)
+
+    async def astore(self, request, response: str):
+        """store() for coroutines"""
+        scope = self.scope_for(request)
+        if scope is None or not response:
+            return
+        self._add(scope, await self._aembed(request.prompt), response)
+
+    def _search(self, scope: Optional[str], vector: Optional[np.ndarray]) -> Optional[Tuple[str, float]]:
+        """Match an already-embedded prompt (None when there's nothing to search) in a scope"""
+        if scope is None:
+            return None
+        with self._lock:
+            self.lookups += 1
+            index = self._indexes.get(scope)
+            if index is not None:
+                index.evict(self.max_entries, self.max_age, time.time())
+            if not index or vector is None:
+                return self._record(hit=False)
+            row, score = index.search(vector)
+            if score < self.threshold:
+                return self._record(hit=False)
+            self._record(hit=True)
+            return index.responses[row], score
+
+    def _add(self, scope: str, vector: np.ndarray, response: str):
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = self._indexes[scope] = SemanticIndex(self.embedder.dim)
+            index.add(vector, response, time.time())
+            index.evict(self.max_entries, self.max_age, time.time())
+            metrics.set_gauge("llm.semantic_cache.entries", sum(len(i) for i in self._indexes.values()))
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+            metrics.increment("llm.semantic_cache.hits")
+        else:
+            metrics.increment("llm.semantic_cache.misses")
+        metrics.set_gauge("llm.semantic_cache.hit_rate", round(self.hits / self.lookups, 4))
+        return None
+
+    def save(self, path: str):
+        """Snapshot every index to a single .npz file"""
+        with self._lock:
+            arrays = {}
+            manifest = []
+            for i, (scope, index) in enumerate(self._indexes.items()):
+                arrays[f"vectors_{i}"] = index.vectors
+                arrays[f"created_at_{i}"] = index.created_at
+                manifest.append({"scope": scope, "responses": index.responses})
+        arrays["manifest"] = np.array(json.dumps({"dim": self.embedder.dim, "indexes": manifest}))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved semantic cache snapshot with {len(manifest)} scopes to {path}")
+
+    def load(self, path: str):
+        """Restore indexes from a snapshot written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            manifest = json.loads(str(data["manifest"]))
+            if manifest["dim"] != self.embedder.dim:
+                raise ValueError(f"Snapshot dimension {manifest['dim']} does not match embedder dimension {self.embedder.dim}")
+            indexes = {}
+            for i, entry in enumerate(manifest["indexes"]):
+                index = SemanticIndex(self.embedder.dim)
+                index.vectors = data[f"vectors_{i}"].astype(np.float32)
+                index.created_at = data[f"created_at_{i}"]
+                index.responses = entry["responses"]
+                indexes[entry["scope"]] = index
+        with self._lock:
+            self._indexes = indexes
+        logger.info(f"Loaded semantic cache snapshot with {len(indexes)} scopes from {path}")
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self.lookups = 0
+            self.hits = 0
+
+
+def create_semantic_cache() -> SemanticCache:
+    """
+    Create the process semantic cache, restoring and persisting it when
+    LLM_SEMANTIC_CACHE_SNAPSHOT_PATH is set
+    """
+    semantic_cache = SemanticCache()
+    path = LLM_SEMANTIC_CACHE_SNAPSHOT_PATH
+    if semantic_cache.enabled and path:
+        if os.path.exists(path):
+            try:
+                semantic_cache.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable semantic cache snapshot {path}: {e}")
+        atexit.register(semantic_cache.save, path)
+    return semantic_cache
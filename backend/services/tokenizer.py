@@ -0,0 +1,240 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import tiktoken
+
+from backend.utils.lru import LRUCache
+from backend.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of cached token counts (stored prompt texts are counted once)
+LLM_TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("LLM_TOKEN_COUNT_CACHE_SIZE", 4096))
+
+# Seconds to wait before retrying an encoding that failed to load
+LLM_TOKENIZER_RETRY_INTERVAL = float(os.environ.get("LLM_TOKENIZER_RETRY_INTERVAL", 300))
+
+# Chat formatting overhead per message and for priming the reply (OpenAI's accounting)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Characters per token when no tokenizer is available
+FALLBACK_CHARS_PER_TOKEN = 4
+
+# Context window (input + output tokens) per model
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "openai:gpt-3.5-turbo": 16385,
+    "openai:gpt-4": 8192,
+    "openai:gpt-4-turbo": 128000,
+    "openai:gpt-4o": 128000,
+    "anthropic:claude-2": 100000,
+    "anthropic:claude-3-opus": 200000,
+    "anthropic:claude-3-sonnet": 200000,
+    "anthropic:claude-3-haiku": 200000,
+    "google:gemini-pro": 32760,
+    "google:gemini-pro-vision": 16384,
+    "google:gemini-ultra": 32760,
+}
+
+# USD per million (input, output) tokens; extend or override with LLM_PRICING
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "openai:gpt-3.5-turbo": (0.50, 1.50),
+    "openai:gpt-4": (30.00, 60.00),
+    "openai:gpt-4-turbo": (10.00, 30.00),
+    "openai:gpt-4o": (5.00, 15.00),
+    "anthropic:claude-2": (8.00, 24.00),
+    "anthropic:claude-3-opus": (15.00, 75.00),
+    "anthropic:claude-3-sonnet": (3.00, 15.00),
+    "anthropic:claude-3-haiku": (0.25, 1.25),
+    "google:gemini-pro": (0.50, 1.50),
+    "google:gemini-pro-vision": (0.50, 1.50),
+}
+MODEL_PRICING.update({
+    model: tuple(prices)
+    for model, prices in json.loads(os.environ.get("LLM_PRICING") or "{}").items()
+})
+
+
+class ContextWindowExceededError(ValueError):
+    """Raised when a prompt cannot fit the model's context window"""
+
+
+@dataclass
+class TokenUsage:
+    """Token counts and cost (USD) of one execution"""
+    input_tokens: int
+    output_tokens: Optional[int] = None
+    cost: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return asdict(self)
+
+
+class Tokenizer:
+    """
+    Token counting, context-window checks and cost estimation.
+
+    OpenAI models are counted with their own tiktoken encoding. Anthropic
+    and Google don't publish local tokenizers, so their counts use
+    cl100k_base as an estimate. If an encoding can't be loaded (tiktoken
+    downloads them on first use) counts fall back to a characters-per-token
+    heuristic and the load is retried after retry_interval seconds. Call
+    preload() at startup so the downloads don't happen on a request.
+    Encoders are created once per encoding and counts are kept in an LRU,
+    so stored prompt texts are only tokenized once.
+    """
+
+    def __init__(self, max_cached_counts: int = LLM_TOKEN_COUNT_CACHE_SIZE, retry_interval: float = LLM_TOKENIZER_RETRY_INTERVAL):
+        self.retry_interval = retry_interval
+        self._encoders: Dict[str, tiktoken.Encoding] = {}
+        # Encoding name -> when it last failed to load
+        self._failures: Dict[str, float] = {}
+        self._counts = LRUCache(max_entries=max_cached_counts)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encoding_name(model_id: str) -> str:
+        provider, _, model = model_id.partition(":")
+        if provider == "openai":
+            try:
+                return tiktoken.encoding_name_for_model(model)
+            except KeyError:
+                pass
+        return "cl100k_base"
+
+    def encoder_for(self, model_id: str) -> Optional[tiktoken.Encoding]:
+        """Get the (cached) encoder for a model, or None if it can't be loaded"""
+        return self._load(self.encoding_name(model_id))
+
+    def preload(self) -> List[str]:
+        """
+        Load the encodings of every known model
+
+        Returns:
+            list: Names of the encodings that could not be loaded
+        """
+        names = sorted({self.encoding_name(model_id) for model_id in CONTEXT_WINDOWS})
+        return [name for name in names if self._load(name) is None]
+
+    def _load(self, name: str) -> Optional[tiktoken.Encoding]:
+        with self._lock:
+            encoder = self._encoders.get(name)
+            failed_at = self._failures.get(name)
+        if encoder is not None:
+            return encoder
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+            return None
+        try:
+            encoder = tiktoken.get_encoding(name)
+        except Exception as e:
+            logger.warning(f"Tokenizer {name} unavailable, estimating token counts: {e}")
+            with self._lock:
+                self._failures[name] = time.monotonic()
+            return None
+        with self._lock:
+            self._encoders[name] = encoder
+            self._failures.pop(name, None)
+        return encoder
+
+    def count(self, model_id: str, text: str) -> int:
+        """Count the tokens in text for a model"""
+        if not text:
+            return 0
+        encoder = self.encoder_for(model_id)
+        encoding = encoder.name if encoder is not None else "estimate"
+        key = (encoding, hashlib.sha1(text.encode("utf-8")).digest())
+        tokens = self._counts.get(key)
+        if tokens is not None:
+            metrics.increment("llm.tokenizer.cache_hits")
+            return tokens
+        if encoder is not None:
+            tokens = len(encoder.encode(text, disallowed_special=()))
+        else:
+            tokens = math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+        self._counts.set(key, tokens)
+        return tokens
+
+    def count_messages(self, model_id: str, prompt: str, system_prompt: Optional[str] = None) -> int:
+        """Count the input tokens of a chat request, including formatting overhead"""
+        tokens = self.count(model_id, prompt) + MESSAGE_OVERHEAD_TOKENS
+        if system_prompt:
+            tokens += self.count(model_id, system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        return tokens + REPLY_OVERHEAD_TOKENS
+
+    def truncate(self, model_id: str, text: str, max_tokens: int) -> str:
+        """Keep the first max_tokens tokens of text"""
+        if max_tokens <= 0:
+            return ""
+        encoder = self.encoder_for(model_id)
+        if encoder is None:
+            return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN]
+        tokens = encoder.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+
+    @staticmethod
+    def context_window(model_id: str) -> Optional[int]:
+        return CONTEXT_WINDOWS.get(model_id)
+
+    @staticmethod
+    def cost(model_id: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        """Cost in USD, or None for models without pricing"""
+        prices = MODEL_PRICING.get(model_id)
+        if prices is None:
+            return None
+        input_price, output_price = prices
+        return round((input_tokens * input_price + output_tokens * output_price) / 1_000_000, 6)
+
+    def preflight(self, request):
+        """
+        Check a request against its model's context window before calling out
+
+        max_tokens is lowered when prompt plus requested output would
+        overflow the window. A prompt that doesn't fit at all is rejected,
+        or cut down if request.truncate is set (keeping room for at least a
+        quarter of the window, or max_tokens if smaller, as output).
+
+        Returns:
+            (request, possibly adjusted; input token count)
+
+        Raises:
+            ContextWindowExceededError: If the prompt can't fit
+        """
+        input_tokens = self.count_messages(request.model, request.prompt, request.system_prompt)
+        window = self.context_window(request.model)
+        if window is None:
+            return request, input_tokens
+
+        updates = {}
+        if input_tokens >= window:
+            if not request.truncate:
+                metrics.increment("llm.preflight.rejected", model=request.model)
+                raise ContextWindowExceededError(
+                    f"Prompt is {input_tokens} tokens but {request.model} has a {window}-token context window"
+                )
+            reserve = min(request.max_tokens, window // 4)
+            overhead = input_tokens - self.count(request.model, request.prompt)
+            updates["prompt"] = self.truncate(request.model, request.prompt, window - reserve - overhead)
+            input_tokens = self.count_messages(request.model, updates["prompt"], request.system_prompt)
+            if input_tokens >= window:
+                raise ContextWindowExceededError(f"System prompt alone exceeds the {request.model} context window")
+            metrics.increment("llm.preflight.truncated", model=request.model)
+            logger.info(f"Truncated prompt for {request.model} to {input_tokens} tokens")
+
+        if input_tokens + request.max_tokens > window:
+            updates["max_tokens"] = window - input_tokens
+            metrics.increment("llm.preflight.max_tokens_lowered", model=request.model)
+
+        if updates:
+            request = request.model_copy(update=updates)
+        return request, input_tokens
+
+
+# Process-wide tokenizer shared by the service and API
+tokenizer = Tokenizer()
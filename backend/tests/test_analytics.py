@@ -0,0 +1,118 @@
+import pytest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend.utils.analytics import AnalyticsQueue
+from backend.utils.metrics import metrics
+
+class StubPostHog:
+    """Local HTTP server recording batch requests, optionally failing or stalling them"""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.gate = threading.Event()
+        self.gate.set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.gate.wait(5)
+                status = 503 if stub.fail else 200
+                if status == 200:
+                    stub.batches.append((self.path, body))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def events(self):
+        return [event['event'] for _, body in self.batches for event in body['batch']]
+
+@pytest.fixture
+def posthog():
+    stub = StubPostHog()
+    metrics.reset()
+    yield stub
+    stub.gate.set()
+    stub.server.shutdown()
+
+def event(name):
+    return {'event': name, 'properties': {}, 'distinct_id': 'u1'}
+
+def test_events_are_sent_in_batches(posthog):
+    analytics = AnalyticsQueue(posthog.url, 'key', batch_size=3, flush_interval=0.2, spool_dir=None)
+    for i in range(5):
+        assert analytics.enqueue(event(f'e{i}'))
+    assert analytics.flush(5)
+
+    assert [path for path, _ in posthog.batches] == ['/batch/', '/batch/']
+    assert posthog.batches[0][1]['api_key'] == 'key'
+    assert posthog.events() == ['e0', 'e1', 'e2', 'e3', 'e4']
+    assert metrics.counter('analytics.sent') == 5
+
+def test_sampling_and_overflow_are_counted(posthog):
+    analytics = AnalyticsQueue(
+        posthog.url, 'key', max_events=2, batch_size=1, flush_interval=0,
+        sample_rates={'api_request': 0.0}, spool_dir=None
+    )
+    assert not analytics.enqueue(event('api_request'))
+
+    # Stall PostHog: one batch in flight, two queued, the rest overflow
+    posthog.gate.clear()
+    results = [analytics.enqueue(event(f'e{i}')) for i in range(5)]
+    posthog.gate.set()
+    assert analytics.flush(5)
+
+    assert metrics.counter('analytics.sampled_out', event='api_request') == 1
+    assert results.count(False) == metrics.counter('analytics.dropped', reason='overflow') >= 1
+    assert posthog.events() == [f'e{i}' for i, sent in enumerate(results) if sent]
+
+def test_outage_spools_batches_and_replays_them_in_order(posthog, tmp_path):
+    analytics = AnalyticsQueue(
+        posthog.url, 'key', batch_size=2, flush_interval=0, retry_interval=0, spool_dir=str(tmp_path)
+    )
+    posthog.fail = True
+    for i in range(4):
+        analytics.enqueue(event(f'e{i}'))
+        assert analytics.flush(5)
+    assert analytics.spool.pending()
+    assert metrics.counter('analytics.spooled') == 4
+
+    posthog.fail = False
+    analytics.enqueue(event('e4'))
+    assert analytics.flush(5)
+
+    assert posthog.events() == ['e4', 'e0', 'e1', 'e2', 'e3']
+    assert not analytics.spool.pending()
+    assert metrics.counter('analytics.replayed') == 4
+
+def test_backlog_is_replayed_gradually_while_idle(posthog, tmp_path):
+    analytics = AnalyticsQueue(
+        posthog.url, 'key', batch_size=1, flush_interval=0.05, retry_interval=0,
+        spool_dir=str(tmp_path), replay_batches=1
+    )
+    posthog.fail = True
+    for i in range(3):
+        analytics.enqueue(event(f'e{i}'))
+    assert analytics.flush(5)
+
+    posthog.fail = False
+    analytics.enqueue(event('e3'))
+    assert analytics.flush(5)
+    # One spooled batch goes out with the live one, the rest on later idle passes
+    assert posthog.events() == ['e3', 'e0']
+
+    for _ in range(100):
+        if not analytics.spool.pending():
+            break
+        time.sleep(0.02)
+    assert posthog.events() == ['e3', 'e0', 'e1', 'e2']
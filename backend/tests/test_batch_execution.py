@@ -0,0 +1,134 @@
+import pytest
+import asyncio
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.app import create_app
+from backend.models import ApiKey, Execution, Prompt, PromptState, User
+from backend.models.base import Base, get_db, set_engine
+from backend.services.llm_service import llm_service
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'REDIS_URL': None,
+        'BATCH_MAX_ITEMS': 6,
+        'BATCH_PROVIDER_CONCURRENCY': 2,
+    })
+
+    # One shared connection so rows saved from worker threads are visible here
+    test_engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    set_engine(test_engine)
+    Base.metadata.create_all(bind=test_engine)
+    # Request sessions (and so authentication) use the same database
+    app.extensions['db_session_factory'] = sessionmaker(bind=test_engine)
+
+    with app.app_context():
+        db = next(get_db())
+        user = User(email='batch@example.com', display_name='Batch User')
+        db.add(user)
+        db.commit()
+        db.add(ApiKey(user_id=user.id, provider='openai', key_hash='batch-key'))
+        db.add(Prompt(
+            title='Batch Prompt',
+            prompt_text='Summarise {{topic}} in one line',
+            user_id=user.id,
+            state=PromptState.DRAFT
+        ))
+        db.commit()
+
+    yield app
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    """Answer instantly for OpenAI and slowly for Anthropic, tracking concurrency."""
+    state = {'in_flight': {}, 'peak': {}}
+
+    async def call_provider(provider, model, prompt_request):
+        state['in_flight'][provider] = state['in_flight'].get(provider, 0) + 1
+        state['peak'][provider] = max(state['peak'].get(provider, 0), state['in_flight'][provider])
+        await asyncio.sleep(0.3 if provider == 'anthropic' else 0.05)
+        state['in_flight'][provider] -= 1
+        if model == 'gpt-4':
+            raise RuntimeError('provider unavailable')
+        return f'{model}: {prompt_request.prompt}'
+
+    monkeypatch.setattr(llm_service, '_call_provider', call_provider)
+    return state
+
+AUTH = {'Authorization': 'Bearer batch-key'}
+
+def read_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+def test_batch_streams_results_in_completion_order(app, fake_provider):
+    """Test that fast models are reported before slow ones and rows are saved."""
+    client = app.test_client()
+    response = client.post('/api/prompts/1/execute/batch', headers=AUTH, json={
+        'models': ['anthropic:claude-3-haiku', 'openai:gpt-3.5-turbo', 'openai:gpt-4'],
+        'variables': [{'topic': 'caching'}, {'topic': 'pooling'}],
+        # Ignored: runs belong to the authenticated caller
+        'user_id': 99,
+    })
+
+    assert response.status_code == 200
+    assert response.content_type == 'application/x-ndjson'
+    lines = read_lines(response)
+    results, summary = lines[:-1], lines[-1]
+
+    assert len(results) == 6
+    assert results[0]['model'].startswith('openai:')
+    assert results[-1]['model'].startswith('anthropic:')
+    assert {r['response'] for r in results if r['model'] == 'openai:gpt-3.5-turbo'} == {
+        'gpt-3.5-turbo: Summarise caching in one line',
+        'gpt-3.5-turbo: Summarise pooling in one line',
+    }
+    assert all(r['error'] == 'provider unavailable' for r in results if r['model'] == 'openai:gpt-4')
+    assert summary == {'done': True, 'total': 6, 'succeeded': 4, 'failed': 2, 'persisted': 6}
+
+    # Calls overlap, but never beyond the per-provider limit
+    assert fake_provider['peak'] == {'anthropic': 2, 'openai': 2}
+
+    with app.app_context():
+        db = next(get_db())
+        executions = db.query(Execution).all()
+        assert len(executions) == 6
+        assert sum(1 for e in executions if not e.is_successful) == 2
+        assert {e.user_id for e in executions} == {1}
+
+def test_batch_sse_format(app, fake_provider):
+    """Test that format=sse emits result events followed by a done event."""
+    client = app.test_client()
+    response = client.post('/api/prompts/1/execute/batch', headers=AUTH, json={
+        'models': ['openai:gpt-3.5-turbo'],
+        'format': 'sse',
+    })
+
+    assert response.content_type.startswith('text/event-stream')
+    body = response.get_data(as_text=True)
+    assert body.count('event: result') == 1
+    assert body.rstrip().split('\n')[-2] == 'event: done'
+
+def test_batch_rejects_invalid_requests(app, fake_provider):
+    """Test validation of models and batch size."""
+    client = app.test_client()
+
+    response = client.post('/api/prompts/1/execute/batch', json={'models': ['openai:gpt-3.5-turbo']})
+    assert response.status_code == 401
+
+    response = client.post('/api/prompts/1/execute/batch', headers=AUTH, json={'models': ['nope:model']})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid models in request: nope:model'
+
+    response = client.post('/api/prompts/1/execute/batch', headers=AUTH, json={
+        'models': ['openai:gpt-3.5-turbo', 'openai:gpt-4'],
+        'variables': [{'topic': str(i)} for i in range(4)],
+    })
+    assert response.status_code == 400
+    assert 'maximum of 6' in response.get_json()['error']
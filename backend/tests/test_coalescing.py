@@ -0,0 +1,128 @@
+import pytest
+import asyncio
+import json
+import threading
+from backend.services.coalescing import Flight, SingleFlight, _LeaderLost
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.utils.metrics import metrics
+
+@pytest.fixture
+def service(monkeypatch):
+    """LLMService whose provider answers slowly and counts upstream calls."""
+    service = LLMService()
+    state = {'calls': 0, 'cancelled': threading.Event()}
+
+    async def call_provider(provider, model, request):
+        state['calls'] += 1
+        if request.stream:
+            async def chunks():
+                try:
+                    for text in ['one ', 'two ', 'three']:
+                        await asyncio.sleep(0.05)
+                        yield text
+                except asyncio.CancelledError:
+                    state['cancelled'].set()
+                    raise
+            return chunks()
+        await asyncio.sleep(0.1)
+        return 'one two three'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    service.state = state
+    return service
+
+def test_identical_requests_share_one_call(service):
+    request = PromptRequest(prompt='trending', model='openai:gpt-4', temperature=0.7)
+    before = metrics.counter('llm.coalesce.coalesced', scope='local')
+
+    async def burst():
+        return await asyncio.gather(*[service.execute(request) for _ in range(5)])
+
+    results = asyncio.run(burst())
+    assert [r.output for r in results] == ['one two three'] * 5
+    assert service.state['calls'] == 1
+    assert metrics.counter('llm.coalesce.coalesced', scope='local') - before == 4
+
+def test_streaming_and_plain_requests_share_one_call(service):
+    stream_request = PromptRequest(prompt='trending', model='openai:gpt-4', stream=True)
+    plain_request = stream_request.model_copy(update={'stream': False})
+
+    async def collect(request):
+        result = await service.execute(request)
+        if request.stream:
+            return ''.join([chunk async for chunk in result.output])
+        return result.output
+
+    async def burst():
+        return await asyncio.gather(collect(stream_request), collect(stream_request), collect(plain_request))
+
+    assert asyncio.run(burst()) == ['one two three'] * 3
+    assert service.state['calls'] == 1
+
+def test_different_requests_are_not_coalesced(service):
+    async def burst():
+        return await asyncio.gather(
+            service.execute(PromptRequest(prompt='a', model='openai:gpt-4')),
+            service.execute(PromptRequest(prompt='b', model='openai:gpt-4')),
+            service.execute(PromptRequest(prompt='a', model='openai:gpt-4', cache=False)),
+        )
+
+    asyncio.run(burst())
+    assert service.state['calls'] == 3
+
+def test_last_subscriber_leaving_cancels_upstream(service):
+    request = PromptRequest(prompt='abandoned', model='openai:gpt-4', stream=True)
+
+    async def read_one_chunk():
+        result = await service.execute(request)
+        stream = result.output
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(read_one_chunk()) == 'one '
+    assert service.state['cancelled'].wait(1)
+
+class FakeRedis:
+    """Just enough of an asyncio Redis client to replay another worker's flight."""
+
+    def __init__(self, events, lock_held=True):
+        self.lists = {'llm_flight:key:events:leader': [json.dumps(event) for event in events]}
+        self.lock_held = lock_held
+
+    async def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start:]
+
+    async def get(self, key):
+        return 'leader' if self.lock_held else None
+
+def test_follow_remote_flight():
+    flight = Flight('key')
+    flight.subscribers = 1
+    client = FakeRedis([{'c': 'from '}, {'c': 'another worker'}, {'done': True, 'model': 'openai:gpt-4'}])
+
+    async def follow():
+        await SingleFlight(poll_interval=0.01)._follow_remote(flight, client, 'leader')
+        return ''.join([chunk async for chunk in flight.subscribe()])
+
+    assert asyncio.run(follow()) == 'from another worker'
+    assert flight.model == 'openai:gpt-4'
+
+def test_follow_remote_detects_lost_leader():
+    flight = Flight('key')
+    client = FakeRedis([], lock_held=False)
+    with pytest.raises(_LeaderLost):
+        asyncio.run(SingleFlight(poll_interval=0.01)._follow_remote(flight, client, 'leader'))
+
+def test_follow_remote_ignores_earlier_flights():
+    flight = Flight('key')
+    flight.subscribers = 1
+    client = FakeRedis([{'c': 'answer-2'}, {'done': True, 'model': 'openai:gpt-4'}])
+    # The previous flight's list lingers for a few seconds after it finished
+    client.lists['llm_flight:key:events:earlier'] = [json.dumps({'c': 'answer-1'}), json.dumps({'done': True})]
+
+    async def follow():
+        await SingleFlight(poll_interval=0.01)._follow_remote(flight, client, 'leader')
+        return ''.join([chunk async for chunk in flight.subscribe()])
+
+    assert asyncio.run(follow()) == 'answer-2'
@@ -0,0 +1,60 @@
+import pytest
+import json
+from backend.services import llm_cache
+from backend.services.llm_cache import LLMResponseCache
+from backend.utils.codec import Codec, CodecError, codec
+
+LONG_TEXT = 'The capital of France is Paris. ' * 200
+
+def test_round_trips_through_every_codec():
+    value = {'id': 1, 'tags': ['a', 'b'], 'score': 0.5, 'text': LONG_TEXT, 'missing': None}
+    for serializer in ('json', 'msgpack'):
+        for compression in ('none', 'zlib', 'zstd'):
+            assert Codec(serializer, compression).decode(Codec(serializer, compression).encode(value)) == value
+
+def test_compresses_only_above_threshold():
+    small = Codec('msgpack', 'zstd', threshold=1024).encode('short')
+    large = Codec('msgpack', 'zstd', threshold=1024).encode(LONG_TEXT)
+    assert small[:3] == bytes((1, 1, 0))
+    assert large[:3] == bytes((1, 1, 2))
+    assert len(large) < len(LONG_TEXT) / 10
+
+def test_reads_values_written_by_other_codecs_and_legacy_json():
+    reader = Codec('json', 'none')
+    assert reader.decode(Codec('msgpack', 'zstd', threshold=0).encode({'a': 1})) == {'a': 1}
+    assert reader.decode('{"a": 1}') == {'a': 1}
+    assert reader.decode(b'[1, 2]') == [1, 2]
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(CodecError):
+        codec.decode(bytes((1, 99, 0)) + b'x')
+    with pytest.raises(CodecError):
+        codec.decode(b'not json')
+
+def test_unavailable_codecs_fall_back():
+    fallback = Codec('avro', 'brotli')
+    assert (fallback.serializer, fallback.compression) == ('json', 'zlib')
+
+class FakeBinaryRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+def test_llm_cache_stores_compressed_entries(monkeypatch):
+    fake = FakeBinaryRedis()
+    monkeypatch.setattr(llm_cache, 'get_binary_redis_client', lambda: fake)
+
+    writer = LLMResponseCache()
+    writer.set('llm_cache:a', LONG_TEXT)
+    assert len(fake.data['llm_cache:a']) < len(LONG_TEXT) / 10
+    # A different worker reads it from Redis
+    assert LLMResponseCache().get('llm_cache:a') == LONG_TEXT
+
+    # Entries written as plain text before the codec still hit
+    fake.data['llm_cache:b'] = json.dumps({'x': 1}).encode('utf-8')
+    assert LLMResponseCache().get('llm_cache:b') == '{"x": 1}'
@@ -0,0 +1,111 @@
+import pytest
+import asyncio
+from backend.services.concurrency import AdaptiveLimiter, is_rate_limit_error
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.utils.metrics import metrics
+
+class RateLimitError(Exception):
+    status_code = 429
+
+def test_limiter_serves_users_round_robin():
+    """Test that a burst from one user doesn't starve another."""
+    async def scenario():
+        limiter = AdaptiveLimiter('test', initial_limit=1, per_user_limit=1)
+        order = []
+
+        async def call(user, tag):
+            await limiter.acquire(user)
+            order.append(tag)
+            await asyncio.sleep(0.01)
+            limiter.release(user, latency_ms=10)
+
+        await limiter.acquire('busy')
+        tasks = [asyncio.create_task(call('busy', f'busy-{i}')) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call('quiet', 'quiet-0')))
+        await asyncio.sleep(0)
+        limiter.release('busy', latency_ms=10)
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order.index('quiet-0') <= 1
+
+def test_limiter_caps_per_user_in_flight():
+    """Test that one user can't take every slot."""
+    async def scenario():
+        limiter = AdaptiveLimiter('test', initial_limit=4, per_user_limit=2)
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+        blocked = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert limiter.queue_depth == 1
+
+        # Another user still gets a slot straight away
+        await asyncio.wait_for(limiter.acquire(2), 0.1)
+
+        limiter.release(1, latency_ms=10)
+        await asyncio.wait_for(blocked, 0.1)
+        assert limiter.in_flight == 3
+
+    asyncio.run(scenario())
+
+def test_limiter_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = AdaptiveLimiter('test', initial_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.queue_depth == 0
+        limiter.release(latency_ms=10)
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_limiter_aimd():
+    """Test multiplicative decrease on 429 and additive increase when saturated."""
+    async def scenario():
+        limiter = AdaptiveLimiter('test', initial_limit=8, decrease_cooldown=0)
+        for _ in range(8):
+            await limiter.acquire()
+        limiter.release(rate_limited=True)
+        assert limiter.limit == 4
+
+        limiter.release(latency_ms=60_000)
+        assert limiter.limit == 2
+
+        # Fast completions while over the limit grow it by about 1/limit each
+        for _ in range(6):
+            limiter.release(latency_ms=100)
+        assert limiter.limit == 3
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimitError())
+    assert not is_rate_limit_error(ValueError('bad request'))
+
+def test_service_releases_slot_on_rate_limit(monkeypatch):
+    """Test that LLMService feeds provider 429s into the provider limiter."""
+    service = LLMService()
+    service.limiters.limiter_options = {'initial_limit': 6, 'decrease_cooldown': 0}
+
+    async def call_provider(provider, model, request):
+        raise RateLimitError('slow down')
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    monkeypatch.setattr('backend.services.llm_service.LLM_RETRY_MAX_ATTEMPTS', 1)
+    request = PromptRequest(prompt='hi', model='openai:gpt-4', user_id=7)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(service.execute(request))
+
+    limiter = service.limiters.get('openai')
+    assert limiter.in_flight == 0
+    assert limiter.limit == 3
+    assert metrics.snapshot()['gauges']['llm.limiter.limit{provider=openai}'] == 3
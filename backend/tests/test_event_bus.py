@@ -0,0 +1,89 @@
+import pytest
+import json
+from backend.app import create_app
+from backend.api.pubsub_example import event_bus
+from backend.utils.event_bus import EventBus, RingBuffer
+
+def event(channel, event_id, message=None):
+    return {'id': event_id, 'channel': channel, 'message': message if message is not None else event_id}
+
+def test_ring_buffer_is_bounded_per_channel():
+    buffer = RingBuffer(max_events=3)
+    for seq in range(5):
+        buffer.append('a', event('a', f'1000-{seq}'))
+    buffer.append('b', event('b', '999-0'))
+    # Replays of events already held are ignored
+    buffer.append('a', event('a', '1000-3'))
+
+    assert [e['id'] for e in buffer.recent('a', limit=10)] == ['1000-4', '1000-3', '1000-2']
+    assert [e['id'] for e in buffer.recent('b')] == ['999-0']
+    assert buffer.is_full('a') and not buffer.is_full('b')
+
+def test_ring_buffer_merges_channels_newest_first_with_cursor():
+    buffer = RingBuffer()
+    for ms in (1, 4, 6):
+        buffer.append('a', event('a', f'{ms}-0'))
+    for ms in (2, 3, 5):
+        buffer.append('b', event('b', f'{ms}-0'))
+
+    first = buffer.recent(limit=4)
+    assert [e['id'] for e in first] == ['6-0', '5-0', '4-0', '3-0']
+    rest = buffer.recent(limit=4, before=first[-1]['id'])
+    assert [e['id'] for e in rest] == ['2-0', '1-0']
+
+class FakeRedis:
+    def __init__(self):
+        self.acked = []
+
+    def xack(self, key, group, *ids):
+        self.acked.append((key, group, ids))
+
+def test_group_handler_failures_stay_pending():
+    handled = []
+
+    def handler(channel, message):
+        if message == 'bad':
+            raise ValueError('boom')
+        handled.append((channel, message))
+
+    client = FakeRedis()
+    entries = [('1-0', {'data': json.dumps('ok')}), ('2-0', {'data': json.dumps('bad')}), ('3-0', None)]
+    EventBus(['a'])._handle(client, 'g', handler, 'a', entries)
+
+    assert handled == [('a', 'ok')]
+    # The failed event is not acknowledged; the trimmed one is
+    assert client.acked == [('events:a', 'g', ('1-0', '3-0'))]
+
+@pytest.fixture
+def client():
+    app = create_app({'TESTING': True, 'REDIS_URL': None})
+    event_bus.buffer.clear()
+    yield app.test_client()
+    event_bus.buffer.clear()
+
+def test_recent_events_pages_with_cursor(client):
+    for ms in range(1, 6):
+        channel = 'events' if ms % 2 else 'notifications'
+        event_bus.buffer.append(channel, event(channel, f'{ms}-0'))
+
+    page = client.get('/api/recent-events?limit=3').get_json()
+    assert [e['id'] for e in page['events']] == ['5-0', '4-0', '3-0']
+    assert page['next_cursor'] == '3-0'
+
+    page = client.get(f"/api/recent-events?limit=3&before={page['next_cursor']}").get_json()
+    assert [e['id'] for e in page['events']] == ['2-0', '1-0']
+    assert page['next_cursor'] is None
+
+    page = client.get('/api/recent-events?channel=notifications').get_json()
+    assert [e['id'] for e in page['events']] == ['4-0', '2-0']
+
+def test_recent_events_rejects_malformed_cursors(client):
+    for cursor in ('abc', '1-', '-1', '1-0-0'):
+        response = client.get(f'/api/recent-events?before={cursor}')
+        assert response.status_code == 400
+
+    assert client.get('/api/recent-events?before=5').status_code == 200
+
+def test_publish_rejects_unknown_channels(client):
+    response = client.post('/api/publish-event', json={'channel': 'nope', 'message': 'hi'})
+    assert response.status_code == 400
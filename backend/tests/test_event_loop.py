@@ -0,0 +1,75 @@
+import pytest
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import request
+from backend.app import create_app
+from backend.api.prompts import async_route
+from backend.utils.event_loop import BackgroundEventLoop, get_background_loop
+
+@pytest.fixture
+def app():
+    """Create an app with an async test route."""
+    app = create_app({
+        'TESTING': True,
+        'REDIS_URL': None,
+        'ASYNC_REQUEST_TIMEOUT': 10,
+    })
+
+    @app.route('/api/v1/test-async')
+    @async_route
+    async def test_async():
+        await asyncio.sleep(0.2)
+        return {
+            'name': request.args.get('name'),
+            'loop_id': id(asyncio.get_running_loop()),
+            'thread': threading.current_thread().name,
+        }
+
+    yield app
+
+def test_async_route_runs_on_background_loop(app):
+    """Test that async routes run on the shared loop with the request context."""
+    with app.test_client() as client:
+        response = client.get('/api/v1/test-async?name=krowoc')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['name'] == 'krowoc'
+    assert data['thread'] == get_background_loop().name
+    assert data['loop_id'] == id(get_background_loop().loop)
+
+def test_async_routes_overlap(app):
+    """Test that concurrent requests overlap on the loop instead of serializing."""
+    def call(i):
+        with app.test_client() as client:
+            return client.get(f'/api/v1/test-async?name={i}').get_json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(call, range(8)))
+    elapsed = time.perf_counter() - start
+
+    assert sorted(int(r['name']) for r in results) == list(range(8))
+    assert len({r['loop_id'] for r in results}) == 1
+    assert elapsed < 1.0
+
+def test_run_timeout_cancels_coroutine():
+    """Test that a timed-out coroutine is cancelled on the loop."""
+    runner = BackgroundEventLoop(name='test-event-loop')
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        with pytest.raises(TimeoutError):
+            runner.run(slow(), timeout=0.1)
+        assert cancelled.wait(1)
+    finally:
+        runner.stop()
@@ -0,0 +1,153 @@
+import pytest
+import asyncio
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.app import create_app
+from backend.models import ApiKey, Prompt, PromptState, User
+from backend.models.base import Base, get_db, set_engine
+from backend.services import llm_service as llm_service_module
+from backend.services.execution_events import (
+    EXECUTION_FINISHED, EXECUTION_PROGRESS, EXECUTION_SAVED, EXECUTION_STARTED,
+    ExecutionEventHub, Subscription, execution_event, execution_events
+)
+from backend.services.llm_service import PromptRequest, llm_service
+
+def test_slow_subscribers_lose_progress_events_first():
+    subscription = Subscription(('user', 1), max_events=2)
+    subscription.offer(execution_event(EXECUTION_STARTED, 1, None, run_id='a'))
+    subscription.offer(execution_event(EXECUTION_PROGRESS, 1, None, run_id='a'))
+    # Full: another progress event is dropped, a finished one replaces the queued progress
+    subscription.offer(execution_event(EXECUTION_PROGRESS, 1, None, run_id='a'))
+    subscription.offer(execution_event(EXECUTION_FINISHED, 1, None, run_id='a'))
+    # Nothing left to give up: the new event is dropped
+    subscription.offer(execution_event(EXECUTION_STARTED, 1, None, run_id='b'))
+
+    events, dropped = subscription.get(timeout=0)
+    assert [event['type'] for event in events] == [EXECUTION_STARTED, EXECUTION_FINISHED]
+    assert dropped == 3
+    assert subscription.get(timeout=0) == ([], 0)
+
+def test_events_reach_their_user_and_prompt_streams():
+    hub = ExecutionEventHub()
+    user = hub.subscribe(user_id=1)
+    prompt = hub.subscribe(prompt_id=7)
+    other = hub.subscribe(user_id=2)
+
+    hub.publish(execution_event(EXECUTION_STARTED, 1, 7, run_id='a'))
+    hub.publish(execution_event(EXECUTION_STARTED, 1, None, run_id='b'))
+
+    assert [e['run_id'] for e in user.get(timeout=0)[0]] == ['a', 'b']
+    assert [e['run_id'] for e in prompt.get(timeout=0)[0]] == ['a']
+    assert other.get(timeout=0) == ([], 0)
+
+    hub.unsubscribe(user)
+    hub.unsubscribe(prompt)
+    hub.unsubscribe(other)
+    assert hub.subscriber_count() == 0
+
+def test_streamed_execution_publishes_progress(monkeypatch):
+    async def call_provider(provider, model, prompt_request):
+        async def chunks():
+            for text in ['Hello', ', ', 'world']:
+                yield text
+        return chunks()
+
+    monkeypatch.setattr(llm_service, '_call_provider', call_provider)
+    monkeypatch.setattr(llm_service_module, 'EXECUTION_PROGRESS_INTERVAL', 0)
+    subscription = execution_events.subscribe(prompt_id=42)
+
+    async def run():
+        result = await llm_service.execute(PromptRequest(
+            prompt='Say hello', model='openai:gpt-3.5-turbo', stream=True, cache=False, user_id=3, prompt_id=42
+        ))
+        return ''.join([chunk async for chunk in result.output])
+
+    try:
+        assert asyncio.run(run()) == 'Hello, world'
+        events, _ = subscription.get(timeout=0)
+    finally:
+        execution_events.unsubscribe(subscription)
+
+    assert [event['type'] for event in events] == [EXECUTION_STARTED] + [EXECUTION_PROGRESS] * 3 + [EXECUTION_FINISHED]
+    assert len({event['run_id'] for event in events}) == 1
+    # Progress counts are running estimates; the finished event has the exact usage
+    progress = [event['output_tokens'] for event in events[1:4]]
+    assert progress == sorted(progress) and progress[0] > 0
+    assert events[-1]['usage']['output_tokens'] > 0
+    assert events[-1]['error'] is None
+
+@pytest.fixture
+def app():
+    app = create_app({'TESTING': True, 'REDIS_URL': None, 'SSE_HEARTBEAT_INTERVAL': 0.05})
+    test_engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    set_engine(test_engine)
+    Base.metadata.create_all(bind=test_engine)
+    # Request sessions (and so authentication) use the same database
+    app.extensions['db_session_factory'] = sessionmaker(bind=test_engine)
+
+    with app.app_context():
+        db = next(get_db())
+        owner = User(email='owner@example.com', display_name='Owner')
+        other = User(email='other@example.com', display_name='Other')
+        db.add_all([owner, other])
+        db.commit()
+        db.add_all([
+            ApiKey(user_id=owner.id, provider='openai', key_hash='owner-key'),
+            ApiKey(user_id=other.id, provider='openai', key_hash='other-key'),
+            Prompt(title='Streamed Prompt', prompt_text='Say hello to {{name}}', user_id=owner.id, state=PromptState.DRAFT),
+        ])
+        db.commit()
+    return app
+
+OWNER = {'Authorization': 'Bearer owner-key'}
+OTHER = {'Authorization': 'Bearer other-key'}
+
+def next_event(pieces):
+    piece = next(pieces)
+    while piece.startswith(b': heartbeat'):
+        piece = next(pieces)
+    return piece.split(b'\n', 1)[0], json.loads(piece.split(b'data: ', 1)[1])
+
+def test_stream_endpoint_delivers_events(app, monkeypatch):
+    async def call_provider(provider, model, prompt_request):
+        return 'Hello'
+
+    monkeypatch.setattr(llm_service, '_call_provider', call_provider)
+    client = app.test_client()
+
+    assert client.get('/api/executions/stream?user_id=1').status_code == 401
+    assert client.get('/api/executions/stream', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.get('/api/executions/stream', headers=OWNER, buffered=False)
+    assert response.content_type.startswith('text/event-stream')
+    pieces = iter(response.response)
+    with app.app_context():
+        execution_events.publish(execution_event(EXECUTION_SAVED, 1, 1, execution={'id': 10}))
+    event_type, data = next_event(pieces)
+    assert event_type == b'event: execution.saved'
+    assert data['execution'] == {'id': 10}
+
+    # Runs made with the user's key are attributed to them; anonymous and other users' runs aren't
+    for headers in ({}, OTHER, OWNER):
+        assert client.post('/api/prompts/execute', headers=headers, json={
+            'prompt': 'Say hello', 'model': 'openai:gpt-3.5-turbo', 'cache': False
+        }).status_code == 200
+    event_type, data = next_event(pieces)
+    assert event_type == b'event: execution.started'
+    assert data['user_id'] == 1
+
+    response.close()
+    assert execution_events.subscriber_count() == 0
+
+def test_prompt_streams_are_for_the_owner(app):
+    client = app.test_client()
+    assert client.get('/api/executions/stream?prompt_id=1').status_code == 401
+    assert client.get('/api/executions/stream?prompt_id=1', headers=OTHER).status_code == 403
+    assert client.get('/api/executions/stream?prompt_id=9', headers=OWNER).status_code == 404
+
+    response = client.get('/api/executions/stream?prompt_id=1', headers=OWNER, buffered=False)
+    assert response.status_code == 200
+    response.close()
+    assert execution_events.subscriber_count() == 0
@@ -0,0 +1,131 @@
+import pytest
+import asyncio
+from backend.services import hedging
+from backend.services.hedging import FIRST_TOKEN_METRIC, hedge_deadline, race
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.utils.metrics import metrics
+
+@pytest.fixture(autouse=True)
+def latency_history(monkeypatch):
+    """Give gpt-4 a history of 50ms first tokens so hedging has a deadline."""
+    metrics.reset()
+    monkeypatch.setattr(hedging, 'LLM_HEDGE_MIN_DELAY_MS', 10)
+    for _ in range(hedging.LLM_HEDGE_MIN_SAMPLES):
+        metrics.observe(FIRST_TOKEN_METRIC, 50, model='openai:gpt-4')
+    yield
+    metrics.reset()
+
+def test_no_deadline_without_history():
+    assert hedge_deadline('anthropic:claude-2') is None
+    assert hedge_deadline('openai:gpt-4') == pytest.approx(0.05)
+
+def test_race_skips_hedge_when_primary_is_fast():
+    async def primary():
+        return 'primary'
+
+    async def hedge():
+        raise AssertionError('hedge should not start')
+
+    assert asyncio.run(race('m', primary, hedge, 0.1)) == ('primary', False)
+    assert metrics.counter('llm.hedge.fired', model='m') == 0
+
+def test_race_hedge_wins_and_primary_is_cancelled():
+    cancelled = []
+
+    async def primary():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def hedge():
+        await asyncio.sleep(0.01)
+        return 'hedge'
+
+    assert asyncio.run(race('m', primary, hedge, 0.02)) == ('hedge', True)
+    assert cancelled == [True]
+    assert metrics.counter('llm.hedge.won', model='m') == 1
+    assert metrics.snapshot()['gauges']['llm.hedge.rate{model=m}'] == 1.0
+
+def test_race_survives_failed_hedge():
+    async def primary():
+        await asyncio.sleep(0.05)
+        return 'primary'
+
+    async def hedge():
+        raise RuntimeError('hedge failed')
+
+    assert asyncio.run(race('m', primary, hedge, 0.01)) == ('primary', False)
+    assert metrics.counter('llm.hedge.lost', model='m') == 1
+
+def test_cancelling_race_before_deadline_cancels_primary():
+    cancelled = []
+
+    async def primary():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def hedge():
+        raise AssertionError('hedge should not start')
+
+    async def run():
+        task = asyncio.ensure_future(race('m', primary, hedge, 0.5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Checked before asyncio.run tears down any tasks left behind
+        assert cancelled == [True]
+
+    asyncio.run(run())
+    assert metrics.counter('llm.hedge.fired', model='m') == 0
+
+def test_service_hedges_stalled_call_to_fallback_model(monkeypatch):
+    async def call_provider(provider, model, request):
+        if model == 'gpt-4':
+            await asyncio.sleep(2)
+        return f'answer from {model}'
+
+    service = LLMService()
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    request = PromptRequest(
+        prompt='hi',
+        model='openai:gpt-4',
+        hedge=True,
+        fallback_models=['openai:gpt-3.5-turbo']
+    )
+
+    result = asyncio.run(asyncio.wait_for(service.execute(request), 1))
+    assert result.output == 'answer from gpt-3.5-turbo'
+    assert result.model == 'openai:gpt-3.5-turbo'
+    # The cancelled primary gave its limiter slot back
+    assert service.limiters.get('openai').in_flight == 0
+
+def test_service_hedges_streams_on_first_chunk(monkeypatch):
+    async def call_provider(provider, model, request):
+        async def chunks():
+            if model == 'gpt-4':
+                await asyncio.sleep(2)
+            yield model
+            yield ' done'
+        return chunks()
+
+    service = LLMService()
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    request = PromptRequest(
+        prompt='hi',
+        model='openai:gpt-4',
+        hedge=True,
+        stream=True,
+        fallback_models=['openai:gpt-3.5-turbo']
+    )
+
+    async def collect():
+        result = await service.execute(request)
+        return [chunk async for chunk in result.output]
+
+    assert asyncio.run(asyncio.wait_for(collect(), 1)) == ['gpt-3.5-turbo', ' done']
@@ -0,0 +1,86 @@
+import pytest
+from backend.app import create_app
+from backend.services.llm_service import llm_service, PromptRequest
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'REDIS_URL': None,
+    })
+    yield app
+
+@pytest.fixture
+def provider_calls(monkeypatch):
+    """Replace the provider call and record each request that reaches it."""
+    calls = []
+
+    async def call_provider(provider, model, prompt_request):
+        calls.append(prompt_request)
+        if prompt_request.stream:
+            async def chunks():
+                yield 'Paris is the '
+                yield 'capital of France.'
+            return chunks()
+        return 'Paris is the capital of France.'
+
+    monkeypatch.setattr(llm_service, '_call_provider', call_provider)
+    llm_service.response_cache.local.clear()
+    return calls
+
+def execute(client, **overrides):
+    payload = {
+        'prompt': 'What is the capital of France?',
+        'model': 'openai:gpt-4',
+        'temperature': 0,
+    }
+    payload.update(overrides)
+    return client.post('/api/prompts/execute', json=payload)
+
+def test_deterministic_requests_are_cached(app, provider_calls):
+    """Test that a repeated temperature-0 request is served from cache."""
+    client = app.test_client()
+
+    first = execute(client)
+    second = execute(client, prompt='  What is the capital of France?\r\n')
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json()['response'] == 'Paris is the capital of France.'
+    assert len(provider_calls) == 1
+
+def test_non_deterministic_requests_bypass_cache(app, provider_calls):
+    """Test that sampling requests skip the cache unless opted in."""
+    client = app.test_client()
+
+    assert execute(client, temperature=0.7).headers['X-Cache'] == 'BYPASS'
+    assert execute(client, temperature=0.7).headers['X-Cache'] == 'BYPASS'
+    assert execute(client, temperature=0.7, cache=True).headers['X-Cache'] == 'MISS'
+    assert execute(client, temperature=0.7, cache=True).headers['X-Cache'] == 'HIT'
+    assert len(provider_calls) == 3
+
+def test_cached_stream_is_replayed_as_sse(app, provider_calls):
+    """Test that a streamed response is cached and replayed as SSE."""
+    client = app.test_client()
+
+    first = execute(client, stream=True)
+    first_body = first.get_data(as_text=True)
+    second = execute(client, stream=True)
+    second_body = second.get_data(as_text=True)
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert 'capital of France.' in first_body
+    assert 'Paris is the capital of France.' in second_body
+    assert second_body.endswith('event: done\ndata: null\n\n')
+    assert len(provider_calls) == 1
+
+def test_cache_key_ignores_stream_flag():
+    """Test that streaming and non-streaming requests share cache entries."""
+    cache = llm_service.response_cache
+    plain = PromptRequest(prompt='Hi', model='openai:gpt-4', temperature=0)
+    streamed = PromptRequest(prompt='Hi', model='openai:gpt-4', temperature=0, stream=True)
+    other = PromptRequest(prompt='Hi', model='openai:gpt-4', temperature=0, max_tokens=10)
+
+    assert cache.make_key(plain) == cache.make_key(streamed)
+    assert cache.make_key(plain) != cache.make_key(other)
@@ -0,0 +1,50 @@
+import pytest
+import asyncio
+from backend.services.llm_service import LLMService, LLMClientPool, PromptRequest
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'sk-ant-test')
+    return LLMService()
+
+def test_pool_evicts_least_recently_used():
+    """Test that the pool is bounded and evicts the LRU client."""
+    pool = LLMClientPool(max_size=2)
+    built = []
+
+    def factory(name):
+        def build():
+            built.append(name)
+            return name
+        return build
+
+    assert pool.get('a', factory('a')) == 'a'
+    assert pool.get('b', factory('b')) == 'b'
+    assert pool.get('a', factory('a')) == 'a'
+    pool.get('c', factory('c'))
+
+    assert len(pool) == 2
+    assert built == ['a', 'b', 'c']
+    # 'b' was least recently used, so it is rebuilt on next access
+    pool.get('b', factory('b'))
+    assert built == ['a', 'b', 'c', 'b']
+
+def test_clients_reused_with_per_call_overrides(service):
+    """Test that executions share a client but bind their own parameters."""
+    async def get_bindings():
+        first = service._get_llm('openai', 'gpt-4', PromptRequest(
+            prompt='Hello', model='openai:gpt-4', temperature=0.2, max_tokens=50))
+        second = service._get_llm('openai', 'gpt-4', PromptRequest(
+            prompt='Hello', model='openai:gpt-4', temperature=0.9, max_tokens=500))
+        streaming = service._get_llm('openai', 'gpt-4', PromptRequest(
+            prompt='Hello', model='openai:gpt-4', stream=True))
+        return first, second, streaming
+
+    first, second, streaming = asyncio.run(get_bindings())
+
+    assert first.bound is second.bound
+    assert streaming.bound is not first.bound
+    assert first.kwargs == {'temperature': 0.2, 'max_tokens': 50}
+    assert second.kwargs == {'temperature': 0.9, 'max_tokens': 500}
+    assert len(service.client_pool) == 2
@@ -0,0 +1,102 @@
+import pytest
+import redis
+from backend.app import create_app
+from backend.utils import rate_limiter
+from backend.utils.rate_limiter import RateLimiter, SLIDING_WINDOW, TOKEN_BUCKET
+
+class FakeScriptRedis:
+    """Answers every script call with the next canned decision, recording the call."""
+
+    def __init__(self, decisions):
+        self.decisions = list(decisions)
+        self.calls = []
+
+    def register_script(self, source):
+        client = self
+
+        class Script:
+            registered_client = client
+
+            def __call__(self, keys, args):
+                client.calls.append((source, keys, args))
+                decision = client.decisions.pop(0)
+                if isinstance(decision, Exception):
+                    raise decision
+                return decision
+
+        return Script()
+
+@pytest.fixture(autouse=True)
+def local_tiers(monkeypatch):
+    """Start every test with no leases, fallback buckets or Redis back-off."""
+    rate_limiter._leases.clear()
+    rate_limiter._fallback.clear()
+    monkeypatch.setattr(rate_limiter, '_redis_retry_at', 0.0)
+    yield
+    rate_limiter._leases.clear()
+    rate_limiter._fallback.clear()
+
+@pytest.fixture
+def client():
+    app = create_app({'TESTING': True, 'REDIS_URL': None})
+    return app.test_client()
+
+def use_redis(monkeypatch, fake):
+    monkeypatch.setattr(rate_limiter, 'get_redis_client', lambda: fake)
+
+def test_allowed_request_gets_headers_from_one_script_call(client, monkeypatch):
+    fake = FakeScriptRedis([[1, 4, 60000, 0]])
+    use_redis(monkeypatch, fake)
+    response = client.get('/api/rate-limited')
+    assert response.status_code == 200
+    assert response.headers['X-RateLimit-Limit'] == '5'
+    assert response.headers['X-RateLimit-Remaining'] == '4'
+    assert int(response.headers['X-RateLimit-Reset']) > 0
+    assert len(fake.calls) == 1
+
+def test_rejected_request_gets_retry_after(client, monkeypatch):
+    use_redis(monkeypatch, FakeScriptRedis([[0, 0, 30000, 1500]]))
+    response = client.get('/api/rate-limited')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.get_json()['remaining'] == 0
+
+def test_redis_errors_fall_back_to_local_limits(client, monkeypatch):
+    """Test that a Redis outage enforces the limit per worker instead of failing open."""
+    fake = FakeScriptRedis([redis.ConnectionError('down')])
+    use_redis(monkeypatch, fake)
+    statuses = [client.get('/api/rate-limited').status_code for _ in range(6)]
+    assert statuses == [200] * 5 + [429]
+    # Redis isn't retried on every request while it's down
+    assert len(fake.calls) == 1
+
+def test_leased_permits_are_spent_locally():
+    fake = FakeScriptRedis([[10, 90, 60000, 0], [10, 80, 59000, 0]])
+    decisions = [RateLimiter.admit(fake, 'k', requests_limit=100, lease=10) for _ in range(15)]
+    assert all(decision.allowed for decision in decisions)
+    assert len(fake.calls) == 2
+    assert fake.calls[0][2][0] == 10
+    assert [decision.remaining for decision in decisions[:3]] == [99, 98, 97]
+
+def test_sliding_log_cannot_lease():
+    with pytest.raises(ValueError):
+        RateLimiter.limit(algorithm='sliding_log', lease=10)
+
+def test_check_passes_algorithm_arguments():
+    fake = FakeScriptRedis([[1, 9, 1000, 0], [1, 19, 500, 0]])
+
+    RateLimiter.check(fake, 'k', requests_limit=10, time_window=60, algorithm=SLIDING_WINDOW)
+    _, keys, args = fake.calls[0]
+    index = int(keys[0].rsplit(':', 1)[1])
+    assert keys == [f'k:{index}', f'k:{index - 1}']
+    assert 0 <= args[3] < 60000
+
+    decision = RateLimiter.check(fake, 'k', requests_limit=10, time_window=60, algorithm=TOKEN_BUCKET, burst=20)
+    _, keys, args = fake.calls[1]
+    assert args[:3] == [1, 20, 10 / 60000]
+    assert decision.limit == 20
+    assert decision.remaining == 19
+
+def test_unknown_algorithm_is_rejected():
+    with pytest.raises(ValueError):
+        RateLimiter.limit(algorithm='leaky')
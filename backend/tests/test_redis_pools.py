@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+import redis
+from backend.app import create_app
+from backend.utils import redis_client
+from backend.utils.redis_client import AutoPipeline, get_async_redis_client, get_redis_client, get_redis_pool_stats
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+
+    async def execute(self, raise_on_error=True):
+        self.client.flushes.append(self.commands)
+        return [redis.ResponseError('WRONGTYPE') if args[0] == 'LPUSH' else len(self.client.flushes)
+                for args in self.commands]
+
+class FakeAsyncRedis:
+    def __init__(self):
+        self.flushes = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+@pytest.fixture
+def app(monkeypatch):
+    # Start from fresh singletons and put the originals back afterwards
+    monkeypatch.setattr(redis_client, '_redis_client', None)
+    monkeypatch.setattr(redis_client, '_binary_redis_client', None)
+    return create_app({
+        'TESTING': True,
+        'REDIS_URL': 'redis://localhost:6379/0',
+        'REDIS_MAX_CONNECTIONS': 7,
+        'REDIS_SOCKET_TIMEOUT': 1.5,
+    })
+
+def test_concurrent_commands_share_one_round_trip():
+    client = FakeAsyncRedis()
+    pipeline = AutoPipeline(client)
+
+    async def burst():
+        first = await asyncio.gather(*[pipeline.execute_command('GET', f'k{i}') for i in range(5)])
+        second = await asyncio.gather(
+            pipeline.execute_command('GET', 'k'), pipeline.execute_command('LPUSH', 'k', 'v'), return_exceptions=True
+        )
+        return first, second
+
+    first, second = asyncio.run(burst())
+    assert first == [1] * 5
+    assert len(client.flushes) == 2
+    assert client.flushes[0] == [('GET', f'k{i}') for i in range(5)]
+    # Each caller gets its own command's reply or error
+    assert second[0] == 2
+    assert isinstance(second[1], redis.ResponseError)
+
+def test_pools_are_tuned_from_config(app):
+    with app.app_context():
+        pool = get_redis_client().connection_pool
+        assert isinstance(pool, redis.BlockingConnectionPool)
+        assert pool.max_connections == 7
+        assert pool.connection_kwargs['socket_timeout'] == 1.5
+        assert pool.connection_kwargs['health_check_interval'] == 30
+
+        stats = get_redis_pool_stats()
+        assert {'pool': 'sync', 'max_connections': 7, 'created': 0, 'in_use': 0} in stats
+
+def test_async_clients_are_per_event_loop(app):
+    async def clients():
+        return get_async_redis_client(), get_async_redis_client(), get_async_redis_client(binary=True)
+
+    with app.app_context():
+        first, same, binary = asyncio.run(clients())
+        other, _, _ = asyncio.run(clients())
+    assert first is same
+    assert first is not other
+    assert first is not binary
+    assert first.connection_pool.max_connections == 7
+    assert first.connection_pool.connection_kwargs['decode_responses'] is True
+
+def test_async_client_without_redis_url():
+    app = create_app({'TESTING': True, 'REDIS_URL': None})
+
+    async def client():
+        return get_async_redis_client()
+
+    with app.app_context():
+        assert asyncio.run(client()) is None
@@ -0,0 +1,165 @@
+import pytest
+import asyncio
+import time
+from backend.app import create_app
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.services.resilience import (
+    CircuitBreakers, CircuitOpenError, backoff_delay, fallback_candidates, is_transient_error
+)
+
+class OverloadedError(Exception):
+    status_code = 529
+
+class ServerError(Exception):
+    status_code = 503
+
+class BadRequestError(Exception):
+    status_code = 400
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('backend.services.llm_service.backoff_delay', lambda attempt: 0)
+
+def make_service(monkeypatch, call_provider, **breaker_options):
+    service = LLMService()
+    service.breakers = CircuitBreakers(**breaker_options)
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    return service
+
+def test_transient_error_classification():
+    assert is_transient_error(ServerError())
+    assert is_transient_error(OverloadedError())
+    assert is_transient_error(asyncio.TimeoutError())
+    assert not is_transient_error(BadRequestError())
+    assert not is_transient_error(ValueError('bad'))
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=4) <= min(4, 0.5 * 2 ** attempt)
+
+def test_fallback_candidates_honor_whitelist():
+    candidates = fallback_candidates(
+        'anthropic:claude-3-haiku',
+        ['openai:gpt-4', 'openai:gpt-3.5-turbo', 'anthropic:claude-3-haiku'],
+        allowed_models=['anthropic:claude-3-haiku', 'openai:gpt-3.5-turbo']
+    )
+    assert candidates == ['anthropic:claude-3-haiku', 'openai:gpt-3.5-turbo']
+
+def test_retries_transient_errors(monkeypatch):
+    calls = []
+
+    async def call_provider(provider, model, request):
+        calls.append(model)
+        if len(calls) < 3:
+            raise ServerError('unavailable')
+        return 'recovered'
+
+    service = make_service(monkeypatch, call_provider)
+    result = asyncio.run(service.execute(PromptRequest(prompt='hi', model='openai:gpt-4')))
+    assert result.output == 'recovered'
+    assert len(calls) == 3
+
+def test_does_not_retry_client_errors(monkeypatch):
+    calls = []
+
+    async def call_provider(provider, model, request):
+        calls.append(model)
+        raise BadRequestError('invalid')
+
+    service = make_service(monkeypatch, call_provider)
+    with pytest.raises(BadRequestError):
+        asyncio.run(service.execute(PromptRequest(prompt='hi', model='openai:gpt-4')))
+    assert len(calls) == 1
+
+def test_falls_back_and_skips_open_breaker(monkeypatch):
+    """Test that a failing model opens its breaker and later calls go straight to the fallback."""
+    calls = []
+
+    async def call_provider(provider, model, request):
+        calls.append(model)
+        if provider == 'anthropic':
+            raise OverloadedError('overloaded')
+        return f'answer from {model}'
+
+    service = make_service(monkeypatch, call_provider, failure_threshold=3, reset_timeout=60)
+    request = PromptRequest(
+        prompt='hi',
+        model='anthropic:claude-3-haiku',
+        fallback_models=['openai:gpt-3.5-turbo']
+    )
+
+    result = asyncio.run(service.execute(request))
+    assert result.output == 'answer from gpt-3.5-turbo'
+    assert result.model == 'openai:gpt-3.5-turbo'
+    assert calls == ['claude-3-haiku'] * 3 + ['gpt-3.5-turbo']
+
+    calls.clear()
+    asyncio.run(service.execute(request))
+    assert calls == ['gpt-3.5-turbo']
+
+def test_invalid_fallback_models_are_rejected(monkeypatch):
+    async def call_provider(provider, model, request):
+        raise AssertionError('should not reach a provider')
+
+    service = make_service(monkeypatch, call_provider)
+    request = PromptRequest(prompt='hi', model='openai:gpt-4', fallback_models=['anthropic:not-a-model'])
+    with pytest.raises(ValueError):
+        asyncio.run(service.execute(request))
+
+    client = create_app({'TESTING': True, 'REDIS_URL': None}).test_client()
+    for fallback_models in (['gpt-4'], ['anthropic:not-a-model'], ['acme:model']):
+        response = client.post('/api/prompts/execute', json={
+            'prompt': 'hi', 'model': 'openai:gpt-4', 'fallback_models': fallback_models
+        })
+        assert response.status_code == 400
+        assert fallback_models[0] in response.get_json()['error']
+
+def test_all_breakers_open_raises(monkeypatch):
+    async def call_provider(provider, model, request):
+        raise ServerError('down')
+
+    service = make_service(monkeypatch, call_provider, failure_threshold=1, reset_timeout=60)
+    request = PromptRequest(prompt='hi', model='openai:gpt-4')
+    with pytest.raises(ServerError):
+        asyncio.run(service.execute(request))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service.execute(request))
+
+def test_half_open_allows_single_probe():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.05)
+
+    async def allowed():
+        return (await breakers.allow('openai:gpt-4'))[0]
+
+    asyncio.run(breakers.record_failure('openai:gpt-4'))
+    assert asyncio.run(allowed()) is False
+
+    time.sleep(0.06)
+    assert asyncio.run(allowed()) is True
+    assert asyncio.run(allowed()) is False
+
+    asyncio.run(breakers.record_success('openai:gpt-4'))
+    assert asyncio.run(allowed()) is True
+
+def test_stream_falls_back_before_first_chunk(monkeypatch):
+    async def call_provider(provider, model, request):
+        async def chunks():
+            if provider == 'anthropic':
+                raise ServerError('unavailable')
+            yield 'fallback '
+            yield 'stream'
+        return chunks()
+
+    service = make_service(monkeypatch, call_provider)
+    request = PromptRequest(
+        prompt='hi',
+        model='anthropic:claude-3-haiku',
+        stream=True,
+        fallback_models=['openai:gpt-3.5-turbo']
+    )
+
+    async def collect():
+        result = await service.execute(request)
+        return [chunk async for chunk in result.output]
+
+    assert asyncio.run(collect()) == ['fallback ', 'stream']
@@ -0,0 +1,167 @@
+import pytest
+import redis
+import threading
+from flask import Flask, g, jsonify, request
+from backend.utils import redis_client
+from backend.utils.redis_client import cache_response, invalidates
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == redis_client._STORE_TAGGED_SCRIPT:
+            self.data[keys[0]] = argv[1]
+            for tag_key in keys[1:]:
+                self.sets.setdefault(tag_key, set()).add(keys[0])
+        elif self.data.get(keys[0]) == argv[0]:
+            del self.data[keys[0]]
+
+    def rename(self, src, dst):
+        if src not in self.sets:
+            raise redis.ResponseError('no such key')
+        self.sets[dst] = self.sets.pop(src)
+
+    def sscan_iter(self, key, count=None):
+        return list(self.sets.get(key, ()))
+
+    def unlink(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.sets.pop(key, None)
+        return len(keys)
+
+    def publish(self, channel, payload):
+        return 0
+
+@pytest.fixture
+def app(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_client, 'get_redis_client', lambda: fake)
+    monkeypatch.setattr(redis_client, 'get_binary_redis_client', lambda: fake)
+    redis_client._l1_cache.clear()
+    calls = []
+
+    app = Flask(__name__)
+    app.calls = calls
+    app.redis = fake
+
+    @app.before_request
+    def load_user():
+        if request.headers.get('X-User'):
+            g.user = type('User', (), {'id': int(request.headers['X-User'])})()
+
+    @app.route('/items/<int:item_id>')
+    @cache_response(ttl=60, query_args=['page'], headers=('Accept-Language',), tags=['item:{item_id}'])
+    def get_item(item_id):
+        calls.append((item_id, request.args.get('page'), request.args.get('ignored')))
+        if item_id == 404:
+            return jsonify({'error': 'missing'}), 404
+        return jsonify({'id': item_id, 'page': request.args.get('page')})
+
+    @app.route('/items/<int:item_id>', methods=['PUT'])
+    @invalidates('item:{item_id}')
+    def update_item(item_id):
+        if item_id == 404:
+            return jsonify({'error': 'missing'}), 404
+        return jsonify({'id': item_id})
+
+    yield app
+    redis_client._l1_cache.clear()
+
+def test_repeat_requests_are_served_from_cache(app):
+    client = app.test_client()
+    first = client.get('/items/1?page=2')
+    second = client.get('/items/1?page=2&ignored=x')
+    assert first.get_json() == second.get_json() == {'id': 1, 'page': '2'}
+    assert len(app.calls) == 1
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert 'Accept-Language' in second.headers['Vary']
+    assert second.headers['Content-Type'] == 'application/json'
+
+    # Selected query args and headers pick separate entries
+    client.get('/items/1?page=3')
+    client.get('/items/1?page=2', headers={'Accept-Language': 'de'})
+    assert len(app.calls) == 3
+
+def test_if_none_match_gets_304(app):
+    client = app.test_client()
+    etag = client.get('/items/1').headers['ETag']
+    response = client.get('/items/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+def test_entries_are_per_user(app):
+    client = app.test_client()
+    client.get('/items/1', headers={'X-User': '1'})
+    client.get('/items/1', headers={'X-User': '1'})
+    client.get('/items/1', headers={'X-User': '2'})
+    assert len(app.calls) == 2
+    assert any(key.endswith('|user=2') for key in app.redis.data)
+
+def test_errors_are_not_cached(app):
+    client = app.test_client()
+    assert client.get('/items/404').status_code == 404
+    assert client.get('/items/404').status_code == 404
+    assert len(app.calls) == 2
+    assert not app.redis.data
+
+def test_successful_writes_invalidate_tagged_responses(app):
+    client = app.test_client()
+    client.get('/items/1')
+    client.get('/items/2')
+    assert client.put('/items/1').status_code == 200
+    client.get('/items/1')
+    client.get('/items/2')
+    assert [call[0] for call in app.calls] == [1, 2, 1]
+
+    # Failed writes leave the cache alone
+    client.get('/items/404')
+    assert client.put('/items/404').status_code == 404
+    assert app.redis.sets['cache_tag:{item:2}']
+    client.get('/items/2')
+    assert [call[0] for call in app.calls] == [1, 2, 1, 404]
+
+class DownRedis:
+    """A Redis client whose server can't be reached"""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError('Connection refused')
+        return fail
+
+def test_writes_succeed_while_redis_is_down(app, monkeypatch):
+    monkeypatch.setattr(redis_client, 'get_redis_client', lambda: DownRedis())
+    response = app.test_client().put('/items/1')
+    assert response.status_code == 200
+    assert response.get_json() == {'id': 1}
+
+def test_reads_fall_back_to_the_view_while_redis_is_down(app, monkeypatch):
+    monkeypatch.setattr(redis_client, 'get_redis_client', lambda: DownRedis())
+    monkeypatch.setattr(redis_client, 'get_binary_redis_client', lambda: DownRedis())
+    client = app.test_client()
+    for _ in range(2):
+        response = client.get('/items/1?page=2')
+        assert response.status_code == 200
+        assert response.get_json() == {'id': 1, 'page': '2'}
+    assert len(app.calls) == 2
@@ -0,0 +1,84 @@
+import pytest
+import asyncio
+import threading
+import time
+from backend.services.llm_service import PromptRequest
+from backend.services.semantic_cache import SemanticCache, HashingEmbedder
+
+def make_request(prompt, user_id=1, **overrides):
+    fields = {'prompt': prompt, 'model': 'openai:gpt-4', 'temperature': 0, 'user_id': user_id}
+    fields.update(overrides)
+    return PromptRequest(**fields)
+
+@pytest.fixture
+def semantic_cache():
+    return SemanticCache(threshold=0.9, max_entries=3, max_age=60, enabled=True)
+
+def test_reworded_prompt_hits(semantic_cache):
+    """Test that trivially reworded prompts reuse the cached response."""
+    semantic_cache.store(make_request('What is the capital of France?'), 'Paris')
+
+    match = semantic_cache.lookup(make_request('what is the capital of  France'))
+    assert match is not None
+    assert match[0] == 'Paris'
+    assert match[1] >= 0.9
+
+    assert semantic_cache.lookup(make_request('Write a haiku about autumn leaves')) is None
+
+def test_scopes_are_isolated(semantic_cache):
+    """Test that users, models and parameters don't share entries."""
+    semantic_cache.store(make_request('What is the capital of France?'), 'Paris')
+
+    assert semantic_cache.lookup(make_request('What is the capital of France?', user_id=2)) is None
+    assert semantic_cache.lookup(make_request('What is the capital of France?', model='openai:gpt-4o')) is None
+    assert semantic_cache.lookup(make_request('What is the capital of France?', max_tokens=5)) is None
+
+def test_anonymous_requests_are_not_cached(semantic_cache):
+    semantic_cache.store(make_request('What is the capital of France?', user_id=None), 'Paris')
+    assert semantic_cache.lookup(make_request('What is the capital of France?', user_id=None)) is None
+    assert semantic_cache.lookup(make_request('What is the capital of France?')) is None
+    assert semantic_cache.lookups == 1
+
+def test_slow_embedders_run_off_the_event_loop():
+    class ModelEmbedder(HashingEmbedder):
+        cheap = False
+
+        def embed(self, texts):
+            threads.append(threading.current_thread())
+            return super().embed(texts)
+
+    threads = []
+    cache = SemanticCache(embedder=ModelEmbedder(), threshold=0.9, enabled=True)
+
+    async def run():
+        await cache.astore(make_request('What is the capital of France?'), 'Paris')
+        return await cache.alookup(make_request('what is the capital of  France'))
+
+    assert asyncio.run(run())[0] == 'Paris'
+    assert len(threads) == 2 and threading.current_thread() not in threads
+
+def test_eviction_by_size_and_age(semantic_cache, monkeypatch):
+    """Test that the oldest entries are evicted beyond the size and age limits."""
+    prompts = ['Describe the water cycle', 'Explain photosynthesis', 'Summarize the French revolution', 'List prime numbers under 20']
+    for prompt in prompts:
+        semantic_cache.store(make_request(prompt), prompt.upper())
+
+    assert semantic_cache.lookup(make_request(prompts[0])) is None
+    assert semantic_cache.lookup(make_request(prompts[3]))[0] == prompts[3].upper()
+
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() + 120)
+    assert semantic_cache.lookup(make_request(prompts[3])) is None
+
+def test_snapshot_round_trip(semantic_cache, tmp_path):
+    """Test that indexes survive a save/load cycle."""
+    semantic_cache.store(make_request('What is the capital of France?'), 'Paris')
+    path = str(tmp_path / 'semantic.npz')
+    semantic_cache.save(path)
+
+    restored = SemanticCache(threshold=0.9, enabled=True)
+    restored.load(path)
+    assert restored.lookup(make_request('What is the capital of France?'))[0] == 'Paris'
+
+    with pytest.raises(ValueError):
+        SemanticCache(embedder=HashingEmbedder(dim=64), enabled=True).load(path)
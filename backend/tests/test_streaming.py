@@ -0,0 +1,83 @@
+import pytest
+import asyncio
+import threading
+import time
+from backend.app import create_app
+from backend.services.llm_service import llm_service
+from backend.utils.metrics import metrics
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'REDIS_URL': None,
+        'SSE_HEARTBEAT_INTERVAL': 0.05,
+    })
+    yield app
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    """Replace the provider call with a slow three-chunk stream."""
+    state = {'cancelled': threading.Event(), 'emitted': []}
+
+    async def call_provider(provider, model, prompt_request):
+        async def chunks():
+            try:
+                for text in ['Hello', ', ', 'world']:
+                    await asyncio.sleep(0.2)
+                    state['emitted'].append(text)
+                    yield text
+            except asyncio.CancelledError:
+                state['cancelled'].set()
+                raise
+        return chunks()
+
+    monkeypatch.setattr(llm_service, '_call_provider', call_provider)
+    return state
+
+def test_stream_delivers_chunks_as_they_arrive(app, fake_stream):
+    """Test that the first chunk is written before the stream completes."""
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/api/prompts/execute', json={
+        'prompt': 'Say hello',
+        'model': 'openai:gpt-3.5-turbo',
+        'stream': True,
+    }, buffered=False)
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/event-stream')
+
+    first_data_at = None
+    body = ''
+    for piece in response.response:
+        piece = piece.decode() if isinstance(piece, bytes) else piece
+        if piece.startswith('data:') and first_data_at is None:
+            first_data_at = time.perf_counter() - started
+        body += piece
+    total = time.perf_counter() - started
+
+    assert first_data_at is not None and first_data_at < total - 0.25
+    assert body.count('data: {"text"') == 3
+    assert ': heartbeat' in body
+    assert body.endswith('event: done\ndata: null\n\n')
+    assert metrics.sample_count('llm.stream.ttfb_ms', model='openai:gpt-3.5-turbo') >= 1
+
+def test_client_disconnect_cancels_upstream(app, fake_stream):
+    """Test that closing the response cancels the provider stream."""
+    client = app.test_client()
+    response = client.post('/api/prompts/execute', json={
+        'prompt': 'Say hello',
+        'model': 'openai:gpt-3.5-turbo',
+        'stream': True,
+    }, buffered=False)
+
+    iterator = iter(response.response)
+    for piece in iterator:
+        piece = piece.decode() if isinstance(piece, bytes) else piece
+        if piece.startswith('data:'):
+            break
+    response.close()
+
+    assert fake_stream['cancelled'].wait(1)
+    assert len(fake_stream['emitted']) < 3
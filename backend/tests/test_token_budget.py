@@ -0,0 +1,144 @@
+import pytest
+import asyncio
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.utils.rate_limiter import TokenBudgetExceededError, TokenBudgetLimiter
+
+def test_reserve_charges_user_and_provider_windows():
+    limiter = TokenBudgetLimiter(user_budgets={'minute': 1000, 'day': 5000}, provider_budgets={'openai': {'minute': 1500}})
+    limiter.reserve(1, 'openai', 800)
+
+    # The user's minute window is nearly spent...
+    with pytest.raises(TokenBudgetExceededError) as excinfo:
+        limiter.reserve(1, 'openai', 300)
+    assert excinfo.value.scope == 'user:1'
+    assert excinfo.value.window == 'minute'
+    assert 0 < excinfo.value.retry_after <= 60
+
+    # ...and the shared provider window stops other users too
+    with pytest.raises(TokenBudgetExceededError) as excinfo:
+        limiter.reserve(2, 'openai', 800)
+    assert excinfo.value.scope == 'provider:openai'
+
+    # Providers without a budget are only limited per user
+    limiter.reserve(2, 'anthropic', 900)
+
+def test_rejected_reservation_charges_nothing():
+    limiter = TokenBudgetLimiter(user_budgets={'minute': 1000}, provider_budgets={'openai': {'minute': 500}})
+    with pytest.raises(TokenBudgetExceededError):
+        limiter.reserve(1, 'openai', 600)
+    limiter.reserve(1, 'anthropic', 1000)
+
+def test_reconcile_refunds_unused_tokens():
+    limiter = TokenBudgetLimiter(user_budgets={'minute': 1000}, provider_budgets={})
+    reservation = limiter.reserve(1, 'openai', 900)
+    limiter.reconcile(reservation, 150)
+    limiter.reserve(1, 'openai', 850)
+
+    # Settling twice is a no-op
+    limiter.reconcile(reservation, 0)
+    with pytest.raises(TokenBudgetExceededError):
+        limiter.reserve(1, 'openai', 1)
+
+def test_anonymous_executions_share_a_budget(monkeypatch):
+    service = LLMService()
+    service.token_budgets = TokenBudgetLimiter(user_budgets={'minute': 1500}, provider_budgets={})
+
+    async def call_provider(provider, model, request):
+        return 'answer'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+
+    def execute(prompt):
+        return asyncio.run(service.execute(PromptRequest(
+            prompt=prompt, model='openai:gpt-4', max_tokens=1000, cache=False
+        )))
+
+    execute('hello')
+    service.token_budgets.reserve(None, 'openai', 1400)
+    with pytest.raises(TokenBudgetExceededError) as excinfo:
+        execute('hello again')
+    assert excinfo.value.scope == 'user:anonymous'
+
+    # Signed-in users keep their own budget
+    service.token_budgets.reserve(7, 'openai', 1400)
+
+def test_service_reserves_max_tokens_and_settles_usage(monkeypatch):
+    """Test that a large max_tokens is held only until the real usage is known."""
+    service = LLMService()
+    service.token_budgets = TokenBudgetLimiter(user_budgets={'minute': 3000}, provider_budgets={})
+    calls = []
+
+    async def call_provider(provider, model, request):
+        calls.append(model)
+        return 'short answer'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+
+    def execute(max_tokens):
+        return asyncio.run(service.execute(PromptRequest(
+            prompt='hello', model='openai:gpt-4', max_tokens=max_tokens, user_id=3, cache=False
+        )))
+
+    # Each call reserves 2000+ tokens but uses ~20, so both fit a 3000 budget
+    execute(2000)
+    execute(2000)
+    assert len(calls) == 2
+
+    with pytest.raises(TokenBudgetExceededError):
+        execute(3000)
+    assert len(calls) == 2
+
+def test_service_refunds_failed_calls(monkeypatch):
+    service = LLMService()
+    service.token_budgets = TokenBudgetLimiter(user_budgets={'minute': 1500}, provider_budgets={})
+
+    async def call_provider(provider, model, request):
+        raise ValueError('bad request')
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(service.execute(PromptRequest(
+                prompt='hello', model='openai:gpt-4', max_tokens=1000, user_id=4, cache=False
+            )))
+
+def test_cache_hits_are_served_with_an_exhausted_budget(monkeypatch):
+    service = LLMService()
+    service.token_budgets = TokenBudgetLimiter(user_budgets={'minute': 1500}, provider_budgets={})
+
+    async def call_provider(provider, model, request):
+        return 'cached answer'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    request = PromptRequest(prompt='hello', model='openai:gpt-4', temperature=0, max_tokens=1000, user_id=5)
+    asyncio.run(service.execute(request))
+
+    # Use up the rest of the minute
+    service.token_budgets.reserve(5, 'openai', 1400)
+    result = asyncio.run(service.execute(request))
+    assert result.cache_status == 'HIT'
+    assert result.output == 'cached answer'
+
+    with pytest.raises(TokenBudgetExceededError):
+        asyncio.run(service.execute(request.model_copy(update={'prompt': 'something new'})))
+
+def test_coalesced_followers_are_not_charged(monkeypatch):
+    service = LLMService()
+    service.token_budgets = TokenBudgetLimiter(user_budgets={'minute': 100000}, provider_budgets={})
+
+    async def call_provider(provider, model, request):
+        await asyncio.sleep(0.1)
+        return 'shared answer'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    request = PromptRequest(prompt='hello', model='openai:gpt-4', temperature=0.7, user_id=6)
+
+    async def burst():
+        return await asyncio.gather(*[service.execute(request) for _ in range(3)])
+
+    results = asyncio.run(burst())
+    assert sorted(result.usage.cost > 0 for result in results) == [False, False, True]
+    # Only the leader's actual usage stays charged
+    leader = next(result.usage for result in results if result.usage.cost > 0)
+    used = sum(entry[0] for key, entry in service.token_budgets._local.items() if ':user:6:' in key)
+    assert used == leader.input_tokens + leader.output_tokens
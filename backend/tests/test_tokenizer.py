@@ -0,0 +1,120 @@
+import pytest
+import asyncio
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from backend.app import create_app
+from backend.models import Prompt, PromptState, User
+from backend.models.base import Base, get_db, set_engine
+from backend.services.llm_service import LLMService, PromptRequest
+from backend.services.tokenizer import ContextWindowExceededError, Tokenizer, CONTEXT_WINDOWS
+from backend.utils.metrics import metrics
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+@pytest.fixture
+def small_window(monkeypatch):
+    """Give gpt-4 a tiny context window so tests stay fast."""
+    monkeypatch.setitem(CONTEXT_WINDOWS, 'openai:gpt-4', 200)
+
+def test_preflight_rejects_prompt_over_window(small_window):
+    request = PromptRequest(prompt='word ' * 400, model='openai:gpt-4')
+    with pytest.raises(ContextWindowExceededError):
+        Tokenizer().preflight(request)
+    assert metrics.counter('llm.preflight.rejected', model='openai:gpt-4') == 1
+
+def test_preflight_truncates_when_asked(small_window):
+    tokenizer = Tokenizer()
+    request = PromptRequest(prompt='word ' * 400, model='openai:gpt-4', max_tokens=40, truncate=True)
+    trimmed, input_tokens = tokenizer.preflight(request)
+    assert len(trimmed.prompt) < len(request.prompt)
+    assert input_tokens + trimmed.max_tokens <= 200
+    assert trimmed.max_tokens == 40
+
+def test_preflight_lowers_max_tokens(small_window):
+    request = PromptRequest(prompt='short prompt', model='openai:gpt-4', max_tokens=1000)
+    adjusted, input_tokens = Tokenizer().preflight(request)
+    assert adjusted.max_tokens == 200 - input_tokens
+    assert request.max_tokens == 1000
+
+def test_count_is_cached():
+    tokenizer = Tokenizer()
+    text = 'The same stored prompt text, counted twice'
+    assert tokenizer.count('openai:gpt-4', text) == tokenizer.count('openai:gpt-4', text)
+    assert metrics.counter('llm.tokenizer.cache_hits') == 1
+
+def test_failed_encoding_loads_are_retried(monkeypatch):
+    class Encoding:
+        name = 'cl100k_base'
+
+        def encode(self, text, disallowed_special=()):
+            return text.split()
+
+    attempts = []
+
+    def get_encoding(name):
+        if name != 'cl100k_base':
+            return Encoding()
+        attempts.append(name)
+        if len(attempts) == 1:
+            raise ConnectionError('offline')
+        return Encoding()
+
+    monkeypatch.setattr('backend.services.tokenizer.tiktoken.get_encoding', get_encoding)
+    tokenizer = Tokenizer(retry_interval=0.05)
+    assert tokenizer.preload() == ['cl100k_base']
+    # Estimated while backing off
+    assert tokenizer.count('anthropic:claude-3-haiku', 'one two three four five six seven eight') == 10
+    assert len(attempts) == 1
+
+    time.sleep(0.06)
+    assert tokenizer.count('anthropic:claude-3-haiku', 'one two three four five six seven eight') == 8
+    assert tokenizer.preload() == []
+    assert len(attempts) == 2
+
+def test_cost_uses_pricing_table():
+    assert Tokenizer.cost('openai:gpt-4', 1_000_000, 0) == 30.0
+    assert Tokenizer.cost('openai:gpt-4', 1000, 500) == 0.06
+    assert Tokenizer.cost('openai:unknown-model', 10, 10) is None
+
+def test_execute_reports_usage(monkeypatch):
+    service = LLMService()
+
+    async def call_provider(provider, model, request):
+        return 'four words of output'
+
+    monkeypatch.setattr(service, '_call_provider', call_provider)
+    result = asyncio.run(service.execute(PromptRequest(prompt='hello there', model='openai:gpt-4', cache=False)))
+    assert result.usage.input_tokens > 0
+    assert result.usage.output_tokens > 0
+    assert result.usage.cost == Tokenizer.cost('openai:gpt-4', result.usage.input_tokens, result.usage.output_tokens)
+
+def test_create_execution_backfills_tokens_and_cost():
+    app = create_app({'TESTING': True, 'REDIS_URL': None})
+    test_engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    set_engine(test_engine)
+    Base.metadata.create_all(bind=test_engine)
+    with app.app_context():
+        db = next(get_db())
+        user = User(email='tokens@example.com', display_name='Token User')
+        db.add(user)
+        db.commit()
+        db.add(Prompt(title='Prompt', prompt_text='Count the tokens in this prompt', user_id=user.id, state=PromptState.DRAFT))
+        db.commit()
+
+    response = app.test_client().post('/api/executions', json={
+        'prompt_id': 1,
+        'user_id': 1,
+        'provider': 'openai',
+        'model': 'gpt-4',
+        'response_text': 'A short answer',
+    })
+    assert response.status_code == 201
+    data = response.get_json()
+    assert data['input_tokens'] > 0
+    assert data['output_tokens'] > 0
+    assert data['cost'] > 0
@@ -0,0 +1,258 @@
+import pytest
+import json
+import redis
+import threading
+import time
+from backend.utils import redis_client
+from backend.utils.codec import codec
+from backend.utils.metrics import metrics
+from backend.utils.redis_client import cache, invalidate_cache, invalidate_tags
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.gets = 0
+        self.published = []
+        self.sets = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.ttls[key] = ttl
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == redis_client._STORE_TAGGED_SCRIPT:
+            self.setex(keys[0], argv[0], argv[1])
+            for tag_key in keys[1:]:
+                self.sets.setdefault(tag_key, set()).add(keys[0])
+        elif self.data.get(keys[0]) == argv[0]:
+            del self.data[keys[0]]
+
+    def scan_iter(self, match, count=None):
+        prefix = match.rstrip('*')
+        return [key for key in self.data if key.startswith(prefix)]
+
+    def unlink(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self.data.pop(key, None) is not None
+            self.sets.pop(key, None)
+        return removed
+
+    def rename(self, src, dst):
+        if src not in self.sets:
+            raise redis.ResponseError('no such key')
+        self.sets[dst] = self.sets.pop(src)
+
+    def sscan_iter(self, key, count=None):
+        return list(self.sets.get(key, ()))
+
+    def publish(self, channel, payload):
+        self.published.append((channel, payload))
+        return 1
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_client, 'get_redis_client', lambda: fake)
+    monkeypatch.setattr(redis_client, 'get_binary_redis_client', lambda: fake)
+    monkeypatch.setattr(redis_client, '_ensure_invalidation_listener', lambda: None)
+    redis_client._l1_cache.clear()
+    metrics.reset()
+    yield fake
+    redis_client._l1_cache.clear()
+    metrics.reset()
+
+def test_l1_serves_repeat_reads_without_redis(fake_redis):
+    calls = []
+
+    @cache(namespace='prompt')
+    def load(item_id):
+        calls.append(item_id)
+        return {'id': item_id}
+
+    assert load(1) == {'id': 1}
+    assert load(1) == {'id': 1}
+    assert calls == [1]
+    assert fake_redis.gets == 1
+    assert fake_redis.ttls['cache:load:1'] == 12 * 3600
+    assert metrics.counter('cache.hits', tier='l1', namespace='prompt') == 1
+    assert metrics.counter('cache.misses', tier='l2', namespace='prompt') == 1
+
+def test_l1_values_cannot_be_mutated_by_callers(fake_redis):
+    @cache(namespace='user')
+    def load(item_id):
+        return {'tags': ['a']}
+
+    load(1)['tags'].append('b')
+    assert load(1) == {'tags': ['a']}
+
+def test_l2_hit_fills_l1(fake_redis):
+    fake_redis.data['cache:load:2'] = '{"id": 2}'
+
+    @cache(namespace='leaderboard')
+    def load(item_id):
+        raise AssertionError('should be served from Redis')
+
+    assert load(2) == {'id': 2}
+    assert load(2) == {'id': 2}
+    assert fake_redis.gets == 1
+    assert metrics.counter('cache.hits', tier='l2', namespace='leaderboard') == 1
+
+def test_default_namespace_skips_l1(fake_redis):
+    @cache(ttl=60)
+    def load(item_id):
+        return item_id
+
+    load(3)
+    load(3)
+    assert fake_redis.gets == 2
+    assert fake_redis.ttls['cache:load:3'] == 60
+
+def test_invalidation_clears_l1_and_broadcasts(fake_redis):
+    calls = []
+
+    @cache(namespace='prompt')
+    def load(item_id):
+        calls.append(item_id)
+        return item_id
+
+    load(4)
+    invalidate_cache('cache:load:4')
+    load(4)
+    assert calls == [4, 4]
+    assert fake_redis.published[0][0] == redis_client.CACHE_INVALIDATION_CHANNEL
+
+    # A broadcast from another worker drops the entry too
+    redis_client._on_invalidation(redis_client.CACHE_INVALIDATION_CHANNEL, {'pattern': 'cache:load:*'})
+    assert len(redis_client._l1_cache) == 0
+
+def test_unknown_namespace_is_rejected():
+    with pytest.raises(ValueError):
+        cache(namespace='nope')
+
+def stored_entry(value, expires_in, delta=0.01):
+    return json.dumps({
+        redis_client._ENTRY_MARKER: 1, 'value': value, 'delta': delta, 'expires_at': time.time() + expires_in
+    })
+
+def test_concurrent_misses_compute_once(fake_redis, monkeypatch):
+    """Test that callers racing on an expired key wait for one recomputation."""
+    monkeypatch.setattr(redis_client, 'CACHE_LOCK_POLL_INTERVAL', 0.01)
+    calls = []
+
+    @cache(ttl=60)
+    def slow(item_id):
+        calls.append(item_id)
+        time.sleep(0.2)
+        return {'id': item_id}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow(5))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [5]
+    assert results == [{'id': 5}] * 8
+    assert 'lock:cache:slow:5' not in fake_redis.data
+
+def test_stale_value_served_while_refreshing(fake_redis):
+    fake_redis.data['cache:load:6'] = stored_entry('old', expires_in=-1)
+    refreshed = threading.Event()
+
+    @cache(ttl=60, stale_ttl=30)
+    def load(item_id):
+        refreshed.set()
+        return 'new'
+
+    assert load(6) == 'old'
+    assert refreshed.wait(1)
+    deadline = time.time() + 1
+    while load(6) != 'new' and time.time() < deadline:
+        time.sleep(0.01)
+    assert load(6) == 'new'
+    assert fake_redis.ttls['cache:load:6'] == 90
+    assert metrics.counter('cache.stale_served', namespace='default') >= 1
+
+def test_slow_entries_refresh_early(fake_redis, monkeypatch):
+    """Test XFetch: an entry close to expiry with a slow computation is refreshed ahead of time."""
+    fake_redis.data['cache:slow:7'] = stored_entry('old', expires_in=3, delta=2.0)
+    fake_redis.data['cache:fast:7'] = stored_entry('old', expires_in=3, delta=0.001)
+    monkeypatch.setattr(redis_client.random, 'random', lambda: 0.9)
+
+    @cache(ttl=60)
+    def slow(item_id):
+        return 'new'
+
+    @cache(ttl=60)
+    def fast(item_id):
+        return 'new'
+
+    assert slow(7) == 'old'
+    assert codec.decode(fake_redis.data['cache:slow:7'])['value'] == 'new'
+    assert fast(7) == 'old'
+    assert codec.decode(fake_redis.data['cache:fast:7'])['value'] == 'old'
+
+def test_tag_invalidation_drops_only_tagged_entries(fake_redis):
+    calls = []
+
+    @cache(namespace='prompt', tags=['prompt:{prompt_id}', 'prompts'])
+    def load(prompt_id, detail=False):
+        calls.append(prompt_id)
+        return prompt_id
+
+    load(8)
+    load(9)
+    assert fake_redis.sets['cache_tag:{prompt:8}'] == {'cache:load:8'}
+    assert fake_redis.sets['cache_tag:{prompts}'] == {'cache:load:8', 'cache:load:9'}
+
+    invalidate_tags('prompt:8')
+    load(8)
+    load(9)
+    assert calls == [8, 9, 8]
+    # Other workers are told exactly which keys to drop from their L1
+    assert fake_redis.published[-1][1] == json.dumps({'keys': ['cache:load:8']})
+
+    invalidate_tags('prompts', 'prompt:unknown')
+    assert 'cache:load:9' not in fake_redis.data
+    assert not any(key.startswith('cache_tag:{prompts}') for key in fake_redis.sets)
+    redis_client._on_invalidation(redis_client.CACHE_INVALIDATION_CHANNEL, {'keys': ['cache:load:8']})
+    assert len(redis_client._l1_cache) == 0
+
+def test_function_runs_uncached_while_redis_is_down(fake_redis, monkeypatch):
+    calls = []
+
+    @cache(ttl=60, tags=['item:{item_id}'])
+    def load(item_id):
+        calls.append(item_id)
+        return {'id': item_id}
+
+    def refuse(*args, **kwargs):
+        raise redis.ConnectionError('Connection refused')
+
+    # Storing fails: the computed result is still returned
+    monkeypatch.setattr(fake_redis, 'eval', refuse)
+    assert load(1) == {'id': 1}
+    # Reading fails too: every call runs the function
+    monkeypatch.setattr(fake_redis, 'get', refuse)
+    assert load(1) == {'id': 1}
+    assert calls == [1, 1]
+    assert metrics.counter('cache.redis_errors', namespace='default') == 2
@@ -1,8 +1,9 @@
 # Utils package initialization
 from .logging import setup_logging, get_contextual_logger, request_id_contextualizer
 from .middleware import RequestLoggingMiddleware, setup_request_context, teardown_request_context
-from .redis_client import get_redis_client, cache, invalidate_cache, RedisPubSub
-from .rate_limiter import RateLimiter
+from .redis_client import get_redis_client, cache, cache_response, invalidate_cache, RedisPubSub
+from .rate_limiter import RateLimiter, TokenBudgetLimiter, TokenBudgetExceededError
+from .event_loop import BackgroundEventLoop, get_background_loop
 
 __all__ = [
     'setup_logging',
@@ -13,7 +14,12 @@ __all__ = [
     'teardown_request_context',
     'get_redis_client',
     'cache',
+    'cache_response',
     'invalidate_cache',
     'RedisPubSub',
     'RateLimiter',
+    'TokenBudgetLimiter',
+    'TokenBudgetExceededError',
+    'BackgroundEventLoop',
+    'get_background_loop',
 ] 
\ No newline at end of file
@@ -1,10 +1,19 @@
 import os
 import json
 import uuid
+import atexit
+import queue
+import random
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
+from typing import Dict, List, Optional
 from flask import current_app, g, request
 from .logging import get_contextual_logger
+from .metrics import metrics
+from .spool import Spool
 
 logger = get_contextual_logger()
 
@@ -12,6 +21,248 @@ logger = get_contextual_logger()
 POSTHOG_API_KEY = os.environ.get('POSTHOG_API_KEY')
 POSTHOG_HOST = os.environ.get('POSTHOG_HOST', 'https://app.posthog.com')
 
+# Events buffered in memory; once full, new events are dropped
+ANALYTICS_QUEUE_SIZE = int(os.environ.get('ANALYTICS_QUEUE_SIZE', 10000))
+
+# Events per batch request, and the longest an event waits for a batch to fill
+ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', 100))
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 2))
+
+# Timeout of a batch request; only the background flusher waits on it
+ANALYTICS_TIMEOUT = float(os.environ.get('ANALYTICS_TIMEOUT', 5))
+
+# Seconds after a failed send before PostHog is tried again (batches are spooled meanwhile)
+ANALYTICS_RETRY_INTERVAL = float(os.environ.get('ANALYTICS_RETRY_INTERVAL', 10))
+
+# Share of events kept per event name, e.g. {"api_request": 0.1}; unlisted events are all kept
+ANALYTICS_SAMPLE_RATES = json.loads(os.environ.get('ANALYTICS_SAMPLE_RATES', '{}'))
+
+# Directory batches are spooled to while PostHog is unreachable (unset: they are dropped)
+ANALYTICS_SPOOL_DIR = os.environ.get('ANALYTICS_SPOOL_DIR')
+ANALYTICS_SPOOL_MAX_BYTES = int(os.environ.get('ANALYTICS_SPOOL_MAX_BYTES', 64 * 1024 * 1024))
+ANALYTICS_SPOOL_SEGMENT_BYTES = int(os.environ.get('ANALYTICS_SPOOL_SEGMENT_BYTES', 4 * 1024 * 1024))
+ANALYTICS_SPOOL_FSYNC = os.environ.get('ANALYTICS_SPOOL_FSYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Spooled batches replayed per flush interval once PostHog is back, so a backlog doesn't flood it
+ANALYTICS_REPLAY_BATCHES = int(os.environ.get('ANALYTICS_REPLAY_BATCHES', 10))
+
+
+class AnalyticsQueue:
+    """
+    Background batching queue for PostHog events
+
+    Callers only append to a bounded in-memory queue, so tracking never
+    waits on PostHog. A flusher thread (one per process, started by the
+    first event) sends events to the batch endpoint over a pooled session.
+    Batches that can't be delivered are appended to an on-disk Spool and
+    replayed in order once PostHog accepts a batch again, at most
+    replay_batches per flush interval. Events lost to overflow or sampling
+    are counted under analytics.* metrics, and spool evictions under spool.*.
+    """
+
+    def __init__(
+        self,
+        host: str = POSTHOG_HOST,
+        api_key: Optional[str] = POSTHOG_API_KEY,
+        max_events: int = ANALYTICS_QUEUE_SIZE,
+        batch_size: int = ANALYTICS_BATCH_SIZE,
+        flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+        timeout: float = ANALYTICS_TIMEOUT,
+        retry_interval: float = ANALYTICS_RETRY_INTERVAL,
+        sample_rates: Optional[Dict[str, float]] = None,
+        spool_dir: Optional[str] = ANALYTICS_SPOOL_DIR,
+        spool_max_bytes: int = ANALYTICS_SPOOL_MAX_BYTES,
+        spool_segment_bytes: int = ANALYTICS_SPOOL_SEGMENT_BYTES,
+        replay_batches: int = ANALYTICS_REPLAY_BATCHES
+    ):
+        self.host = host.rstrip('/')
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.sample_rates = ANALYTICS_SAMPLE_RATES if sample_rates is None else sample_rates
+        self.replay_batches = replay_batches
+        self.spool = None
+        if spool_dir:
+            self.spool = Spool(
+                spool_dir, name='analytics', segment_bytes=spool_segment_bytes,
+                max_bytes=spool_max_bytes, fsync=ANALYTICS_SPOOL_FSYNC
+            )
+        self._events = queue.Queue(maxsize=max_events)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Events enqueued but not yet sent, spooled or dropped
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._retry_at = 0.0
+        # Whether the spool may hold batches to replay
+        self._backlog = False
+
+    def enqueue(self, event: dict) -> bool:
+        """
+        Queue an event for sending, without blocking
+
+        Returns:
+            bool: False if the event was sampled out or the queue was full
+        """
+        rate = self.sample_rates.get(event.get('event'), 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                metrics.increment('analytics.sampled_out', event=event.get('event'))
+                return False
+            # Lets PostHog weight the events that were kept
+            event.setdefault('properties', {})['$sample_rate'] = rate
+        self._start()
+        with self._idle:
+            self._pending += 1
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self._settle(1)
+            metrics.increment('analytics.dropped', reason='overflow')
+            return False
+        metrics.increment('analytics.enqueued')
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued event has been sent, spooled or dropped"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _settle(self, count: int):
+        with self._idle:
+            self._pending -= count
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads and sockets don't survive a fork: each worker gets its own
+            self._pid = os.getpid()
+            self._session = self._create_session()
+            # Batches left by an earlier process are replayed too
+            self._backlog = self.spool is not None and self.spool.pending()
+            threading.Thread(target=self._run, name='analytics-flusher', daemon=True).start()
+
+    @staticmethod
+    def _create_session() -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                if batch:
+                    self._deliver(batch)
+                elif time.monotonic() >= self._retry_at:
+                    # Idle: work through the backlog
+                    self._replay_spooled()
+            except Exception as e:
+                logger.error("Analytics flusher failed on a batch of {}: {}", len(batch), str(e))
+                metrics.increment('analytics.dropped', len(batch), reason='error')
+            finally:
+                self._settle(len(batch))
+                metrics.set_gauge('analytics.queue_depth', self._events.qsize())
+
+    def _next_batch(self) -> List[dict]:
+        """
+        Wait for an event, then collect up to batch_size within flush_interval
+
+        With a backlog to replay, the wait is bounded and may return no events.
+        """
+        try:
+            batch = [self._events.get(timeout=max(self.flush_interval, 0.01) if self._backlog else None)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _deliver(self, batch: List[dict]):
+        if time.monotonic() < self._retry_at:
+            self._spool(batch)
+            return
+        if not self._send(batch):
+            self._retry_at = time.monotonic() + self.retry_interval
+            self._spool(batch)
+            return
+        self._replay_spooled()
+
+    def _send(self, batch: List[dict]) -> bool:
+        """POST a batch; False if PostHog should be retried later"""
+        try:
+            response = self._session.post(
+                f"{self.host}/batch/",
+                json={'api_key': self.api_key, 'batch': batch},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.warning("PostHog batch of {} failed: {}", len(batch), str(e))
+            return False
+        if response.status_code == 429 or response.status_code >= 500:
+            logger.warning("PostHog batch of {} failed with {}", len(batch), response.status_code)
+            return False
+        if response.status_code >= 400:
+            # Retrying won't make PostHog accept it
+            logger.error("PostHog rejected a batch of {}: {}", len(batch), response.status_code)
+            metrics.increment('analytics.dropped', len(batch), reason='rejected')
+            return True
+        metrics.increment('analytics.sent', len(batch))
+        return True
+
+    def _spool(self, batch: List[dict]):
+        if self.spool is None:
+            metrics.increment('analytics.dropped', len(batch), reason='unavailable')
+            return
+        try:
+            self.spool.append(json.dumps(batch).encode('utf-8'))
+        except OSError as e:
+            logger.error("Failed to spool a batch of {}: {}", len(batch), str(e))
+            metrics.increment('analytics.dropped', len(batch), reason='spool_error')
+            return
+        self._backlog = True
+        metrics.increment('analytics.spooled', len(batch))
+
+    def _replay_spooled(self):
+        """Send up to replay_batches spooled batches in order, stopping at the first failure"""
+        if not self._backlog:
+            return
+
+        def send(record: bytes) -> bool:
+            try:
+                batch = json.loads(record)
+            except ValueError:
+                logger.error("Discarding an unreadable spooled analytics batch")
+                return True
+            if not self._send(batch):
+                self._retry_at = time.monotonic() + self.retry_interval
+                return False
+            metrics.increment('analytics.replayed', len(batch))
+            return True
+
+        _, self._backlog = self.spool.replay(send, limit=self.replay_batches)
+
+analytics_queue = AnalyticsQueue()
+# Give queued events a moment to go out when the process exits
+atexit.register(analytics_queue.flush, 2.0)
+
 def get_correlation_id():
     """Get correlation ID from request or generate a new one"""
     # Check for correlation ID in headers
@@ -62,7 +313,6 @@ def track_event(event_name, properties=None, distinct_id=None):
         
     # Prepare the payload
     payload = {
-        'api_key': POSTHOG_API_KEY,
         'event': event_name,
         'properties': properties,
         'distinct_id': distinct_id,
@@ -74,16 +324,8 @@ def track_event(event_name, properties=None, distinct_id=None):
         logger.debug("Would send PostHog event: {}", json.dumps(payload))
         return
         
-    # Send the event to PostHog
-    try:
-        requests.post(
-            f"{POSTHOG_HOST}/capture/", 
-            json=payload,
-            timeout=1.0  # Short timeout to not block the request
-        )
-        logger.debug("PostHog event sent: {}", event_name)
-    except Exception as e:
-        logger.error("Failed to send PostHog event: {} - {}", event_name, str(e))
+    # Sent in the background by the batch flusher
+    analytics_queue.enqueue(payload)
 
 def identify_user(user_id, properties=None):
     """Identify a user in PostHog"""
@@ -98,21 +340,13 @@ def identify_user(user_id, properties=None):
         logger.debug("Would identify PostHog user: {} with properties: {}", user_id, properties)
         return
         
-    # Send the identify call to PostHog
-    try:
-        payload = {
-            'api_key': POSTHOG_API_KEY,
-            'distinct_id': user_id,
-            'properties': properties
-        }
-        requests.post(
-            f"{POSTHOG_HOST}/identify/",
-            json=payload,
-            timeout=1.0
-        )
-        logger.debug("PostHog user identified: {}", user_id)
-    except Exception as e:
-        logger.error("Failed to identify PostHog user: {} - {}", user_id, str(e))
+    # Sent with the next batch, as an $identify event
+    analytics_queue.enqueue({
+        'event': '$identify',
+        'distinct_id': user_id,
+        'properties': {'$set': properties},
+        'timestamp': datetime.now().isoformat()
+    })
 
 def track_api_request(endpoint, method, response_status):
     """Track an API request in PostHog"""
@@ -0,0 +1,162 @@
+"""
+Binary encoding for values stored in Redis
+
+Encoded values start with a three byte header: the format version, the
+serializer and the compression used. Readers decode anything whose
+serializer and compression they know, so writers can switch codecs with
+CACHE_CODEC / CACHE_COMPRESSION at any time once every worker runs a
+version that reads the header. Values without the header are JSON text
+written before it existed.
+"""
+import json
+import os
+import zlib
+from typing import Any, Callable, Dict, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional
+    lz4_frame = None
+
+# Format version written as the first byte of every encoded value. JSON
+# text never starts with this byte, which is how legacy values are told apart
+CODEC_VERSION = 1
+
+# Writers' serializer and compression, and the smallest payload worth compressing
+CACHE_CODEC = os.environ.get("CACHE_CODEC", "msgpack")
+CACHE_COMPRESSION = os.environ.get("CACHE_COMPRESSION", "zstd")
+CACHE_COMPRESSION_THRESHOLD = int(os.environ.get("CACHE_COMPRESSION_THRESHOLD", 1024))
+
+# name -> (header id, dumps, loads); ids are part of the stored format, never reuse one
+SERIALIZERS: Dict[str, Tuple[int, Callable[[Any], bytes], Callable[[bytes], Any]]] = {}
+# name -> (header id, compress, decompress)
+COMPRESSORS: Dict[str, Tuple[int, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+
+
+class CodecError(ValueError):
+    """Raised when a stored value can't be decoded by this worker"""
+
+
+def register_serializer(name: str, codec_id: int, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]):
+    """Make a serializer available to Codec by name"""
+    SERIALIZERS[name] = (codec_id, dumps, loads)
+
+
+def register_compressor(name: str, codec_id: int, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+    """Make a compression algorithm available to Codec by name"""
+    COMPRESSORS[name] = (codec_id, compress, decompress)
+
+
+register_serializer(
+    "json", 0,
+    lambda value: json.dumps(value, separators=(",", ":")).encode("utf-8"),
+    lambda data: json.loads(data),
+)
+register_compressor("none", 0, lambda data: data, lambda data: data)
+register_compressor("zlib", 1, lambda data: zlib.compress(data, 6), zlib.decompress)
+
+if msgpack is not None:
+    register_serializer(
+        "msgpack", 1,
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        # Non-string map keys are allowed, unlike with the JSON serializer
+        lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+    )
+
+if zstandard is not None:
+    register_compressor(
+        "zstd", 2,
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+if lz4_frame is not None:
+    register_compressor("lz4", 3, lz4_frame.compress, lz4_frame.decompress)
+
+
+class Codec:
+    """
+    Serializes values for Redis, compressing payloads above a size threshold
+
+    Serializers and compressors that aren't installed fall back to JSON and
+    zlib, so a worker without the optional packages still reads and writes
+    values, just less compactly.
+    """
+
+    def __init__(
+        self,
+        serializer: str = CACHE_CODEC,
+        compression: str = CACHE_COMPRESSION,
+        threshold: int = CACHE_COMPRESSION_THRESHOLD,
+    ):
+        if serializer not in SERIALIZERS:
+            serializer = "json"
+        if compression not in COMPRESSORS:
+            compression = "zlib" if compression != "none" else "none"
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self._serializer_id, self._dumps, _ = SERIALIZERS[serializer]
+        self._compression_id, self._compress, _ = COMPRESSORS[compression]
+        self._loads = {codec_id: loads for codec_id, _, loads in SERIALIZERS.values()}
+        self._decompress = {codec_id: decompress for codec_id, _, decompress in COMPRESSORS.values()}
+
+    def encode(self, value: Any) -> bytes:
+        """
+        Encode a value
+
+        Raises:
+            TypeError, ValueError: If the value can't be serialized
+        """
+        payload = self._dumps(value)
+        compression_id = 0
+        if self._compression_id and len(payload) >= self.threshold:
+            compressed = self._compress(payload)
+            # Incompressible payloads are stored as they are
+            if len(compressed) < len(payload):
+                payload, compression_id = compressed, self._compression_id
+        return bytes((CODEC_VERSION, self._serializer_id, compression_id)) + payload
+
+    @staticmethod
+    def is_encoded(data: Union[bytes, str]) -> bool:
+        """Whether a stored value carries the codec header"""
+        return isinstance(data, bytes) and data[:1] == bytes((CODEC_VERSION,))
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        """
+        Decode a value written by any worker's codec, or legacy JSON text
+
+        Raises:
+            CodecError: If the value uses a format this worker can't read
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not data or data[0] != CODEC_VERSION:
+            try:
+                return json.loads(data)
+            except ValueError as e:
+                raise CodecError(f"Undecodable value: {e}") from e
+        if len(data) < 3:
+            raise CodecError("Truncated value header")
+        loads = self._loads.get(data[1])
+        decompress = self._decompress.get(data[2])
+        if loads is None or decompress is None:
+            raise CodecError(f"Unsupported serializer {data[1]} or compression {data[2]}")
+        try:
+            return loads(decompress(data[3:]))
+        except Exception as e:
+            raise CodecError(f"Corrupt value: {e}") from e
+
+
+# Shared codec configured from the environment
+codec = Codec()
@@ -1,18 +1,21 @@
 from flask import g, current_app
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from ..models.base import get_engine, set_engine
 
 def get_db():
     """
     Returns a database session.
-    
-    Creates a new session if one doesn't exist for the current request.
+
+    Creates a new session if one doesn't exist for the current request. Sessions
+    are bound to the app's shared engine, so connections come from its pool
+    instead of a new engine per request.
     """
     if 'db' not in g:
-        engine = create_engine(current_app.config['DATABASE_URI'])
-        g.db = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
-    
+        session_factory = current_app.extensions.get('db_session_factory')
+        if session_factory is None:
+            session_factory = _bind_app_engine(current_app)
+        g.db = session_factory()
+
     return g.db
 
 def close_db(e=None):
@@ -20,14 +23,38 @@ def close_db(e=None):
     Close the database session at the end of the request.
     """
     db = g.pop('db', None)
-    
+
     if db is not None:
         db.close()
 
+def _bind_app_engine(app):
+    """
+    Bind the app to the process-wide engine for its DATABASE_URI.
+
+    The engine is shared with backend.models.base so model helpers and request
+    sessions check out connections from the same pool.
+    """
+    engine = get_engine(
+        app.config['DATABASE_URI'],
+        pool_size=app.config.get('DB_POOL_SIZE'),
+        max_overflow=app.config.get('DB_MAX_OVERFLOW'),
+        pool_timeout=app.config.get('DB_POOL_TIMEOUT'),
+        pool_recycle=app.config.get('DB_POOL_RECYCLE'),
+        pool_pre_ping=app.config.get('DB_POOL_PRE_PING'),
+    )
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    app.extensions['db_engine'] = engine
+    app.extensions['db_session_factory'] = session_factory
+    set_engine(engine)
+    return session_factory
+
 def init_app(app):
     """
     Initialize the database with the Flask app.
-    
-    Registers the close_db function to be called when the request ends.
+
+    Binds the app to the shared engine and registers the close_db function to
+    be called when the request ends.
     """
-    app.teardown_appcontext(close_db) 
\ No newline at end of file
+    if app.config.get('DATABASE_URI'):
+        _bind_app_engine(app)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,295 @@
+import heapq
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import redis
+from flask import current_app
+from loguru import logger
+
+from .metrics import metrics
+from .redis_client import get_redis_client
+
+# Entries kept per channel stream in Redis (trimmed approximately on XADD)
+EVENT_STREAM_MAXLEN = int(os.environ.get("EVENT_STREAM_MAXLEN", 10000))
+
+# Recent events kept per channel in each worker's ring buffer
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", 100))
+
+# How long stream reads block (must stay below REDIS_SOCKET_TIMEOUT) and how many entries they return
+EVENT_READ_BLOCK_MS = int(os.environ.get("EVENT_READ_BLOCK_MS", 1000))
+EVENT_READ_COUNT = int(os.environ.get("EVENT_READ_COUNT", 100))
+
+# Consumer groups take over entries another consumer left unacknowledged this long
+EVENT_CLAIM_IDLE_MS = int(os.environ.get("EVENT_CLAIM_IDLE_MS", 60000))
+
+# Seconds before a reader retries after a Redis error
+EVENT_RETRY_INTERVAL = float(os.environ.get("EVENT_RETRY_INTERVAL", 5))
+
+EventHandler = Callable[[str, Any], None]
+
+
+def stream_key(channel: str) -> str:
+    return f"events:{channel}"
+
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    """Stream IDs ("<ms>-<seq>") as a sortable tuple"""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class RingBuffer:
+    """
+    Recent events per channel, bounded, newest last
+
+    Each channel keeps at most max_events in a deque, so appends are O(1)
+    and old events fall off on their own. Reads walk the deques from the
+    newest end and merge channels by event ID instead of sorting.
+    """
+
+    def __init__(self, max_events: int = EVENT_BUFFER_SIZE):
+        self.max_events = max_events
+        self._channels: Dict[str, Deque[Tuple[Tuple[int, int], dict]]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, channel: str, event: dict):
+        """Add an event (with "id" set to its stream ID), ignoring ones already held"""
+        key = parse_event_id(event["id"])
+        with self._lock:
+            events = self._channels.get(channel)
+            if events is None:
+                events = self._channels[channel] = deque(maxlen=self.max_events)
+            if events and key <= events[-1][0]:
+                return
+            events.append((key, event))
+
+    def recent(self, channel: Optional[str] = None, limit: int = 10, before: Optional[str] = None) -> List[dict]:
+        """
+        Newest events first, optionally for one channel and older than a cursor
+
+        Args:
+            channel (str): Only this channel's events (default: all channels)
+            limit (int): Maximum events to return
+            before (str): Event ID cursor; only older events are returned
+        """
+        cursor = parse_event_id(before) if before else None
+        with self._lock:
+            if channel is not None:
+                sources = [list(self._channels.get(channel, ()))]
+            else:
+                sources = [list(events) for events in self._channels.values()]
+
+        def newest_first(events):
+            for key, event in reversed(events):
+                if cursor is None or key < cursor:
+                    yield key, event
+
+        merged = heapq.merge(*[newest_first(events) for events in sources], key=lambda item: item[0], reverse=True)
+        result = []
+        for _, event in merged:
+            if len(result) >= limit:
+                break
+            result.append(event)
+        return result
+
+    def is_full(self, channel: str) -> bool:
+        """Whether older events for channel may have fallen out of the buffer"""
+        with self._lock:
+            events = self._channels.get(channel)
+            return events is not None and len(events) == self.max_events
+
+    def clear(self):
+        with self._lock:
+            self._channels.clear()
+
+
+class EventBus:
+    """
+    Event bus on Redis Streams
+
+    Events are appended to one stream per channel. Each worker tails the
+    streams from the last ID it has seen into a RingBuffer, so reconnects
+    resume where they left off instead of dropping events the way pub/sub
+    does, and recent-event reads never touch Redis. Handlers that must run
+    once per event across all workers consume through a consumer group and
+    acknowledge each event after it is handled; events left unacknowledged
+    by a crashed consumer are claimed by another after EVENT_CLAIM_IDLE_MS.
+    """
+
+    def __init__(self, channels: List[str], buffer_size: int = EVENT_BUFFER_SIZE):
+        self.channels = list(channels)
+        self.buffer = RingBuffer(buffer_size)
+        self.consumer = None
+        self._groups: List[Tuple[str, EventHandler]] = []
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: Any) -> Optional[str]:
+        """
+        Append an event to a channel's stream
+
+        Returns:
+            str: The event's stream ID, or None if Redis isn't configured
+        """
+        client = get_redis_client()
+        if not client:
+            return None
+        fields = {"data": json.dumps(message), "published_at": time.time()}
+        event_id = client.xadd(stream_key(channel), fields, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+        metrics.increment("events.published", channel=channel)
+        return event_id
+
+    def consume(self, group: str, handler: EventHandler):
+        """
+        Handle every event once across all workers in the consumer group
+
+        Register before start(). The handler is called as handler(channel,
+        message); an event is acknowledged only if it returns, so handlers
+        must tolerate the occasional redelivery.
+        """
+        self._groups.append((group, handler))
+
+    def start(self):
+        """Start this worker's readers (once per process) if Redis is configured"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if not current_app.config.get('REDIS_URL'):
+                return
+            app = current_app._get_current_object()
+            # Threads don't survive a fork: restart them in each worker
+            self._pid = os.getpid()
+            self.consumer = f"{socket.gethostname()}:{self._pid}"
+            self.buffer.clear()
+            self._threads = [self._spawn(app, "event-bus-tail", self._tail)]
+            for group, handler in self._groups:
+                self._threads.append(self._spawn(app, f"event-bus-{group}", self._consume_group, group, handler))
+
+    def recent(self, channel: Optional[str] = None, limit: int = 10, before: Optional[str] = None) -> List[dict]:
+        """
+        Recent events, newest first, from this worker's buffer
+
+        When a single channel is asked for and the buffer runs out (paging
+        past what it holds), the rest is read from the channel's stream.
+        """
+        events = self.buffer.recent(channel, limit, before)
+        if channel is not None and len(events) < limit and self.buffer.is_full(channel):
+            client = get_redis_client()
+            if client is not None:
+                start = f"({events[-1]['id']}" if events else (f"({before}" if before else "+")
+                for event_id, fields in client.xrevrange(stream_key(channel), max=start, min="-", count=limit - len(events)):
+                    events.append(self._event(channel, event_id, fields))
+        return events
+
+    def _spawn(self, app, name: str, target: Callable, *args) -> threading.Thread:
+        def run():
+            with app.app_context():
+                target(*args)
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def _tail(self):
+        """Follow every channel's stream into the ring buffer, resuming from the last ID seen"""
+        last_ids: Dict[str, str] = {}
+        while True:
+            try:
+                client = get_redis_client()
+                if not last_ids:
+                    last_ids = self._backfill(client)
+                streams = {stream_key(channel): last_ids[channel] for channel in self.channels}
+                for key, entries in client.xread(streams, count=EVENT_READ_COUNT, block=EVENT_READ_BLOCK_MS) or []:
+                    channel = key[len("events:"):]
+                    for event_id, fields in entries:
+                        self.buffer.append(channel, self._event(channel, event_id, fields))
+                        last_ids[channel] = event_id
+                    metrics.increment("events.received", len(entries), channel=channel)
+            except redis.RedisError as e:
+                logger.warning(f"Event stream read failed, retrying from the last event seen: {e}")
+                time.sleep(EVENT_RETRY_INTERVAL)
+
+    def _backfill(self, client) -> Dict[str, str]:
+        """Fill the ring buffer with each channel's newest events; the IDs to tail from"""
+        last_ids = {}
+        for channel in self.channels:
+            entries = client.xrevrange(stream_key(channel), count=self.buffer.max_events)
+            for event_id, fields in reversed(entries):
+                self.buffer.append(channel, self._event(channel, event_id, fields))
+            last_ids[channel] = entries[0][0] if entries else "0-0"
+        return last_ids
+
+    def _consume_group(self, group: str, handler: EventHandler):
+        """Read the group's share of events, acknowledging each one its handler completes"""
+        created = False
+        next_claim = 0.0
+        while True:
+            try:
+                client = get_redis_client()
+                if not created:
+                    self._create_group(client, group)
+                    created = True
+                if time.monotonic() >= next_claim:
+                    next_claim = time.monotonic() + EVENT_CLAIM_IDLE_MS / 1000
+                    for channel in self.channels:
+                        _, entries, *_ = client.xautoclaim(
+                            stream_key(channel), group, self.consumer, EVENT_CLAIM_IDLE_MS, count=EVENT_READ_COUNT
+                        )
+                        self._handle(client, group, handler, channel, entries)
+                streams = {stream_key(channel): ">" for channel in self.channels}
+                for key, entries in client.xreadgroup(
+                    group, self.consumer, streams, count=EVENT_READ_COUNT, block=EVENT_READ_BLOCK_MS
+                ) or []:
+                    self._handle(client, group, handler, key[len("events:"):], entries)
+            except redis.RedisError as e:
+                logger.warning(f"Event consumer group {group} failed, retrying: {e}")
+                time.sleep(EVENT_RETRY_INTERVAL)
+
+    def _create_group(self, client, group: str):
+        for channel in self.channels:
+            try:
+                # New groups start with events published from now on
+                client.xgroup_create(stream_key(channel), group, id="$", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def _handle(self, client, group: str, handler: EventHandler, channel: str, entries):
+        """Run the handler on each entry, acknowledging the ones it completes"""
+        acked = []
+        for event_id, fields in entries:
+            if not fields:
+                # Trimmed from the stream while pending: nothing left to handle
+                acked.append(event_id)
+                continue
+            try:
+                handler(channel, json.loads(fields["data"]))
+                acked.append(event_id)
+            except Exception as e:
+                # Left pending; another delivery is attempted after EVENT_CLAIM_IDLE_MS
+                logger.error(f"Event handler for {group} failed on {channel} {event_id}: {e}")
+                metrics.increment("events.handler_errors", group=group)
+        if acked:
+            client.xack(stream_key(channel), group, *acked)
+
+    @staticmethod
+    def _event(channel: str, event_id: str, fields: Dict[str, str]) -> dict:
+        published_at = float(fields.get("published_at", parse_event_id(event_id)[0] / 1000))
+        try:
+            message = json.loads(fields.get("data", "null"))
+        except ValueError:
+            message = fields.get("data")
+        return {
+            "id": event_id,
+            "channel": channel,
+            "message": message,
+            "published_at": published_at,
+            "published_at_formatted": time.ctime(published_at),
+        }
@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+from .logging import get_contextual_logger
+
+logger = get_contextual_logger()
+
+# Message kinds passed from the loop to a consuming thread in iterate()
+_ITEM = 'item'
+_ERROR = 'error'
+_DONE = 'done'
+
+
+class BackgroundEventLoop:
+    """
+    A persistent asyncio event loop running in a daemon thread.
+
+    Request threads hand coroutines to the loop with run_coroutine_threadsafe
+    and block on the result, so coroutines from many concurrent requests
+    overlap on one loop instead of each request spinning its own. Context
+    variables (and therefore Flask's app/request context) are copied into the
+    task when it is scheduled.
+    """
+
+    def __init__(self, name: str = 'krowoc-event-loop'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first access"""
+        return self.start()
+
+    def is_running(self) -> bool:
+        return (
+            self._loop is not None
+            and self._loop.is_running()
+            and self._pid == os.getpid()
+        )
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """
+        Start the loop thread if it isn't already running in this process
+
+        The pid check restarts the loop after a fork (e.g. gunicorn --preload),
+        where the parent's thread no longer exists.
+        """
+        if self.is_running():
+            return self._loop
+
+        with self._lock:
+            if self.is_running():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+            logger.info("Started background event loop thread {}", self.name)
+
+        return self._loop
+
+    def submit(self, coro: Coroutine):
+        """
+        Schedule a coroutine on the loop
+
+        Returns:
+            concurrent.futures.Future: Future for the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the loop and block the calling thread for its result
+
+        Args:
+            coro: Coroutine to run
+            timeout: Seconds to wait before cancelling the coroutine
+
+        Returns:
+            Any: The coroutine's result
+
+        Raises:
+            TimeoutError: If the coroutine didn't finish within timeout
+        """
+        if self.is_running() and threading.current_thread() is self._thread:
+            raise RuntimeError("BackgroundEventLoop.run() called from the loop thread; await the coroutine instead")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Coroutine did not complete within {timeout} seconds")
+
+    def iterate(self, agen: AsyncIterator, heartbeat_interval: Optional[float] = None, heartbeat: Any = None) -> Iterator:
+        """
+        Drive an async iterator on the loop and yield its items synchronously
+
+        Items are handed over as soon as the loop produces them, so a WSGI
+        response built from this generator writes each chunk as it arrives.
+        If nothing arrives for heartbeat_interval seconds the heartbeat value
+        is yielded instead. Closing the generator (e.g. when the client
+        disconnects) cancels the task driving the async iterator.
+
+        The caller's context variables are captured when iterate() is called,
+        so the producer keeps the Flask context it was created under.
+
+        Args:
+            agen: Async iterator to drive
+            heartbeat_interval: Seconds of silence before yielding heartbeat
+            heartbeat: Value yielded on silence
+
+        Returns:
+            Iterator: Synchronous iterator over the async iterator's items
+        """
+        context = contextvars.copy_context()
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((_ITEM, item))
+                items.put((_DONE, None))
+            except asyncio.CancelledError:
+                items.put((_DONE, None))
+                raise
+            except BaseException as e:
+                items.put((_ERROR, e))
+            finally:
+                aclose = getattr(agen, 'aclose', None)
+                if aclose is not None:
+                    with contextlib.suppress(Exception):
+                        await aclose()
+
+        def consume():
+            # Scheduling from inside the captured context makes the task inherit it
+            future = context.run(asyncio.run_coroutine_threadsafe, pump(), self.start())
+            try:
+                while True:
+                    try:
+                        kind, value = items.get(timeout=heartbeat_interval)
+                    except queue.Empty:
+                        yield heartbeat
+                        continue
+                    if kind is _ITEM:
+                        yield value
+                    elif kind is _ERROR:
+                        raise value
+                    else:
+                        return
+            finally:
+                if not future.done():
+                    future.cancel()
+
+        return consume()
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit"""
+        with self._lock:
+            if not self.is_running():
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+            self._pid = None
+
+
+# Process-wide loop shared by all request threads
+_background_loop = BackgroundEventLoop()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """Get the process-wide background event loop"""
+    return _background_loop
+
+
+def run_in_request_loop(coro: Coroutine) -> Any:
+    """
+    Run a coroutine on an event loop owned by the calling thread
+
+    This is the legacy per-request mode: each worker thread gets its own loop
+    and blocks it for the full duration of the coroutine.
+    """
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+    return loop.run_until_complete(coro)
@@ -0,0 +1,112 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+
+class LatencySummary:
+    """Running count/sum/max plus a window of recent samples for quantiles"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50': round(self.quantile(0.5) or 0.0, 3),
+            'p95': round(self.quantile(0.95) or 0.0, 3),
+            'p99': round(self.quantile(0.99) or 0.0, 3),
+            'max': round(self.max, 3),
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and latency summaries
+
+    Metric names can carry labels, which are folded into the key as
+    name{label=value,...} so snapshots stay flat and JSON friendly.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._timings = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> str:
+        if not labels:
+            return name
+        rendered = ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+        return f"{name}{{{rendered}}}"
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a latency (or any distribution) sample"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._timings.get(key)
+            if summary is None:
+                summary = self._timings[key] = LatencySummary(self._window)
+            summary.observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def quantile(self, name: str, q: float, **labels) -> Optional[float]:
+        """Get a quantile over the recent samples of a summary, if any"""
+        with self._lock:
+            summary = self._timings.get(self._key(name, labels))
+            return summary.quantile(q) if summary else None
+
+    def sample_count(self, name: str, **labels) -> int:
+        with self._lock:
+            summary = self._timings.get(self._key(name, labels))
+            return len(summary.samples) if summary else 0
+
+    def snapshot(self) -> dict:
+        """Get all metrics as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': {key: summary.to_dict() for key, summary in self._timings.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
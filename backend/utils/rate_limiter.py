@@ -1,16 +1,351 @@
+from dataclasses import dataclass, field, replace
 from functools import wraps
 from flask import request, jsonify, current_app
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import threading
 import time
-from .redis_client import get_redis_client
+import uuid
+import redis
+from .redis_client import get_async_redis_client, get_redis_client
 from .logging import get_contextual_logger
+from .lru import LRUCache
+from .metrics import metrics
 
 logger = get_contextual_logger()
 
+# Longest a leased batch of permits may be spent locally (seconds)
+RATE_LIMIT_LEASE_TTL = float(os.environ.get("RATE_LIMIT_LEASE_TTL", 1.0))
+
+# Rate limit keys tracked in-process (leases and fallback buckets)
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.environ.get("RATE_LIMIT_LOCAL_MAX_KEYS", 10000))
+
+# Workers sharing a limit; each enforces limit / divisor while Redis is down
+RATE_LIMIT_FALLBACK_DIVISOR = int(os.environ.get("RATE_LIMIT_FALLBACK_DIVISOR", 1))
+
+# Seconds to stay on local limits after a Redis error before trying Redis again
+RATE_LIMIT_REDIS_RETRY_INTERVAL = float(os.environ.get("RATE_LIMIT_REDIS_RETRY_INTERVAL", 5.0))
+
+# Rate limiting algorithms
+FIXED_WINDOW = "fixed_window"
+SLIDING_WINDOW = "sliding_window"
+SLIDING_LOG = "sliding_log"
+TOKEN_BUCKET = "token_bucket"
+
+# Each script asks for up to ARGV[1] permits (more than one when leasing)
+# and returns {permits granted, remaining, ms until reset, ms until retry}
+# in a single round-trip; 0 granted means rejected. Times are milliseconds.
+
+# KEYS[1] counter; ARGV permits, limit, window. The expiry is set when the
+# window opens and never extended, so a steady client is unblocked when it ends.
+_FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local used = tonumber(redis.call('get', KEYS[1]) or '0')
+local granted = math.min(tonumber(ARGV[1]), limit - used)
+if granted > 0 then
+    used = redis.call('incrby', KEYS[1], granted)
+end
+local ttl = redis.call('pttl', KEYS[1])
+if ttl < 0 and used > 0 then
+    ttl = tonumber(ARGV[3])
+    redis.call('pexpire', KEYS[1], ttl)
+end
+if granted <= 0 then
+    return {0, 0, ttl, ttl}
+end
+return {granted, limit - used, ttl, 0}
+"""
+
+# KEYS[1] current window counter, KEYS[2] previous window counter;
+# ARGV permits, limit, window, ms elapsed in the current window. The
+# previous window's count is weighted by how much of it still overlaps.
+_SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local elapsed = tonumber(ARGV[4])
+local current = tonumber(redis.call('get', KEYS[1]) or '0')
+local previous = tonumber(redis.call('get', KEYS[2]) or '0')
+local weighted = previous * (window - elapsed) / window
+local reset = window - elapsed
+local granted = math.min(tonumber(ARGV[1]), math.floor(limit - weighted - current))
+if granted < 1 then
+    local retry = reset
+    if previous > 0 and current + 1 <= limit then
+        retry = math.ceil(window - (limit - current - 1) * window / previous - elapsed)
+    end
+    return {0, 0, reset, math.max(retry, 1)}
+end
+current = redis.call('incrby', KEYS[1], granted)
+if current == granted then
+    redis.call('pexpire', KEYS[1], window * 2)
+end
+return {granted, math.floor(limit - weighted - current), reset, 0}
+"""
+
+# KEYS[1] sorted set of request times; ARGV permits (always 1), limit,
+# window, now, unique member
+_SLIDING_LOG_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now - window)
+local count = redis.call('zcard', KEYS[1])
+if count >= limit then
+    local oldest = redis.call('zrange', KEYS[1], 0, 0, 'WITHSCORES')
+    local retry = tonumber(oldest[2]) + window - now
+    return {0, 0, retry, math.max(retry, 1)}
+end
+redis.call('zadd', KEYS[1], now, ARGV[5])
+redis.call('pexpire', KEYS[1], window)
+local oldest = redis.call('zrange', KEYS[1], 0, 0, 'WITHSCORES')
+return {1, limit - count - 1, tonumber(oldest[2]) + window - now, 0}
+"""
+
+# KEYS[1] hash of tokens and last refill time; ARGV permits, capacity,
+# tokens per ms, now
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local granted = math.min(tonumber(ARGV[1]), math.floor(tokens))
+local retry = 0
+if granted > 0 then
+    tokens = tokens - granted
+else
+    granted = 0
+    retry = math.ceil((1 - tokens) / rate)
+end
+local full_in = math.ceil((capacity - tokens) / rate)
+redis.call('hset', KEYS[1], 'tokens', tokens, 'ts', now)
+-- A bucket that would have refilled completely carries no state
+redis.call('pexpire', KEYS[1], math.max(full_in, 1))
+return {granted, math.floor(tokens), full_in, retry}
+"""
+
+_ALGORITHM_SCRIPTS = {
+    FIXED_WINDOW: _FIXED_WINDOW_SCRIPT,
+    SLIDING_WINDOW: _SLIDING_WINDOW_SCRIPT,
+    SLIDING_LOG: _SLIDING_LOG_SCRIPT,
+    TOKEN_BUCKET: _TOKEN_BUCKET_SCRIPT,
+}
+
+# Registered scripts per source; rebuilt if the Redis client changes
+_registered_scripts = {}
+
+
+def _registered(client, source: str):
+    """Script bound to client, run with EVALSHA (loaded on first NOSCRIPT)"""
+    script = _registered_scripts.get(source)
+    if script is None or script.registered_client is not client:
+        script = _registered_scripts[source] = client.register_script(source)
+    return script
+
+
+@dataclass
+class RateLimitDecision:
+    """Outcome of one rate limit check, with the values for the response headers"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float = 0.0
+    granted: int = 1
+
+    @property
+    def reset_at(self) -> int:
+        return int(time.time() + self.reset_after)
+
+
+class PermitLeases:
+    """
+    Permits leased from Redis in batches and spent in-process.
+
+    A high-rate client would otherwise cost a Redis round-trip per request;
+    with a lease of n permits it costs one per n requests on each worker.
+    Permits left unspent when a lease expires are lost, so a worker can
+    under-use the limit by up to one lease but never exceed it.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        # key -> [permits left, decision the lease was granted with, monotonic grant time]
+        self._leases = LRUCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> Optional[RateLimitDecision]:
+        """Spend a leased permit, or return None if there is no live lease"""
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] <= 0:
+                return None
+            lease[0] -= 1
+            permits, decision, granted_at = lease
+        return RateLimitDecision(
+            allowed=True,
+            limit=decision.limit,
+            remaining=decision.remaining + permits,
+            reset_after=max(0.0, decision.reset_after - (time.monotonic() - granted_at)),
+        )
+
+    def grant(self, key: str, decision: RateLimitDecision, ttl: float):
+        """Keep the permits of a new lease beyond the one spent on this request"""
+        if decision.granted > 1 and ttl > 0:
+            self._leases.set(key, [decision.granted - 1, decision, time.monotonic()], ttl=ttl)
+            metrics.increment("rate_limit.leased_permits", decision.granted)
+
+    def clear(self):
+        self._leases.clear()
+
+
+class LocalBuckets:
+    """
+    In-process token buckets used while Redis is unreachable.
+
+    Each worker enforces its share of the limit (the limit divided by
+    RATE_LIMIT_FALLBACK_DIVISOR) on its own, so an outage degrades to an
+    approximate limit rather than no limit at all.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS, divisor: int = RATE_LIMIT_FALLBACK_DIVISOR):
+        # key -> [tokens, last refill time]
+        self._buckets = LRUCache(max_entries=max_keys)
+        self.divisor = max(1, divisor)
+        self._lock = threading.Lock()
+
+    def check(self, key: str, requests_limit: int, time_window: float, burst: Optional[int] = None) -> RateLimitDecision:
+        capacity = max(1, (burst or requests_limit) // self.divisor)
+        rate = max(1, requests_limit // self.divisor) / time_window
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(capacity), now]
+                self._buckets.set(key, bucket)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            tokens = bucket[0]
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=capacity,
+            remaining=int(tokens),
+            reset_after=(capacity - tokens) / rate,
+            retry_after=0.0 if allowed else (1 - tokens) / rate,
+            granted=int(allowed),
+        )
+
+    def clear(self):
+        self._buckets.clear()
+
+
+# Algorithms whose scripts can grant a batch of permits at once
+LEASABLE_ALGORITHMS = {FIXED_WINDOW, SLIDING_WINDOW, TOKEN_BUCKET}
+
+# Process-wide local tiers shared by every limited route
+_leases = PermitLeases()
+_fallback = LocalBuckets()
+_redis_retry_at = 0.0
+
+
 class RateLimiter:
     """Rate limiting implementation using Redis"""
-    
+
+    @staticmethod
+    def check(client, key, requests_limit=100, time_window=60, algorithm=FIXED_WINDOW, burst=None, permits=1):
+        """
+        Count a request against key and decide whether it is allowed
+
+        Every algorithm runs as a single Lua script, so the decision and the
+        header values take one Redis round-trip.
+
+        Args:
+            client: Redis client
+            key (str): Rate limit key
+            requests_limit (int): Requests allowed per time window
+            time_window (int): Time window in seconds
+            algorithm (str): FIXED_WINDOW, SLIDING_WINDOW, SLIDING_LOG or TOKEN_BUCKET
+            burst (int): Token bucket capacity (defaults to requests_limit)
+            permits (int): Permits to take at once; fewer may be granted
+
+        Returns:
+            RateLimitDecision
+        """
+        if algorithm not in _ALGORITHM_SCRIPTS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        if permits > 1 and algorithm not in LEASABLE_ALGORITHMS:
+            raise ValueError(f"{algorithm} can't grant more than one permit at a time")
+        window_ms = int(time_window * 1000)
+        now_ms = int(time.time() * 1000)
+        limit = requests_limit
+
+        if algorithm == FIXED_WINDOW:
+            keys, args = [key], [permits, requests_limit, window_ms]
+        elif algorithm == SLIDING_WINDOW:
+            index = now_ms // window_ms
+            keys = [f"{key}:{index}", f"{key}:{index - 1}"]
+            args = [permits, requests_limit, window_ms, now_ms - index * window_ms]
+        elif algorithm == SLIDING_LOG:
+            keys, args = [key], [1, requests_limit, window_ms, now_ms, f"{now_ms}:{uuid.uuid4().hex[:8]}"]
+        else:
+            limit = burst or requests_limit
+            keys, args = [key], [permits, limit, requests_limit / window_ms, now_ms]
+
+        granted, remaining, reset_ms, retry_ms = _registered(client, _ALGORITHM_SCRIPTS[algorithm])(keys=keys, args=args)
+        return RateLimitDecision(
+            allowed=granted > 0,
+            limit=limit,
+            remaining=max(0, int(remaining)),
+            reset_after=int(reset_ms) / 1000,
+            retry_after=int(retry_ms) / 1000,
+            granted=int(granted),
+        )
+
+    @staticmethod
+    def admit(client, key, requests_limit=100, time_window=60, algorithm=FIXED_WINDOW, burst=None, lease=1):
+        """
+        Decide a request, spending a locally leased permit when there is one
+
+        With lease > 1, a trip to Redis asks for a batch of permits; the
+        spares are spent in-process for up to RATE_LIMIT_LEASE_TTL seconds
+        (never past the window's reset). If Redis fails, requests are
+        decided by per-worker LocalBuckets until
+        RATE_LIMIT_REDIS_RETRY_INTERVAL has passed.
+
+        Returns:
+            RateLimitDecision
+        """
+        global _redis_retry_at
+        if lease > 1:
+            decision = _leases.take(key)
+            if decision is not None:
+                metrics.increment("rate_limit.decisions", tier="lease")
+                return decision
+
+        if time.monotonic() >= _redis_retry_at:
+            try:
+                decision = RateLimiter.check(client, key, requests_limit, time_window, algorithm, burst, permits=lease)
+            except redis.RedisError as e:
+                logger.warning(f"Rate limit check failed, using local limits for {RATE_LIMIT_REDIS_RETRY_INTERVAL}s: {e}")
+                _redis_retry_at = time.monotonic() + RATE_LIMIT_REDIS_RETRY_INTERVAL
+            else:
+                metrics.increment("rate_limit.decisions", tier="redis")
+                if decision.granted > 1:
+                    _leases.grant(key, decision, min(RATE_LIMIT_LEASE_TTL, decision.reset_after))
+                    # Permits leased by this worker still count as remaining for the client
+                    return replace(decision, remaining=decision.remaining + decision.granted - 1)
+                return decision
+
+        metrics.increment("rate_limit.decisions", tier="local")
+        return _fallback.check(key, requests_limit, time_window, burst)
+
     @staticmethod
-    def limit(requests_limit=100, time_window=60, key_prefix='rate_limit'):
+    def limit(requests_limit=100, time_window=60, key_prefix='rate_limit', algorithm=FIXED_WINDOW, burst=None, lease=1):
         """
         Decorator to apply rate limiting to Flask routes
         
@@ -18,10 +353,21 @@ class RateLimiter:
             requests_limit (int): Maximum number of requests allowed in the time window
             time_window (int): Time window in seconds
             key_prefix (str): Prefix for Redis keys
+            algorithm (str): FIXED_WINDOW, SLIDING_WINDOW, SLIDING_LOG or TOKEN_BUCKET
+            burst (int): Token bucket capacity (defaults to requests_limit)
+            lease (int): Permits to lease from Redis per round-trip (capped at a
+                tenth of the limit); 1 checks Redis on every request
             
         Returns:
             Callable: Decorated route function
         """
+        if algorithm not in _ALGORITHM_SCRIPTS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        if lease > 1 and algorithm not in LEASABLE_ALGORITHMS:
+            raise ValueError(f"Permits can't be leased with {algorithm}")
+        # A worker may hold at most a tenth of the limit, so leases can't starve other workers
+        lease = max(1, min(lease, requests_limit // 10))
+
         def decorator(f):
             @wraps(f)
             def wrapped_function(*args, **kwargs):
@@ -43,32 +389,23 @@ class RateLimiter:
                     client_id = f"apikey:{request.headers.get('X-API-Key')}"
                 
                 # Create Redis key
-                key = f"{key_prefix}:{client_id}:{request.path}"
-                
-                # Get current count and increment
-                pipe = redis_client.pipeline()
-                pipe.incr(key)
-                pipe.expire(key, time_window)  # Reset after time window
-                result = pipe.execute()
-                
-                current_count = result[0]
-                
+                key = f"{key_prefix}:{algorithm}:{client_id}:{request.path}"
+                decision = RateLimiter.admit(redis_client, key, requests_limit, time_window, algorithm, burst, lease)
                 # Check if rate limit exceeded
-                if current_count > requests_limit:
+                if not decision.allowed:
                     logger.warning(f"Rate limit exceeded for {client_id} on {request.path}")
-                    
-                    # Calculate reset time
-                    ttl = redis_client.ttl(key)
-                    reset_time = int(time.time() + ttl)
+                    metrics.increment("rate_limit.rejected", algorithm=algorithm)
                     
                     # Return rate limit exceeded response
                     response = jsonify({
                         'error': 'Rate limit exceeded',
-                        'limit': requests_limit,
+                        'limit': decision.limit,
                         'remaining': 0,
-                        'reset': reset_time
+                        'reset': decision.reset_at
                     })
                     response.status_code = 429  # Too Many Requests
+                    response.headers['Retry-After'] = str(max(1, int(decision.retry_after + 0.999)))
+                    RateLimiter._set_headers(response, decision)
                     return response
                 
                 # Add rate limit headers to response
@@ -78,14 +415,264 @@ class RateLimiter:
                 if not hasattr(response, 'headers'):
                     return response
                 
-                # Add rate limit headers
-                ttl = redis_client.ttl(key)
-                reset_time = int(time.time() + ttl)
-                
-                response.headers['X-RateLimit-Limit'] = str(requests_limit)
-                response.headers['X-RateLimit-Remaining'] = str(max(0, requests_limit - current_count))
-                response.headers['X-RateLimit-Reset'] = str(reset_time)
-                
+                RateLimiter._set_headers(response, decision)
                 return response
             return wrapped_function
-        return decorator 
\ No newline at end of file
+        return decorator
+
+    @staticmethod
+    def _set_headers(response, decision):
+        response.headers['X-RateLimit-Limit'] = str(decision.limit)
+        response.headers['X-RateLimit-Remaining'] = str(decision.remaining)
+        response.headers['X-RateLimit-Reset'] = str(decision.reset_at)
+
+
+# Token budgets per user (0 disables a window)
+LLM_USER_TOKENS_PER_MINUTE = int(os.environ.get("LLM_USER_TOKENS_PER_MINUTE", 100000))
+LLM_USER_TOKENS_PER_DAY = int(os.environ.get("LLM_USER_TOKENS_PER_DAY", 2000000))
+
+# Token budgets per provider key, e.g. {"openai": {"minute": 300000, "day": 10000000}}
+LLM_PROVIDER_TOKEN_BUDGETS: Dict[str, Dict[str, int]] = json.loads(os.environ.get("LLM_PROVIDER_TOKEN_BUDGETS") or "{}")
+
+# Budget windows and their length in seconds
+TOKEN_BUDGET_WINDOWS = {"minute": 60, "day": 86400}
+
+# Charge every window only if all of them have room: KEYS are window
+# counters, ARGV is the amount followed by (limit, ttl) per key. Returns the
+# 1-based index of the first exhausted window, or 0 when reserved.
+_RESERVE_TOKENS_SCRIPT = """
+local amount = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    local used = tonumber(redis.call('get', key) or '0')
+    if used + amount > tonumber(ARGV[i * 2]) then
+        return i
+    end
+end
+for i, key in ipairs(KEYS) do
+    if redis.call('incrby', key, amount) == amount then
+        redis.call('expire', key, tonumber(ARGV[i * 2 + 1]))
+    end
+end
+return 0
+"""
+
+# Adjust window counters that still exist by ARGV[1] (negative refunds)
+_RECONCILE_TOKENS_SCRIPT = """
+local delta = tonumber(ARGV[1])
+for _, key in ipairs(KEYS) do
+    if redis.call('exists', key) == 1 then
+        if redis.call('incrby', key, delta) < 0 then
+            redis.call('set', key, 0, 'keepttl')
+        end
+    end
+end
+return 0
+"""
+
+
+class TokenBudgetExceededError(Exception):
+    """Raised when a request would exceed a user or provider token budget"""
+
+    def __init__(self, scope: str, window: str, limit: int, retry_after: float):
+        super().__init__(f"Token budget exceeded for {scope} ({limit} tokens per {window}); retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.window = window
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+@dataclass
+class TokenReservation:
+    """Tokens held against a set of budget windows until the call's usage is known"""
+    tokens: int
+    keys: List[str] = field(default_factory=list)
+    settled: bool = False
+
+
+class TokenBudgetLimiter:
+    """
+    Token-aware rate limiting for LLM calls.
+
+    Request counts treat a 4k-token gpt-4 call the same as a 50-token haiku
+    call, so LLM calls are also charged against per-minute and per-day token
+    budgets for the user and for the provider key. Anonymous callers share
+    one "anonymous" user budget. Before a call the estimated input tokens
+    plus max_tokens are reserved in every window at once (or not at all);
+    once the real usage is known the reservation is reconciled and the
+    difference refunded. Windows are fixed and stored as
+    Redis counters updated by Lua scripts, so concurrent workers can't
+    overshoot; without Redis each worker keeps its own counters.
+    """
+
+    def __init__(
+        self,
+        user_budgets: Optional[Dict[str, int]] = None,
+        provider_budgets: Optional[Dict[str, Dict[str, int]]] = None,
+        key_prefix: str = "token_budget",
+    ):
+        self.user_budgets = user_budgets if user_budgets is not None else {
+            "minute": LLM_USER_TOKENS_PER_MINUTE,
+            "day": LLM_USER_TOKENS_PER_DAY,
+        }
+        self.provider_budgets = provider_budgets if provider_budgets is not None else LLM_PROVIDER_TOKEN_BUDGETS
+        self.key_prefix = key_prefix
+        # key -> [tokens used, window end]
+        self._local: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, user_id: Optional[int], provider: str, tokens: int) -> TokenReservation:
+        """
+        Reserve tokens in the user's and the provider's budgets
+
+        Raises:
+            TokenBudgetExceededError: If any budget window lacks room
+        """
+        windows = self._windows(user_id, provider)
+        reservation = TokenReservation(tokens=tokens, keys=[key for key, _, _, _ in windows])
+        if not windows or tokens <= 0:
+            return reservation
+
+        client = self._redis()
+        if client is not None:
+            try:
+                index = _registered(client, _RESERVE_TOKENS_SCRIPT)(keys=reservation.keys, args=self._reserve_args(windows, tokens))
+                return self._checked(reservation, windows[index - 1] if index else None)
+            except redis.RedisError as e:
+                logger.warning(f"Token budget Redis check failed, using local counters: {e}")
+        return self._reserve_local(windows, reservation)
+
+    async def reserve_async(self, user_id: Optional[int], provider: str, tokens: int) -> TokenReservation:
+        """reserve() for coroutines: the Redis script runs without blocking the event loop"""
+        windows = self._windows(user_id, provider)
+        reservation = TokenReservation(tokens=tokens, keys=[key for key, _, _, _ in windows])
+        if not windows or tokens <= 0:
+            return reservation
+
+        client = self._async_redis()
+        if client is not None:
+            try:
+                index = await _registered(client, _RESERVE_TOKENS_SCRIPT)(keys=reservation.keys, args=self._reserve_args(windows, tokens))
+                return self._checked(reservation, windows[index - 1] if index else None)
+            except redis.RedisError as e:
+                logger.warning(f"Token budget Redis check failed, using local counters: {e}")
+        return self._reserve_local(windows, reservation)
+
+    @staticmethod
+    def _reserve_args(windows: List[Tuple[str, str, int, int]], tokens: int) -> list:
+        argv = [tokens]
+        for _, _, limit, ttl in windows:
+            argv.extend([limit, ttl])
+        return argv
+
+    def _reserve_local(self, windows: List[Tuple[str, str, int, int]], reservation: TokenReservation) -> TokenReservation:
+        tokens = reservation.tokens
+        exhausted = None
+        now = time.time()
+        with self._lock:
+            for key, scope, limit, ttl in windows:
+                used = self._local.get(key, (0,))[0]
+                if used + tokens > limit:
+                    exhausted = (key, scope, limit, ttl)
+                    break
+            else:
+                for key, _, _, ttl in windows:
+                    entry = self._local.setdefault(key, [0, now + ttl])
+                    entry[0] += tokens
+                self._prune(now)
+        return self._checked(reservation, exhausted)
+
+    def reconcile(self, reservation: TokenReservation, actual_tokens: int):
+        """Replace a reservation with the tokens the call actually used"""
+        delta = self._settle(reservation, actual_tokens)
+        if not delta:
+            return
+        client = self._redis()
+        if client is not None:
+            try:
+                _registered(client, _RECONCILE_TOKENS_SCRIPT)(keys=reservation.keys, args=[delta])
+                return
+            except redis.RedisError as e:
+                logger.warning(f"Token budget Redis reconcile failed, using local counters: {e}")
+        self._reconcile_local(reservation, delta)
+
+    async def reconcile_async(self, reservation: TokenReservation, actual_tokens: int):
+        """reconcile() for coroutines"""
+        delta = self._settle(reservation, actual_tokens)
+        if not delta:
+            return
+        client = self._async_redis()
+        if client is not None:
+            try:
+                await _registered(client, _RECONCILE_TOKENS_SCRIPT)(keys=reservation.keys, args=[delta])
+                return
+            except redis.RedisError as e:
+                logger.warning(f"Token budget Redis reconcile failed, using local counters: {e}")
+        self._reconcile_local(reservation, delta)
+
+    @staticmethod
+    def _settle(reservation: TokenReservation, actual_tokens: int) -> int:
+        """Mark a reservation settled; the tokens to refund (negative) or charge, 0 if nothing to do"""
+        if reservation.settled:
+            return 0
+        reservation.settled = True
+        metrics.increment("llm.token_budget.used_tokens", actual_tokens)
+        if not reservation.keys:
+            return 0
+        return actual_tokens - reservation.tokens
+
+    def _reconcile_local(self, reservation: TokenReservation, delta: int):
+        with self._lock:
+            for key in reservation.keys:
+                entry = self._local.get(key)
+                if entry is not None:
+                    entry[0] = max(0, entry[0] + delta)
+
+    def _windows(self, user_id: Optional[int], provider: str) -> List[Tuple[str, str, int, int]]:
+        """(key, scope, limit, seconds until the window ends) for every enforced window"""
+        now = int(time.time())
+        # Anonymous callers can't be told apart, so they share one user budget
+        user_scope = f"user:{user_id}" if user_id is not None else "user:anonymous"
+        budgets = [(user_scope, self.user_budgets)]
+        budgets.append((f"provider:{provider}", self.provider_budgets.get(provider, {})))
+        windows = []
+        for scope, limits in budgets:
+            for window, seconds in TOKEN_BUDGET_WINDOWS.items():
+                limit = limits.get(window, 0)
+                if limit:
+                    index = now // seconds
+                    windows.append((
+                        f"{self.key_prefix}:{scope}:{window}:{index}",
+                        f"{scope}/{window}",
+                        limit,
+                        (index + 1) * seconds - now,
+                    ))
+        return windows
+
+    def _checked(self, reservation: TokenReservation, exhausted) -> TokenReservation:
+        if exhausted is None:
+            metrics.increment("llm.token_budget.reserved_tokens", reservation.tokens)
+            return reservation
+        _, scope, limit, ttl = exhausted
+        scope, window = scope.rsplit("/", 1)
+        metrics.increment("llm.token_budget.rejected", scope=scope.split(":", 1)[0], window=window)
+        logger.warning(f"Token budget exceeded for {scope} per {window}: {reservation.tokens} tokens requested")
+        raise TokenBudgetExceededError(scope, window, limit, ttl)
+
+    def _prune(self, now: float):
+        for key in [key for key, (_, window_end) in self._local.items() if window_end <= now]:
+            del self._local[key]
+
+    @staticmethod
+    def _redis():
+        try:
+            return get_redis_client()
+        except RuntimeError:
+            # Outside an app context there is no Redis configuration
+            return None
+
+    @staticmethod
+    def _async_redis():
+        try:
+            return get_async_redis_client()
+        except RuntimeError:
+            return None
@@ -1,13 +1,116 @@
+import asyncio
 import redis
-from flask import current_app
+import redis.asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, current_app, g, has_app_context, request
+import base64
+import hashlib
+from urllib.parse import urlencode
+import fnmatch
+import inspect
 import json
-from typing import Any, Optional, Dict, List, Callable
+import math
+import os
+import random
+import threading
+import uuid
+from typing import Any, Optional, Dict, List, Callable, Tuple
 from functools import wraps
 import time
 from loguru import logger
+from .codec import CodecError, codec
+from .lru import LRUCache
+from .metrics import metrics
 
-# Singleton Redis client instance
+# Singleton Redis client instances: text replies, and raw bytes for codec-encoded values
 _redis_client = None
+_binary_redis_client = None
+
+# Connection pool tuning, overridable per app through app.config. Callers
+# wait up to REDIS_POOL_TIMEOUT seconds for a free connection instead of
+# opening more than REDIS_MAX_CONNECTIONS per pool. Idle connections are
+# PINGed before reuse once REDIS_HEALTH_CHECK_INTERVAL seconds have passed
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get("REDIS_SOCKET_CONNECT_TIMEOUT", 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# asyncio clients are bound to the loop that created their connections:
+# loop -> {binary flag: (client, AutoPipeline)}
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+# Cache TTL tiers as (in-process L1 seconds, Redis L2 seconds). An L1 TTL of
+# 0 keeps the namespace out of process memory. Override or add namespaces
+# with CACHE_NAMESPACE_TTLS, e.g. {"leaderboard": [5, 600]}
+CACHE_NAMESPACE_TTLS: Dict[str, Tuple[float, int]] = {
+    "default": (0, 300),
+    "user": (30, 2 * 3600),
+    "prompt": (60, 12 * 3600),
+    "leaderboard": (5, 10 * 60),
+}
+CACHE_NAMESPACE_TTLS.update({
+    namespace: tuple(ttls)
+    for namespace, ttls in json.loads(os.environ.get("CACHE_NAMESPACE_TTLS") or "{}").items()
+})
+
+# Entries kept in each worker's in-process cache tier
+CACHE_L1_MAX_ENTRIES = int(os.environ.get("CACHE_L1_MAX_ENTRIES", 2048))
+
+# Channel carrying invalidated key patterns to every worker's L1
+CACHE_INVALIDATION_CHANNEL = "cache_invalidation"
+
+# Seconds before resubscribing after the invalidation subscription drops
+CACHE_INVALIDATION_RETRY_INTERVAL = float(os.environ.get("CACHE_INVALIDATION_RETRY_INTERVAL", 5))
+
+# Stampede protection: how long one caller may hold a key's recompute lock
+# (others wait up to this long), how often waiters poll, and the default
+# XFetch beta for refreshing entries ahead of expiry
+CACHE_LOCK_TIMEOUT = float(os.environ.get("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_POLL_INTERVAL = float(os.environ.get("CACHE_LOCK_POLL_INTERVAL", 0.05))
+CACHE_XFETCH_BETA = float(os.environ.get("CACHE_XFETCH_BETA", 1.0))
+
+# Threads refreshing stale entries in the background, per worker
+CACHE_REFRESH_WORKERS = int(os.environ.get("CACHE_REFRESH_WORKERS", 4))
+
+# Keys deleted (and broadcast to other workers' L1) per SCAN/SSCAN + UNLINK batch
+CACHE_INVALIDATION_BATCH_SIZE = int(os.environ.get("CACHE_INVALIDATION_BATCH_SIZE", 500))
+
+# Marks Redis entries that carry expiry metadata alongside the value
+_ENTRY_MARKER = "__cache_entry__"
+
+# Delete a lock only if it still holds our token
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Store an entry and add its key to each tag's set (KEYS[2:]) in one round-trip.
+# Tag sets live as long as their longest-lived entry
+_STORE_TAGGED_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+redis.call('set', KEYS[1], ARGV[2], 'EX', ttl)
+for i = 2, #KEYS do
+    redis.call('sadd', KEYS[i], KEYS[1])
+    if redis.call('ttl', KEYS[i]) < ttl then
+        redis.call('expire', KEYS[i], ttl)
+    end
+end
+return 1
+"""
+
+_refresh_pool = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+# In-process tier of the cache decorator; holds JSON so callers can't mutate cached values
+_l1_cache = LRUCache(max_entries=CACHE_L1_MAX_ENTRIES)
+_invalidation_listener = None
+_invalidation_lock = threading.Lock()
 
 
 def get_redis_client():
@@ -25,30 +128,277 @@ def get_redis_client():
             logger.warning("Redis URL not configured")
             return None
             
-        _redis_client = redis.from_url(redis_url, decode_responses=True)
+        _redis_client = redis.Redis(connection_pool=_connection_pool(redis.BlockingConnectionPool, decode_responses=True))
     
     return _redis_client
 
 
-def cache(ttl: int = 300):
+def get_binary_redis_client():
     """
-    Decorator for caching function results in Redis
-    
+    Get or create a Redis client that returns raw bytes
+
+    Reads of codec-encoded values (see utils.codec) go through this client;
+    they are written with either client, since only replies are decoded.
+
+    Returns:
+        redis.Redis: The Redis client, or None if Redis isn't configured
+    """
+    global _binary_redis_client
+
+    if _binary_redis_client is None:
+        redis_url = current_app.config.get('REDIS_URL')
+        if not redis_url:
+            return None
+
+        _binary_redis_client = redis.Redis(connection_pool=_connection_pool(redis.BlockingConnectionPool))
+
+    return _binary_redis_client
+
+
+def get_async_redis_client(binary: bool = False):
+    """
+    Get the asyncio Redis client for the running event loop
+
+    Use this instead of get_redis_client() in coroutines, which would block
+    every other coroutine on the loop for each round-trip. Each loop gets
+    its own client and connection pool, tuned like the synchronous ones.
+
     Args:
-        ttl (int): Time to live in seconds (default: 300s / 5min)
+        binary (bool): Return raw bytes, for codec-encoded values
+
+    Returns:
+        redis.asyncio.Redis: The client, or None if Redis isn't configured
+    """
+    clients = _loop_clients(binary)
+    return clients[0] if clients else None
+
+
+def get_auto_pipeline(binary: bool = False) -> Optional["AutoPipeline"]:
+    """
+    Get the auto-pipeline of the running event loop's Redis client
+
+    Returns:
+        AutoPipeline: The pipeline, or None if Redis isn't configured
+    """
+    clients = _loop_clients(binary)
+    return clients[1] if clients else None
+
+
+def _loop_clients(binary: bool):
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if binary not in clients:
+            redis_url = current_app.config.get('REDIS_URL')
+            if not redis_url:
+                return None
+            pool = _connection_pool(redis.asyncio.BlockingConnectionPool, decode_responses=not binary)
+            client = redis.asyncio.Redis(connection_pool=pool)
+            clients[binary] = (client, AutoPipeline(client))
+        return clients[binary]
+
+
+def _connection_pool(pool_class, **kwargs):
+    """A connection pool for the app's REDIS_URL, tuned from its config"""
+    config = current_app.config
+    return pool_class.from_url(
+        config.get('REDIS_URL'),
+        max_connections=config.get('REDIS_MAX_CONNECTIONS', REDIS_MAX_CONNECTIONS),
+        timeout=config.get('REDIS_POOL_TIMEOUT', REDIS_POOL_TIMEOUT),
+        socket_timeout=config.get('REDIS_SOCKET_TIMEOUT', REDIS_SOCKET_TIMEOUT),
+        socket_connect_timeout=config.get('REDIS_SOCKET_CONNECT_TIMEOUT', REDIS_SOCKET_CONNECT_TIMEOUT),
+        health_check_interval=config.get('REDIS_HEALTH_CHECK_INTERVAL', REDIS_HEALTH_CHECK_INTERVAL),
+        socket_keepalive=True,
+        retry_on_timeout=True,
+        **kwargs
+    )
+
+
+class AutoPipeline:
+    """
+    Batches commands issued by concurrent coroutines into pipelines
+
+    Commands sent during one pass of the event loop are queued and flushed
+    together as a single non-transactional pipeline on the next pass, so a
+    burst of coroutines each doing a GET costs one round-trip instead of
+    one each. Every caller gets its own command's reply or error.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+
+    async def execute_command(self, *args) -> Any:
+        """Queue a command (e.g. "GET", key) for the next flush and await its reply"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((args, future))
+        if len(self._pending) == 1:
+            loop.call_soon(lambda: loop.create_task(self._flush()))
+        return await future
+
+    async def _flush(self):
+        batch, self._pending = self._pending, []
+        metrics.observe("redis.auto_pipeline.batch_size", len(batch))
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for args, _ in batch:
+                pipe.execute_command(*args)
+            replies = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            replies = [e] * len(batch)
+        for (_, future), reply in zip(batch, replies):
+            if future.done():
+                # The caller was cancelled
+                continue
+            if isinstance(reply, Exception):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+
+
+def get_redis_pool_stats() -> List[Dict[str, Any]]:
+    """
+    Get connection usage for every Redis pool in this process
+
+    Returns:
+        List[dict]: One entry per pool with its size limit and connections
+                    created and in use
+    """
+    pools = []
+    for name, client in (("sync", _redis_client), ("sync_binary", _binary_redis_client)):
+        if client is not None:
+            pools.append((name, client.connection_pool))
+    with _async_clients_lock:
+        for loop_clients in list(_async_clients.values()):
+            for binary, (client, _) in loop_clients.items():
+                pools.append(("async_binary" if binary else "async", client.connection_pool))
+
+    stats = []
+    for name, pool in pools:
+        if isinstance(pool, redis.BlockingConnectionPool):
+            created = len(pool._connections)
+            idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+            in_use = created - idle
+        else:
+            in_use = len(pool._in_use_connections)
+            created = in_use + len(pool._available_connections)
+        stats.append({
+            "pool": name,
+            "max_connections": pool.max_connections,
+            "created": created,
+            "in_use": in_use,
+        })
+    return stats
+
+
+def cache(
+    ttl: Optional[int] = None,
+    namespace: str = "default",
+    local: Optional[bool] = None,
+    stale_ttl: int = 0,
+    early_expiration: float = CACHE_XFETCH_BETA,
+    tags=None,
+):
+    """
+    Decorator for caching function results in Redis, optionally fronted by
+    a per-worker in-process tier
+
+    Reads check the in-process L1 first, then Redis (L2), and fill L1 from
+    L2 hits. L1 entries are dropped on every worker when invalidate_cache
+    broadcasts a matching pattern, and expire after the namespace's short
+    L1 TTL in case a broadcast is missed.
+
+    Expiry is protected against stampedes: on a miss only the caller that
+    takes the key's recompute lock runs the function while the others wait
+    for its result. Entries are also refreshed early with a probability
+    that rises as expiry nears and with how long the function takes
+    (XFetch). With stale_ttl, an expired entry keeps being served for that
+    long while one worker refreshes it in the background.
+
+    Entries can be registered under dependency tags, e.g.
+    tags=["prompt:{prompt_id}"], and dropped with invalidate_tags("prompt:42")
+    without scanning the keyspace.
+
+    If Redis can't be reached the function is called directly and its
+    result isn't cached.
+
+    Args:
+        ttl (int): Redis TTL in seconds (default: the namespace's, 300s / 5min
+                   for the default namespace)
+        namespace (str): TTL tier from CACHE_NAMESPACE_TTLS, e.g. "user",
+                         "prompt" or "leaderboard"; also labels hit/miss metrics
+        local (bool): Force the in-process tier on or off (default: on when
+                      the namespace has an L1 TTL)
+        stale_ttl (int): Seconds an expired value may still be served while
+                         it is refreshed in the background (0 disables)
+        early_expiration (float): XFetch beta; higher refreshes earlier, 0 disables
+        tags: Tag templates formatted with the function's arguments by name,
+              or a callable taking the function's arguments and returning tags
         
     Returns:
         Callable: Decorated function
     """
+    if namespace not in CACHE_NAMESPACE_TTLS:
+        raise ValueError(f"Unknown cache namespace: {namespace}")
+    l1_ttl, l2_ttl = CACHE_NAMESPACE_TTLS[namespace]
+    l2_ttl = ttl if ttl is not None else l2_ttl
+    if local is None:
+        local = l1_ttl > 0
+    elif local and not l1_ttl:
+        # Forced on for a namespace without an L1 tier: stay well inside the Redis TTL
+        l1_ttl = min(5, l2_ttl)
+
     def decorator(func):
+        entry_tags = _tag_resolver(func, tags)
+
+        def compute(client, cache_key, key_tags, args, kwargs):
+            """Run the function and store its result with how long it took"""
+            started = time.monotonic()
+            result = func(*args, **kwargs)
+            delta = time.monotonic() - started
+            metrics.increment("cache.recomputes", namespace=namespace)
+            try:
+                # Only cache if result is JSON serializable
+                value = json.dumps(result)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Failed to cache result: {e}")
+                return result
+            entry = codec.encode({_ENTRY_MARKER: 1, "value": result, "delta": delta, "expires_at": time.time() + l2_ttl})
+            try:
+                if key_tags:
+                    client.eval(
+                        _STORE_TAGGED_SCRIPT, 1 + len(key_tags), cache_key,
+                        *[_tag_key(tag) for tag in key_tags], l2_ttl + stale_ttl, entry
+                    )
+                else:
+                    client.setex(cache_key, l2_ttl + stale_ttl, entry)
+            except redis.RedisError as e:
+                # The result is still good; it just isn't cached this time
+                _redis_unavailable(cache_key, namespace, e)
+                return result
+            if local:
+                _l1_cache.set(cache_key, value, ttl=l1_ttl)
+            return result
+
+        def refresh(client, cache_key, key_tags, args, kwargs):
+            """Recompute under the key's lock; False if another caller holds it"""
+            try:
+                token = _acquire_recompute_lock(client, cache_key)
+            except redis.RedisError as e:
+                # Keep serving the current entry; a later read will retry
+                _redis_unavailable(cache_key, namespace, e)
+                return False
+            if token is None:
+                return False
+            try:
+                compute(client, cache_key, key_tags, args, kwargs)
+            finally:
+                _release_recompute_lock(client, cache_key, token)
+            return True
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Get Redis client
-            client = get_redis_client()
-            if not client:
-                # If no client available, just call the original function
-                return func(*args, **kwargs)
-                
             # Generate a cache key from function name and arguments
             key_parts = [func.__name__]
             # Add positional args to key
@@ -56,49 +406,454 @@ def cache(ttl: int = 300):
             # Add keyword args to key
             key_parts.extend([f"{k}:{v}" for k, v in sorted(kwargs.items())])
             cache_key = f"cache:{':'.join(key_parts)}"
-            
-            # Try to get from cache
-            cached_data = client.get(cache_key)
-            if cached_data:
-                try:
+
+            if local:
+                cached_data = _l1_cache.get(cache_key)
+                if cached_data is not None:
+                    metrics.increment("cache.hits", tier="l1", namespace=namespace)
                     return json.loads(cached_data)
-                except (json.JSONDecodeError, TypeError):
-                    # If cached data can't be decoded, log and proceed without cache
-                    logger.warning(f"Failed to decode cached data for key: {cache_key}")
-            
-            # Execute the function and cache the result
-            result = func(*args, **kwargs)
+                metrics.increment("cache.misses", tier="l1", namespace=namespace)
+
+            # Get Redis client
+            client = get_redis_client()
+            if not client:
+                # If no client available, just call the original function
+                return func(*args, **kwargs)
+            if local:
+                _ensure_invalidation_listener()
+            key_tags = entry_tags(args, kwargs)
+            # Entries are codec-encoded bytes
+            reader = get_binary_redis_client()
             
+            # Try to get from cache; if Redis is down, run the function uncached
             try:
-                # Only cache if result is JSON serializable
-                client.setex(cache_key, ttl, json.dumps(result))
-            except (TypeError, ValueError) as e:
-                logger.warning(f"Failed to cache result: {e}")
-                
-            return result
+                entry = _decode_entry(reader.get(cache_key), cache_key)
+            except redis.RedisError as e:
+                _redis_unavailable(cache_key, namespace, e)
+                return func(*args, **kwargs)
+            if entry is not None:
+                value, delta, expires_at = entry
+                now = time.time()
+                if now >= expires_at:
+                    # Inside the stale window: serve the old value while one worker refreshes
+                    metrics.increment("cache.stale_served", namespace=namespace)
+                    _refresh_in_background(refresh, client, cache_key, key_tags, args, kwargs)
+                elif early_expiration and now - delta * early_expiration * math.log(1 - random.random()) >= expires_at:
+                    # XFetch: refresh ahead of expiry so it never lapses for everyone at once
+                    metrics.increment("cache.early_refreshes", namespace=namespace)
+                    if stale_ttl:
+                        _refresh_in_background(refresh, client, cache_key, key_tags, args, kwargs)
+                    else:
+                        refresh(client, cache_key, key_tags, args, kwargs)
+                metrics.increment("cache.hits", tier="l2", namespace=namespace)
+                if local and now < expires_at:
+                    _l1_cache.set(cache_key, json.dumps(value), ttl=min(l1_ttl, expires_at - now))
+                return value
+            metrics.increment("cache.misses", tier="l2", namespace=namespace)
+
+            # Only one caller recomputes a missing key; the rest wait for its result
+            try:
+                token = _acquire_recompute_lock(client, cache_key)
+            except redis.RedisError as e:
+                _redis_unavailable(cache_key, namespace, e)
+                return func(*args, **kwargs)
+            if token is not None:
+                try:
+                    return compute(client, cache_key, key_tags, args, kwargs)
+                finally:
+                    _release_recompute_lock(client, cache_key, token)
+
+            metrics.increment("cache.lock_waits", namespace=namespace)
+            deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(CACHE_LOCK_POLL_INTERVAL)
+                try:
+                    entry = _decode_entry(reader.get(cache_key), cache_key)
+                    if entry is not None:
+                        return entry[0]
+                    if not client.exists(_lock_key(cache_key)):
+                        # The holder finished without caching (or died); stop waiting
+                        break
+                except redis.RedisError as e:
+                    _redis_unavailable(cache_key, namespace, e)
+                    break
+            return compute(client, cache_key, key_tags, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def _redis_unavailable(cache_key: str, namespace: str, error: Exception):
+    """Record a cache operation skipped because Redis failed"""
+    logger.warning(f"Redis unavailable for {cache_key}, bypassing cache: {error}")
+    metrics.increment("cache.redis_errors", namespace=namespace)
+
+
+def _tag_resolver(func: Callable, tags) -> Callable:
+    """Build a function mapping a call's (args, kwargs) to its entry's tags"""
+    if not tags:
+        return lambda args, kwargs: []
+    if callable(tags):
+        return lambda args, kwargs: list(tags(*args, **kwargs))
+    signature = inspect.signature(func)
+
+    def resolve(args, kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return [tag.format(**bound.arguments) for tag in tags]
+    return resolve
+
+
+def _tag_key(tag: str) -> str:
+    # The braces keep a tag's set and its claimed copy in one cluster slot
+    return f"cache_tag:{{{tag}}}"
+
+
+def _decode_entry(cached_data, cache_key: str):
+    """(value, compute seconds, logical expiry) of a Redis entry, or None on a miss"""
+    if not cached_data:
+        return None
+    try:
+        entry = codec.decode(cached_data)
+    except CodecError:
+        # If cached data can't be decoded, log and proceed without cache
+        logger.warning(f"Failed to decode cached data for key: {cache_key}")
+        return None
+    if isinstance(entry, dict) and entry.get(_ENTRY_MARKER) == 1:
+        return entry["value"], entry["delta"], entry["expires_at"]
+    # Written before entries carried metadata: treat as fresh
+    return entry, 0.0, float("inf")
+
+
+def _lock_key(cache_key: str) -> str:
+    return f"lock:{cache_key}"
+
+
+def _acquire_recompute_lock(client, cache_key: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    if client.set(_lock_key(cache_key), token, nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000)):
+        return token
+    return None
+
+
+def _release_recompute_lock(client, cache_key: str, token: str):
+    try:
+        # Only delete the lock if it is still ours (it may have expired and been retaken)
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(cache_key), token)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release cache lock for {cache_key}: {e}")
+
+
+def _refresh_in_background(refresh: Callable, client, cache_key: str, key_tags: List[str], args, kwargs):
+    """Refresh an entry on the shared pool, inside the caller's app context if any"""
+    with _refresh_lock:
+        # One queued refresh per key per worker; the Redis lock dedupes across workers
+        if cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def run():
+        try:
+            if app is None:
+                refresh(client, cache_key, key_tags, args, kwargs)
+            else:
+                with app.app_context():
+                    refresh(client, cache_key, key_tags, args, kwargs)
+        except Exception as e:
+            logger.warning(f"Background refresh of {cache_key} failed: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(cache_key)
+
+    _refresh_pool.submit(run)
+
+
+class _UncacheableResponse(Exception):
+    """Carries a response that must not be cached (errors, streams) past the cache layer"""
+
+    def __init__(self, response):
+        super().__init__("uncacheable response")
+        self.response = response
+
+
+def cache_response(
+    ttl: Optional[int] = None,
+    namespace: str = "default",
+    query_args: Optional[List[str]] = None,
+    headers: Tuple[str, ...] = (),
+    per_user: bool = True,
+    tags: Tuple[str, ...] = (),
+):
+    """
+    Decorator for caching whole Flask GET responses
+
+    The key is built from the route's path, the selected query arguments
+    and request headers and (with per_user) the authenticated user, so
+    place it below any authentication decorator. Status, headers and body
+    bytes of 200 responses are stored through @cache, so the namespace's
+    in-process tier and stampede protection apply. Responses carry an
+    ETag, and a matching If-None-Match gets an empty 304. Vary lists the
+    headers the response depends on.
+
+    Cached keys look like "cache:response:<view name>:<path>?<args>|...".
+    Tag templates are formatted with the view and query arguments (missing
+    ones format as ""), so @cache_response(tags=["prompts"]) entries are
+    dropped by invalidate_tags("prompts"). While Redis can't be reached
+    the view runs on every request, as if it weren't decorated.
+
+    Args:
+        ttl (int): Redis TTL in seconds (default: the namespace's)
+        namespace (str): TTL tier from CACHE_NAMESPACE_TTLS
+        query_args (list): Query arguments that select a variant (default: all)
+        headers (tuple): Request headers that select a variant
+        per_user (bool): Keep a separate entry per authenticated user
+        tags (tuple): Tag templates to register entries under
+
+    Returns:
+        Callable: Decorated view function
+    """
+    vary = list(headers) + (["Authorization"] if per_user else [])
+
+    def decorator(view):
+        def render(variant):
+            response = current_app.make_response(view(**(request.view_args or {})))
+            if response.status_code != 200 or response.is_streamed:
+                raise _UncacheableResponse(response)
+            body = response.get_data()
+            return {
+                "status": response.status_code,
+                "headers": [[name, value] for name, value in response.headers.items()
+                            if name.lower() not in ("content-length", "set-cookie")],
+                "body": base64.b64encode(body).decode("ascii"),
+                "etag": hashlib.sha1(body).hexdigest(),
+            }
+        # @cache keys on the function name and arguments
+        render.__name__ = f"response:{view.__name__}"
+        cached_render = cache(
+            ttl=ttl, namespace=namespace, stale_ttl=0, tags=lambda variant: _response_tags(tags)
+        )(render)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            try:
+                cached = cached_render(_response_variant(query_args, headers, per_user))
+            except _UncacheableResponse as e:
+                return e.response
+
+            response_headers = [(name, value) for name, value in cached["headers"]]
+            if request.if_none_match.contains(cached["etag"]):
+                metrics.increment("cache.not_modified", namespace=namespace)
+                response = Response(status=304)
+            else:
+                response = Response(base64.b64decode(cached["body"]), status=cached["status"], headers=response_headers)
+            response.set_etag(cached["etag"])
+            # Clients may keep the body but must revalidate it (cheaply, via the ETag)
+            response.headers["Cache-Control"] = "private, no-cache" if per_user else "no-cache"
+            for header in vary:
+                response.vary.add(header)
+            return response
         return wrapper
     return decorator
 
 
+class _TagArguments(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def _response_tags(tags: Tuple[str, ...]) -> List[str]:
+    """Format response cache tag templates with this request's view and query arguments"""
+    if not tags:
+        return []
+    arguments = _TagArguments(request.args.to_dict())
+    arguments.update(request.view_args or {})
+    return [tag.format_map(arguments) for tag in tags]
+
+
+def _response_variant(query_args: Optional[List[str]], headers: Tuple[str, ...], per_user: bool) -> str:
+    """The part of a response cache key that identifies this request's variant"""
+    if query_args is None:
+        selected = sorted(request.args.items(multi=True))
+    else:
+        selected = sorted((name, value) for name in query_args for value in request.args.getlist(name))
+    variant = f"{request.path}?{urlencode(selected)}"
+    for header in headers:
+        variant += f"|{header.lower()}={request.headers.get(header, '')}"
+    if per_user:
+        user = g.get("user")
+        variant += f"|user={user.id if user is not None else 'anonymous'}"
+    if len(variant) > 512:
+        # Keep keys bounded; the view name prefix still allows invalidation
+        variant = hashlib.sha1(variant.encode("utf-8")).hexdigest()
+    return variant
+
+
 def invalidate_cache(pattern: str = None):
     """
     Invalidate cache entries matching the given pattern
     
+    Matching Redis keys are found with SCAN and unlinked in batches, so
+    Redis isn't blocked the way a KEYS call would block it, and the pattern
+    is broadcast so every worker drops matching entries from its in-process
+    tier. Prefer invalidate_tags for entries with known dependencies: it
+    only touches the tagged keys.
+    
     Args:
         pattern (str, optional): Pattern to match (e.g., "cache:get_user:*")
                                 If None, does nothing
     """
     if not pattern:
         return
+
+    _invalidate_local(pattern)
         
     client = get_redis_client()
     if not client:
         return
         
-    keys = client.keys(pattern)
-    if keys:
-        client.delete(*keys)
-        logger.info(f"Invalidated {len(keys)} cache entries matching: {pattern}")
+    removed = 0
+    batch = []
+    for key in client.scan_iter(match=pattern, count=CACHE_INVALIDATION_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= CACHE_INVALIDATION_BATCH_SIZE:
+            removed += client.unlink(*batch)
+            batch = []
+    if batch:
+        removed += client.unlink(*batch)
+    if removed:
+        logger.info(f"Invalidated {removed} cache entries matching: {pattern}")
+    RedisPubSub.publish(CACHE_INVALIDATION_CHANNEL, {'pattern': pattern})
+
+
+def invalidate_tags(*tags: str):
+    """
+    Invalidate every cache entry registered under any of the given tags
+
+    Each tag's set of keys is first renamed out of the way, so entries
+    cached while the invalidation runs register in a fresh set, then its
+    members are read with SSCAN and unlinked in batches. Each batch of keys
+    is broadcast so every worker drops them from its in-process tier.
+
+    Redis errors are logged rather than raised: the write that triggered the
+    invalidation has already happened, and the entries' TTLs bound how long
+    they stay stale.
+
+    Args:
+        *tags (str): Tags such as "prompt:42" or "user:7"
+    """
+    client = get_redis_client()
+    if not client:
+        return
+
+    for tag in tags:
+        try:
+            _invalidate_tag(client, tag)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate cache tag {tag}: {e}")
+            metrics.increment("cache.tag_invalidation_errors")
+
+
+def _invalidate_tag(client, tag: str):
+    tag_key = _tag_key(tag)
+    claimed = f"{tag_key}:invalidating:{uuid.uuid4().hex}"
+    try:
+        client.rename(tag_key, claimed)
+    except redis.ResponseError:
+        # No such key: nothing is cached under this tag
+        return
+    removed = 0
+    batch = []
+    for key in client.sscan_iter(claimed, count=CACHE_INVALIDATION_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= CACHE_INVALIDATION_BATCH_SIZE:
+            removed += _unlink_keys(client, batch)
+            batch = []
+    if batch:
+        removed += _unlink_keys(client, batch)
+    client.unlink(claimed)
+    metrics.increment("cache.tag_invalidations")
+    logger.info(f"Invalidated {removed} cache entries tagged: {tag}")
+
+
+def _unlink_keys(client, keys: List[str]) -> int:
+    """Delete cache keys in Redis and in every worker's in-process tier"""
+    for key in keys:
+        _l1_cache.delete(key)
+    removed = client.unlink(*keys)
+    RedisPubSub.publish(CACHE_INVALIDATION_CHANNEL, {'keys': keys})
+    return removed
+
+
+def invalidates(*tags: str):
+    """
+    Decorator invalidating cache tags after a view succeeds
+
+    Tags are formatted with the route's view arguments, e.g.
+    @invalidates("prompt:{prompt_id}", "prompts"). Nothing is invalidated
+    when the view returns an error status.
+
+    Args:
+        *tags (str): Tag templates
+
+    Returns:
+        Callable: Decorated view function
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code < 400:
+                invalidate_tags(*[tag.format(**(request.view_args or {})) for tag in tags])
+            return response
+        return wrapper
+    return decorator
+
+
+def _invalidate_local(pattern: str) -> int:
+    """Drop in-process cache entries whose key matches a Redis-style glob"""
+    removed = 0
+    for key in _l1_cache.keys():
+        if fnmatch.fnmatchcase(key, pattern) and _l1_cache.delete(key):
+            removed += 1
+    return removed
+
+
+def _on_invalidation(channel: str, message: dict):
+    if not isinstance(message, dict):
+        return
+    removed = 0
+    if message.get('pattern'):
+        removed += _invalidate_local(message['pattern'])
+    for key in message.get('keys') or ():
+        removed += _l1_cache.delete(key)
+    metrics.increment("cache.l1_invalidations", removed)
+
+
+def _listen_for_invalidations():
+    """Apply invalidations broadcast by other workers, resubscribing if the connection drops"""
+    while True:
+        try:
+            RedisPubSub.subscribe([CACHE_INVALIDATION_CHANNEL], _on_invalidation)
+        except Exception as e:
+            logger.warning(f"Cache invalidation subscription failed: {e}")
+        # Invalidations published while we weren't subscribed were missed
+        _l1_cache.clear()
+        time.sleep(CACHE_INVALIDATION_RETRY_INTERVAL)
+
+
+def _ensure_invalidation_listener():
+    """Start this worker's invalidation subscriber the first time L1 is used with Redis"""
+    global _invalidation_listener
+    if _invalidation_listener is not None:
+        return
+    with _invalidation_lock:
+        if _invalidation_listener is None:
+            _invalidation_listener = threading.Thread(
+                target=_listen_for_invalidations, name="cache-invalidation", daemon=True
+            )
+            _invalidation_listener.start()
 
 
 class RedisPubSub:
@@ -126,7 +881,21 @@ class RedisPubSub:
         except (TypeError, ValueError) as e:
             logger.error(f"Failed to publish message: {e}")
             return 0
-    
+
+    @staticmethod
+    async def apublish(channel: str, message: Any):
+        """publish() for coroutines, sent through the event loop's auto-pipeline"""
+        pipeline = get_auto_pipeline()
+        if pipeline is None:
+            return 0
+
+        try:
+            payload = json.dumps(message)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Failed to publish message: {e}")
+            return 0
+        return await pipeline.execute_command("PUBLISH", channel, payload)
+
     @staticmethod
     def subscribe(channels: List[str], callback: Callable[[str, dict], None]):
         """
@@ -149,8 +918,10 @@ class RedisPubSub:
         
         logger.info(f"Subscribed to Redis channels: {channels}")
         
-        for message in pubsub.listen():
-            if message['type'] == 'message':
+        while True:
+            # Wait in short polls: a blocking read would hit the pool's socket timeout on quiet channels
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message and message['type'] == 'message':
                 channel = message['channel']
                 try:
                     data = json.loads(message['data'])
@@ -0,0 +1,211 @@
+import fcntl
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from .metrics import metrics
+
+# Written at the start of every segment; bump the digit if the framing changes
+SEGMENT_MAGIC = b"KSP1"
+
+# Each record is framed as (payload length, CRC32 of the payload), big-endian
+_FRAME = struct.Struct(">II")
+
+
+class Spool:
+    """
+    Append-only on-disk queue of records, in rotated segment files
+
+    Records are appended to the newest segment (numbered files in the
+    directory) with a length and CRC32 in front, so a write torn by a crash
+    is detected and skipped on replay. Segments rotate at segment_bytes.
+    Once the spool would exceed max_bytes, whole segments are evicted
+    oldest first, so an outage keeps the most recent records.
+
+    Workers may share a directory: appends are serialized with a file lock,
+    and only one worker replays at a time. Replay seals the newest segment
+    first, hands records to the caller in order and deletes each segment
+    once all of it was accepted. Where a replay stopped is saved, so a
+    record may be delivered twice after a crash but never skipped.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str = "spool",
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False
+    ):
+        self.directory = directory
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+
+    def append(self, record: bytes):
+        """Write a record to the newest segment, evicting old segments if over max_bytes"""
+        frame = _FRAME.pack(len(record), zlib.crc32(record)) + record
+        with self._locked(".write.lock"):
+            segments = self._segments()
+            size = self._size(segments[-1]) if segments else 0
+            if not segments or (size > len(SEGMENT_MAGIC) and size + len(frame) > self.segment_bytes):
+                segments.append(self._create_segment(segments))
+            self._evict(segments, len(frame))
+            fd = os.open(self._path(segments[-1]), os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, frame)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        metrics.increment("spool.appended", spool=self.name)
+
+    def replay(self, handler: Callable[[bytes], bool], limit: Optional[int] = None) -> Tuple[int, bool]:
+        """
+        Hand spooled records to handler, oldest first
+
+        Replay stops at the first record the handler returns False for (it
+        is offered again next time) or after limit records.
+
+        Returns:
+            tuple: (records accepted, whether records remain)
+        """
+        with self._locked(".replay.lock", blocking=False) as locked:
+            if not locked:
+                # Another worker is replaying
+                return 0, True
+            with self._locked(".write.lock"):
+                segments = self._segments()
+                if segments and self._size(segments[-1]) > len(SEGMENT_MAGIC):
+                    # Seal the newest segment so appends don't race the read
+                    segments.append(self._create_segment(segments))
+            cursor_segment, cursor_offset = self._read_cursor()
+            replayed = 0
+            for segment in segments[:-1]:
+                offset = cursor_offset if segment == cursor_segment else len(SEGMENT_MAGIC)
+                try:
+                    with open(self._path(segment), "rb") as f:
+                        for record, end in self._frames(f, segment, offset):
+                            if (limit is not None and replayed >= limit) or not handler(record):
+                                self._write_cursor(segment, offset)
+                                return replayed, True
+                            replayed += 1
+                            offset = end
+                except FileNotFoundError:
+                    # Evicted while being read
+                    continue
+                self._remove(segment)
+            self._write_cursor(0, 0)
+            return replayed, False
+
+    def pending(self) -> bool:
+        """Whether any records are waiting to be replayed"""
+        return any(self._size(segment) > len(SEGMENT_MAGIC) for segment in self._segments())
+
+    def size(self) -> int:
+        return sum(self._size(segment) for segment in self._segments())
+
+    def _frames(self, f: BinaryIO, segment: int, offset: int) -> Iterator[Tuple[bytes, int]]:
+        """Yield (record, offset after it) from offset, stopping at the first damaged frame"""
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            self._corrupt(segment, 0, "unknown segment format")
+            return
+        f.seek(offset)
+        while True:
+            header = f.read(_FRAME.size)
+            if not header:
+                return
+            if len(header) < _FRAME.size:
+                self._corrupt(segment, offset, "truncated frame header")
+                return
+            length, checksum = _FRAME.unpack(header)
+            record = f.read(length)
+            if len(record) < length or zlib.crc32(record) != checksum:
+                # The length itself may be garbage, so nothing after this can be trusted
+                self._corrupt(segment, offset, "checksum mismatch")
+                return
+            offset += _FRAME.size + length
+            yield record, offset
+
+    def _corrupt(self, segment: int, offset: int, reason: str):
+        logger.error(f"Spool {self.name} segment {segment} is damaged at byte {offset} ({reason}); skipping the rest of it")
+        metrics.increment("spool.corrupt", spool=self.name)
+
+    def _evict(self, segments: List[int], incoming: int):
+        """Delete the oldest segments (never the newest) until incoming bytes fit"""
+        total = sum(self._size(segment) for segment in segments) + incoming
+        while total > self.max_bytes and len(segments) > 1:
+            segment = segments.pop(0)
+            size = self._size(segment)
+            try:
+                with open(self._path(segment), "rb") as f:
+                    records = sum(1 for _ in self._frames(f, segment, len(SEGMENT_MAGIC)))
+            except FileNotFoundError:
+                records = 0
+            self._remove(segment)
+            total -= size
+            logger.warning(f"Spool {self.name} is over {self.max_bytes} bytes; evicted segment {segment} ({records} records)")
+            metrics.increment("spool.evicted", records, spool=self.name)
+
+    def _create_segment(self, segments: List[int]) -> int:
+        segment = segments[-1] + 1 if segments else 1
+        with open(self._path(segment), "xb") as f:
+            f.write(SEGMENT_MAGIC)
+        return segment
+
+    def _segments(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}.seg")
+
+    def _size(self, segment: int) -> int:
+        try:
+            return os.path.getsize(self._path(segment))
+        except FileNotFoundError:
+            return 0
+
+    def _remove(self, segment: int):
+        try:
+            os.remove(self._path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _read_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, "cursor"), "rb") as f:
+                segment, offset = struct.unpack(">QQ", f.read())
+                return segment, offset
+        except (FileNotFoundError, struct.error):
+            return 0, 0
+
+    def _write_cursor(self, segment: int, offset: int):
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "wb") as f:
+            f.write(struct.pack(">QQ", segment, offset))
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _locked(self, name: str, blocking: bool = True):
+        """Hold an exclusive lock shared with other processes using the directory"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)